@@ -1,18 +1,24 @@
 from argparse import ArgumentParser, Namespace
 from collections import deque
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from enum import Enum, auto
 from functools import partial
 from glob import glob
+from heapq import heappop, heappush
+from io import StringIO
 from math import ceil, floor
-from os import walk
-from os.path import abspath, basename, join, dirname
+from os import makedirs, replace, stat, walk
+from os.path import abspath, basename, join, dirname, isfile, relpath, splitext
 from random import randint, random, shuffle, sample
 from sys import exit
-from typing import Dict, List, Tuple
+from traceback import print_exc
+from typing import Dict, Iterable, List, Tuple
+import json
 
 import matplotlib.pyplot as plt
 from matplotlib.ticker import FixedLocator, MaxNLocator
+import numpy
 
 from utils import dot
 
@@ -118,6 +124,20 @@ def parse_command_line():
                         help='allow tasks to be unstructured',
                         default=False)
 
+    parser.add_argument('-S',
+                        '--samples',
+                        type=int,
+                        help='simulate this many executions of each task with perturbed execution times',
+                        default=1000,
+                        metavar='<INT>')
+
+    parser.add_argument('-J',
+                        '--jobs',
+                        type=int,
+                        help='analyse tasks in this many processes',
+                        default=1,
+                        metavar='<INT>')
+
     return parser.parse_args()
 
 
@@ -137,7 +157,8 @@ class Network:
         self.english_alphabet = True
 
     def add_vertex(self, vertex: int):
-        if vertex not in self.vertices:
+        # The WCETs are keyed by vertex, so they answer membership without searching the vertex list.
+        if vertex not in self.wcets:
             self.vertices.append(vertex)
             self.predecessors[vertex] = set()
             self.successors[vertex] = set()
@@ -412,17 +433,242 @@ class Network:
         return value
 
 
+class ArrayNetwork:
+    """
+    A Network held in arrays, for tasks with very many vertices.  Vertices are numbered by their position in the
+    network's vertex list, and successors and predecessors are kept in CSR form: the successors of vertex i are
+    successor_targets[successor_offsets[i]:successor_offsets[i + 1]].  The vertices are also grouped into levels, each
+    holding the vertices whose predecessors all lie in earlier levels; the levels are worked out once and give the
+    topological order in which whole levels are processed with array operations.
+    """
+
+    def __init__(self,
+                 vertices: numpy.ndarray,
+                 wcets: numpy.ndarray,
+                 sources: numpy.ndarray,
+                 destinations: numpy.ndarray,
+                 english_alphabet: bool):
+        self.vertices = vertices
+        self.wcets = wcets
+        self.english_alphabet = english_alphabet
+        self.successor_offsets, self.successor_targets = ArrayNetwork.compress(len(vertices), sources, destinations)
+        self.predecessor_offsets, self.predecessor_targets = ArrayNetwork.compress(len(vertices), destinations, sources)
+        (self.entry,) = numpy.flatnonzero(numpy.diff(self.predecessor_offsets) == 0).tolist()
+        (self.exit,) = numpy.flatnonzero(numpy.diff(self.successor_offsets) == 0).tolist()
+        self._levels = None
+        self._paths = None
+
+    @staticmethod
+    def compress(number_of_vertices: int,
+                 sources: numpy.ndarray,
+                 destinations: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        offsets = numpy.zeros(number_of_vertices + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(sources, minlength=number_of_vertices), out=offsets[1:])
+        return offsets, destinations[numpy.argsort(sources, kind='stable')]
+
+    @staticmethod
+    def gather(offsets: numpy.ndarray,
+               targets: numpy.ndarray,
+               indices: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        # Returns the targets of the given vertices one after the other, with where those of each vertex start.
+        starts = offsets[indices]
+        counts = offsets[indices + 1] - starts
+        bounds = numpy.zeros(len(indices) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=bounds[1:])
+        positions = numpy.arange(bounds[-1]) + numpy.repeat(starts - bounds[:-1], counts)
+        return targets[positions], bounds
+
+    @classmethod
+    def from_network(cls, network: Network) -> 'ArrayNetwork':
+        index = {vertex: i for i, vertex in enumerate(network.vertices)}
+        sources = []
+        destinations = []
+        for vertex in network.vertices:
+            for successor in network.successors[vertex]:
+                sources.append(index[vertex])
+                destinations.append(index[successor])
+        arrays = cls(numpy.array(network.vertices, dtype=numpy.int64),
+                     numpy.array([network.wcets[vertex] for vertex in network.vertices], dtype=numpy.int64),
+                     numpy.array(sources, dtype=numpy.int64),
+                     numpy.array(destinations, dtype=numpy.int64),
+                     network.english_alphabet)
+        # Predecessors are listed in the order the network iterates them too, so that searches whose choices depend
+        # on that order, like jail_and_free, choose as they do on the network.
+        arrays.predecessor_targets = numpy.array([index[predecessor]
+                                                  for vertex in network.vertices
+                                                  for predecessor in network.predecessors[vertex]],
+                                                 dtype=numpy.int64)
+        return arrays
+
+    def to_network(self) -> Network:
+        # Vertices are distinct and edges join them, so the network is filled in directly rather than through
+        # add_vertex, which searches the vertex list.
+        network = Network()
+        vertices = self.vertices.tolist()
+        network.vertices = vertices
+        network.wcets = dict(zip(vertices, self.wcets.tolist()))
+        network.successors = {vertex: set() for vertex in vertices}
+        network.predecessors = {vertex: set() for vertex in vertices}
+        network.english_alphabet = self.english_alphabet
+        sources = numpy.repeat(self.vertices, numpy.diff(self.successor_offsets)).tolist()
+        destinations = self.vertices[self.successor_targets].tolist()
+        for source, destination in zip(sources, destinations):
+            network.successors[source].add(destination)
+            network.predecessors[destination].add(source)
+        network.entry = vertices[self.entry]
+        network.exit = vertices[self.exit]
+        return network
+
+    @property
+    def levels(self) -> List[numpy.ndarray]:
+        if self._levels is None:
+            self._levels = []
+            unfinished = numpy.diff(self.predecessor_offsets)
+            level = numpy.array([self.entry], dtype=numpy.int64)
+            while level.size:
+                self._levels.append(level)
+                successors, _ = ArrayNetwork.gather(self.successor_offsets, self.successor_targets, level)
+                numpy.subtract.at(unfinished, successors, 1)
+                level = numpy.unique(successors[unfinished[successors] == 0])
+        return self._levels
+
+    def topological_ordering(self) -> List[int]:
+        return self.vertices[numpy.concatenate(self.levels)].tolist()
+
+    def canonicalise(self) -> 'ArrayNetwork':
+        # As Network.canonicalise: a vertex whose only predecessor has no other successor is folded into that
+        # predecessor, so a chain of such vertices folds into the vertex at its head.
+        number_of_vertices = len(self.vertices)
+        in_degrees = numpy.diff(self.predecessor_offsets)
+        out_degrees = numpy.diff(self.successor_offsets)
+        single = in_degrees == 1
+        predecessors = numpy.arange(number_of_vertices)
+        predecessors[single] = self.predecessor_targets[self.predecessor_offsets[:-1][single]]
+        dead = single & (out_degrees[predecessors] == 1)
+
+        heads = numpy.where(dead, predecessors, numpy.arange(number_of_vertices))
+        while True:
+            jumped = heads[heads]
+            if numpy.array_equal(jumped, heads):
+                break
+            heads = jumped
+
+        wcets = numpy.zeros(number_of_vertices, dtype=numpy.int64)
+        numpy.add.at(wcets, heads, self.wcets)
+
+        alive = ~dead
+        renumbered = numpy.cumsum(alive) - 1
+        sources = numpy.repeat(numpy.arange(number_of_vertices), out_degrees)
+        destinations = self.successor_targets
+        kept = alive[destinations]
+        return ArrayNetwork(self.vertices[alive],
+                            wcets[alive],
+                            renumbered[heads[sources[kept]]],
+                            renumbered[destinations[kept]],
+                            self.english_alphabet)
+
+    def get_volume(self) -> int:
+        return int(self.wcets.sum())
+
+    def evaluate_path(self, path: List[int], path_type: Path) -> int:
+        index = {vertex: i for i, vertex in enumerate(self.vertices.tolist())}
+        return sum([int(self.wcets[index[vertex]]) if path_type == Path.HEAVIEST else 1 for vertex in path])
+
+    def find_path(self, path_type: Path) -> List[int]:
+        # Both kinds of path come out of one pass over the levels: column 0 counts vertices and column 1 adds WCETs.
+        if self._paths is None:
+            weights = numpy.stack([numpy.ones_like(self.wcets), self.wcets], axis=1)
+            best = weights.copy()
+            parents = numpy.full(weights.shape, -1, dtype=numpy.int64)
+            for level in self.levels[1:]:
+                predecessors, bounds = ArrayNetwork.gather(self.predecessor_offsets, self.predecessor_targets, level)
+                values = best[predecessors]
+                maxima = numpy.maximum.reduceat(values, bounds[:-1], axis=0)
+                # The first predecessor that reaches the maximum becomes the parent.
+                segments = numpy.repeat(numpy.arange(len(level)), numpy.diff(bounds))
+                positions = numpy.where(values == maxima[segments], numpy.arange(len(predecessors))[:, None], bounds[-1])
+                parents[level] = predecessors[numpy.minimum.reduceat(positions, bounds[:-1], axis=0)]
+                best[level] = weights[level] + maxima
+            self._paths = parents
+
+        column = 0 if path_type == Path.LONGEST else 1
+        path = []
+        vertex = self.exit
+        while vertex != -1:
+            path.append(vertex)
+            vertex = self._paths[vertex, column]
+        return self.vertices[path[::-1]].tolist()
+
+    def jail_and_free(self):
+        # The same search as Network.jail_and_free over integer-indexed lists, returning vertex IDs.
+        successors = self.successor_targets.tolist()
+        successor_offsets = self.successor_offsets.tolist()
+        predecessors = self.predecessor_targets.tolist()
+        predecessor_offsets = self.predecessor_offsets.tolist()
+        number_of_vertices = len(self.vertices)
+        explored = [0] * number_of_vertices
+        parents = {}
+        children = [0] * number_of_vertices
+        levels = [None] * number_of_vertices
+        levels[self.entry] = 0
+        ordering = {0: {self.entry}}
+        articulations = set()
+        joins = set()
+
+        queue = deque([self.entry])
+        while queue:
+            vertex = queue.popleft()
+            in_degree = predecessor_offsets[vertex + 1] - predecessor_offsets[vertex]
+
+            if in_degree > 1:
+                joins.remove(vertex)
+
+            if not queue and not joins:
+                articulations.add(vertex)
+
+            for successor in successors[successor_offsets[vertex]:successor_offsets[vertex + 1]]:
+                explored[successor] += 1
+                successor_predecessors = predecessors[predecessor_offsets[successor]:predecessor_offsets[successor + 1]]
+
+                if len(successor_predecessors) > 1:
+                    joins.add(successor)
+
+                if explored[successor] == len(successor_predecessors):
+                    queue.append(successor)
+                    candidates = [predecessor for predecessor in successor_predecessors
+                                  if levels[predecessor] == levels[vertex]]
+                    candidates.sort(key=lambda vertex: children[vertex], reverse=True)
+                    last = candidates[-1]
+                    parents[successor] = last
+                    children[last] += 1
+                    levels[successor] = levels[last] + 1
+                    ordering.setdefault(levels[successor], set()).add(successor)
+
+        identifiers = self.vertices.tolist()
+        ordering = {level: {identifiers[vertex] for vertex in vertices} for level, vertices in ordering.items()}
+        parents = {identifiers[vertex]: identifiers[parent] for vertex, parent in parents.items()}
+        articulations = {identifiers[vertex] for vertex in articulations}
+        return ordering, parents, articulations
+
+
 class Task:
     def __init__(self):
         self.filename = None
         self.identifier = None
         self.original = Network()
         self.canonical = None
+        self.arrays = None
         self.dead = False
 
     def set_identifier(self, identifier: int):
         self.identifier = identifier
 
+    def basename(self) -> str:
+        # Tasks read from different GML files can share an identifier, so their files go beside the GML file.
+        if self.filename is None:
+            return 'task.{}'.format(self.identifier)
+        return '{}.task.{}'.format(splitext(abspath(self.filename))[0], self.identifier)
+
     def prepare(self):
         self.original.set_entry()
         self.original.set_exit()
@@ -434,7 +680,8 @@ class Task:
                 wcet = randint(generator.min_wcet, generator.max_wcet)
                 self.original.set_wcet(vertex, wcet)
 
-        self.canonical = self.original.canonicalise()
+        self.canonical = ArrayNetwork.from_network(self.original).canonicalise().to_network()
+        self.arrays = ArrayNetwork.from_network(self.canonical)
         if len(self.canonical.vertices) == 1:
             print('Task {} is dead: it only has one vertex in canonical form'.format(self.identifier))
             self.dead = True
@@ -481,10 +728,12 @@ class Execution:
                 self.execution_times[vertex] -= 1
 
     def go(self):
+        # Rather than ticking the clock, jump it to the next time a vertex finishes: nothing else can change the
+        # schedule in between.  Each tick on which a ready vertex waits for a core still counts as one choice.
         ready = [self.task.entry]
         available = [core for core in self.cores]
-        executing = set()
-        while ready or executing:
+        completions = []
+        while ready or completions:
             if self.number_of_cores == 0 and len(ready) > len(available):
                 core_id = len(self.cores) - 1
                 needed = len(ready) - len(available)
@@ -500,25 +749,23 @@ class Execution:
                 core = available.pop()
                 vertex = ready.pop()
                 core.set_vertex(vertex, self.clock)
-                executing.add(vertex)
+                heappush(completions, (self.clock + self.execution_times[vertex], core.identifier, core))
 
+            finish = completions[0][0]
             if ready and len(self.cores) > 1:
-                self.choices += 1
+                self.choices += finish - self.clock
 
-            self.clock += 1
+            self.clock = finish
             changed = False
-            for core in self.cores:
-                #core.execute(self.clock)
-                if core.vertex is not None:
-                    if self.clock - core.start_times[core.vertex] == self.execution_times[core.vertex]:
-                        available.append(core)
-                        executing.remove(core.vertex)
-                        for successor in self.task.successors[core.vertex]:
-                            self.jailed[successor] += 1
-                            if self.jailed[successor] == len(self.task.predecessors[successor]):
-                                ready.append(successor)
-                                changed = True
-                        core.vertex = None
+            while completions and completions[0][0] == finish:
+                _, _, core = heappop(completions)
+                available.append(core)
+                for successor in self.task.successors[core.vertex]:
+                    self.jailed[successor] += 1
+                    if self.jailed[successor] == len(self.task.predecessors[successor]):
+                        ready.append(successor)
+                        changed = True
+                core.vertex = None
 
             if changed:
                 shuffle(ready)
@@ -539,6 +786,96 @@ class Execution:
         return value
 
 
+class MonteCarlo:
+    """
+    Simulates many executions of a task at once.  Each sample is an Execution without WCETs: one vertex runs for a
+    tick less than its WCET, and whenever a core is free it takes a ready vertex chosen uniformly at random.  The
+    samples of a chunk advance together from one completion to the next.  Each sample keeps its ready vertices in a
+    stack and each core the vertex it runs, so a step costs array operations over cores and samples plus the edges of
+    the vertices that finish, never a pass over every vertex.
+    """
+
+    CHUNK = 1024
+    # Bounds the number of entries in the vertex-by-sample arrays of a chunk, so that large tasks get smaller chunks.
+    ENTRIES = 2 ** 24
+
+    def __init__(self, network: ArrayNetwork):
+        self.network = network
+        self.vertices = network.vertices
+        self.wcets = network.wcets
+        self.predecessors = numpy.diff(network.predecessor_offsets).astype(numpy.int32)
+
+    def sample_shortened(self, samples: int, rng: numpy.random.Generator) -> numpy.ndarray:
+        # Picks the vertex of each sample that runs for a tick less than its WCET, or -1 if none can.
+        (candidates,) = numpy.nonzero(self.wcets > 1)
+        if candidates.size:
+            return candidates[rng.integers(candidates.size, size=samples)]
+        return numpy.full(samples, -1, dtype=numpy.int64)
+
+    @staticmethod
+    def rank(groups: numpy.ndarray) -> numpy.ndarray:
+        # The position of each entry among the entries of its group, for groups in sorted order.
+        return numpy.arange(len(groups)) - numpy.searchsorted(groups, groups)
+
+    def go(self, number_of_cores: int, samples: int, rng: numpy.random.Generator) -> numpy.ndarray:
+        # Samples are simulated a chunk at a time so that memory stays bounded however many are asked for.
+        chunk = max(1, min(MonteCarlo.CHUNK, MonteCarlo.ENTRIES // len(self.vertices)))
+        chunks = [self.go_chunk(number_of_cores, min(chunk, samples - start), rng)
+                  for start in range(0, samples, chunk)]
+        return numpy.concatenate(chunks) if chunks else numpy.zeros(0, dtype=numpy.int64)
+
+    def go_chunk(self, number_of_cores: int, samples: int, rng: numpy.random.Generator) -> numpy.ndarray:
+        number_of_vertices = len(self.vertices)
+        shortened = self.sample_shortened(samples, rng)
+        idle = numpy.iinfo(numpy.int64).max
+        clock = numpy.zeros(samples, dtype=numpy.int64)
+        unfinished = numpy.repeat(self.predecessors[:, None], samples, axis=1)
+        ready = numpy.empty((samples, number_of_vertices), dtype=numpy.int32)
+        ready[:, 0] = self.network.entry
+        number_ready = numpy.ones(samples, dtype=numpy.int64)
+        # Each core runs a vertex until its finish time, and the idle cores of each sample are stacked.
+        finish = numpy.full((number_of_cores, samples), idle, dtype=numpy.int64)
+        running = numpy.zeros((number_of_cores, samples), dtype=numpy.int64)
+        idle_cores = numpy.repeat(numpy.arange(number_of_cores)[:, None], samples, axis=1)
+        free = numpy.full(samples, number_of_cores, dtype=numpy.int64)
+        while True:
+            while True:
+                (starting,) = numpy.nonzero((free > 0) & (number_ready > 0))
+                if not starting.size:
+                    break
+                picks = (rng.random(starting.size) * number_ready[starting]).astype(numpy.int64)
+                vertices = ready[starting, picks].astype(numpy.int64)
+                ready[starting, picks] = ready[starting, number_ready[starting] - 1]
+                number_ready[starting] -= 1
+                free[starting] -= 1
+                cores = idle_cores[free[starting], starting]
+                running[cores, starting] = vertices
+                finish[cores, starting] = clock[starting] + self.wcets[vertices] - (vertices == shortened[starting])
+
+            following = finish.min(axis=0)
+            active = following != idle
+            if not active.any():
+                return clock
+
+            clock = numpy.where(active, following, clock)
+            finished_samples, finished_cores = numpy.nonzero((finish == clock).T)
+            vertices = running[finished_cores, finished_samples]
+            finish[finished_cores, finished_samples] = idle
+            idle_cores[free[finished_samples] + MonteCarlo.rank(finished_samples), finished_samples] = finished_cores
+            free += numpy.bincount(finished_samples, minlength=samples)
+
+            successors, bounds = ArrayNetwork.gather(self.network.successor_offsets,
+                                                     self.network.successor_targets,
+                                                     vertices)
+            owners = numpy.repeat(finished_samples, numpy.diff(bounds))
+            numpy.subtract.at(unfinished, (successors, owners), 1)
+            # A vertex whose last predecessors finish together appears once for each of them.
+            released = numpy.unique((owners * number_of_vertices + successors)[unfinished[successors, owners] == 0])
+            owners, successors = numpy.divmod(released, number_of_vertices)
+            ready[owners, number_ready[owners] + MonteCarlo.rank(owners)] = successors
+            number_ready += numpy.bincount(owners, minlength=samples)
+
+
 class Region:
     def __init__(self, vertices: List[int]):
         assert len(vertices) >= 3
@@ -718,17 +1055,17 @@ class TaskGenerator:
                 self.task.original.add_edge(self.task.original.entry, self.task.original.exit)
 
 
-def analyse(task: Task, number_of_cores: int):
-    longest_path = task.canonical.find_path(Path.LONGEST)
-    longest = task.canonical.evaluate_path(longest_path, Path.LONGEST)
-    heaviest_path = task.canonical.find_path(Path.HEAVIEST)
-    heaviest = task.canonical.evaluate_path(heaviest_path, Path.HEAVIEST)
-    volume = task.canonical.get_volume()
+def analyse(task: Task, number_of_cores: int, samples: int):
+    longest_path = task.arrays.find_path(Path.LONGEST)
+    longest = task.arrays.evaluate_path(longest_path, Path.LONGEST)
+    heaviest_path = task.arrays.find_path(Path.HEAVIEST)
+    heaviest = task.arrays.evaluate_path(heaviest_path, Path.HEAVIEST)
+    volume = task.arrays.get_volume()
     worst = Execution(task.canonical, number_of_cores, True)
     worst.go()
     assert worst.choices == 0
 
-    task.canonical.dotify('task.{}.canonical'.format(task.identifier))
+    task.canonical.dotify('{}.canonical'.format(task.basename()))
 
     graham = ceil(heaviest + (volume - heaviest) / number_of_cores)
     proportion = floor(100 * worst.clock / graham)
@@ -752,20 +1089,24 @@ def analyse(task: Task, number_of_cores: int):
     else:
         print('Diff: {} > {}'.format(number_of_cores, len(choiceless.cores)))
 
-    for _ in range(100):
-        other = Execution(task.canonical, number_of_cores, False)
-        other.go()
-        if other.clock > worst.clock:
-            print('{} > {}'.format(other.clock, worst.clock))
-            task.original.dotify('task.{}'.format(task.identifier))
-            task.canonical.dotify('task.{}.canonical'.format(task.identifier))
-            assert False
+    response_times = MonteCarlo(task.arrays).go(number_of_cores, samples, numpy.random.default_rng())
+    low, median, high = numpy.percentile(response_times, [0, 50, 100], method='nearest')
+    print('Samples:  {} (min {}, median {}, max {})'.format(samples, low, median, high))
+    anomalies = numpy.count_nonzero(response_times > worst.clock)
+    if anomalies:
+        print('{} samples > {}, up to {}'.format(anomalies, worst.clock, high))
+        task.original.dotify(task.basename())
+        task.canonical.dotify('{}.canonical'.format(task.basename()))
+        assert False
+
+    return proportion
 
 
 def reduce(network: Network) -> Tuple[Network, Dict[Tuple[int, int], List[int]]]:
     reduction = network.copy()
     labels = {}
     pending = {}
+    removed = set()
     worklist = deque()
     for vertex in reduction.vertices:
         if len(reduction.predecessors[vertex]) == 1 and len(reduction.successors[vertex]) == 1:
@@ -784,7 +1125,7 @@ def reduce(network: Network) -> Tuple[Network, Dict[Tuple[int, int], List[int]]]
         reduction.remove_edge(predecessor, vertex)
         reduction.remove_edge(vertex, successor)
         reduction.add_edge(predecessor, successor)
-        reduction.vertices.remove(vertex)
+        removed.add(vertex)
 
         key_a_to_b = (predecessor, vertex)
         key_b_to_c = (vertex, successor)
@@ -810,15 +1151,22 @@ def reduce(network: Network) -> Tuple[Network, Dict[Tuple[int, int], List[int]]]
                 worklist.append(successor)
                 pending[successor] = True
 
+    # Removing vertices from the list one at a time would make the reduction quadratic.
+    reduction.vertices = [vertex for vertex in reduction.vertices if vertex not in removed]
     return reduction, labels
 
 
-def compute_minimum_cores(canonical: Network, reduction: Network, labels: Dict[Tuple[int, int], List[int]]) -> int:
+def compute_minimum_cores(canonical: Network,
+                          reduction: Network,
+                          labels: Dict[Tuple[int, int], List[int]],
+                          arrays: ArrayNetwork = None) -> int:
     if len(reduction.vertices) == 2:
         master_key = (canonical.entry, canonical.exit)
         return len(labels[master_key])
     else:
-        ordering, parents, articulations = canonical.jail_and_free()
+        if arrays is None:
+            arrays = ArrayNetwork.from_network(canonical)
+        ordering, parents, articulations = arrays.jail_and_free()
         children = {vertex: [] for vertex in canonical.vertices}
         data = {}
         for level in reversed(ordering.keys()):
@@ -833,8 +1181,9 @@ def compute_minimum_cores(canonical: Network, reduction: Network, labels: Dict[T
                     data[vertex] = sum(golden_children)
 
         cores = 1
+        remaining = set(reduction.vertices)
         for vertex in articulations:
-            if vertex in reduction.vertices:
+            if vertex in remaining:
                 if len(reduction.successors[vertex]) == 1:
                     (successor,) = reduction.successors[vertex]
                     key = (vertex, successor)
@@ -844,37 +1193,84 @@ def compute_minimum_cores(canonical: Network, reduction: Network, labels: Dict[T
         return cores
 
 
-def analyse_tasks(tasks: List[Task], number_of_cores: int):
-    for task in tasks:
-        print('*' * 80)
-        print('Analysing task {}...'.format(task.identifier))
-        task.prepare()
-
-        if not task.dead:
-            reduction, labels = reduce(task.canonical)
-            minimum_cores = compute_minimum_cores(task.canonical, reduction, labels)
-            print('Minimum cores is {}'.format(minimum_cores))
-            analyse(task, minimum_cores)
-        print()
-
-    if False:
-        bins = {x: 0 for x in range(1, 101)}
-        alive = set()
-        choiceless = set()
+class Analysis:
+    def __init__(self, task: Task):
+        self.identifier = task.identifier
+        self.dead = False
+        self.proportion = None
+        self.deterministic = None
+        self.report = None
+        self.failure = None
+
+
+def analyse_task(task: Task, number_of_cores: int, samples: int) -> Analysis:
+    analysis = Analysis(task)
+    # Capture what is printed so that reports from tasks analysed in other processes do not interleave.
+    with StringIO() as report, redirect_stdout(report):
+        try:
+            print('*' * 80)
+            print('Analysing task {}...'.format(task.identifier))
+            task.prepare()
+
+            if task.dead:
+                analysis.dead = True
+            else:
+                reduction, labels = reduce(task.canonical)
+                minimum_cores = compute_minimum_cores(task.canonical, reduction, labels, task.arrays)
+                print('Minimum cores is {}'.format(minimum_cores))
+                analysis.proportion = analyse(task, minimum_cores, samples)
+
+                execution = Execution(task.canonical, number_of_cores, True)
+                execution.go()
+                analysis.deterministic = execution.choices == 0
+            print()
+        except Exception as e:
+            # Keep what the task printed up to the failure, since it explains the failure, and hand the failure on
+            # to be raised once the report has been printed.
+            print_exc(file=report)
+            analysis.failure = e
+        analysis.report = report.getvalue()
+    return analysis
+
+
+def initialise_worker(settings: Generator):
+    generator.__dict__.update(settings.__dict__)
+
+
+def analyse_tasks(tasks: List[Task], number_of_cores: int, jobs: int = 1, samples: int = 1000) -> Dict[int, int]:
+    bins = {x: 0 for x in range(1, 101)}
+    alive = 0
+    deterministic = 0
+
+    def gather(analyses: Iterable[Analysis]):
+        nonlocal alive, deterministic
+        for analysis in analyses:
+            print(analysis.report, end='')
+            if analysis.failure is not None:
+                raise analysis.failure
+            if not analysis.dead:
+                alive += 1
+                if analysis.proportion in bins:
+                    bins[analysis.proportion] += 1
+                if analysis.deterministic:
+                    deterministic += 1
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=initialise_worker, initargs=(generator,)) as executor:
+            try:
+                # Analyses come back in the order of the tasks, so the output reads the same as a serial run.
+                gather(executor.map(partial(analyse_task, number_of_cores=number_of_cores, samples=samples), tasks))
+            except BaseException:
+                # Drop the analyses that have not started rather than wait for them before the failure is raised.
+                executor.shutdown(cancel_futures=True)
+                raise
+    else:
+        gather(analyse_task(task, number_of_cores, samples) for task in tasks)
 
-        with ProcessPoolExecutor(max_workers=8) as executor:
-            worker = partial(analyse, number_of_cores=cores[task])
-            futures = {executor.submit(worker, task): task for task in tasks}
-            for future in as_completed(futures):
-                task = futures[future]
-                execution = future.result()
-                if not task.dead:
-                    alive.add(task)
-                    if not execution.choices:
-                        choiceless.add(task)
-
-        proportion = round(100 * len(choiceless) / len(alive))
+    if alive:
+        proportion = round(100 * deterministic / alive)
         print('On {} cores, {}% tasks have deterministic response times'.format(number_of_cores, proportion))
+    return bins
 
 
 def set_up_matplotlib():
@@ -971,34 +1367,169 @@ def read_gml(filename: str):
     return task
 
 
-def read_gmls(gml_files: List[str]):
-    tasks = []
+def parse_gmls(gml_files: List[str]) -> List[Task]:
     if len(gml_files) > 32:
         with ProcessPoolExecutor(max_workers=8) as executor:
-            futures = [executor.submit(read_gml, gml_file) for gml_file in gml_files]
-            for future in as_completed(futures):
-                task = future.result()
-                tasks.append(task)
+            return list(executor.map(read_gml, gml_files, chunksize=16))
     else:
-        for gml_file in gml_files:
-            tasks.append(read_gml(gml_file))
+        return [read_gml(gml_file) for gml_file in gml_files]
 
+
+def number_tasks(tasks: List[Task]):
     for id, task in enumerate(tasks):
         if task.identifier is None:
             task.set_identifier(id)
 
+
+def read_gmls(gml_files: List[str]):
+    tasks = parse_gmls(gml_files)
+    number_tasks(tasks)
     return tasks
 
 
+class TaskStore:
+    """
+    Keeps the tasks parsed from the GML files under a directory in '.cache' beside them, so that later experiments
+    read the whole directory with one memory-mapped load instead of parsing every file again.  Each task is a record
+    of int64s: the number of vertices and edges, the vertex IDs, their WCETs, and the edges in CSR form as offsets into
+    an array of successor indices.  An index maps each GML file to its record, and a file is parsed again whenever its
+    size or modification time no longer matches the index.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory: str):
+        self.directory = abspath(directory)
+        self.index_filename = join(self.directory, '.cache', 'tasks.json')
+        self.data_filename = join(self.directory, '.cache', 'tasks.npy')
+
+    @staticmethod
+    def encode(network: Network) -> numpy.ndarray:
+        index = {vertex: i for i, vertex in enumerate(network.vertices)}
+        offsets = [0]
+        successors = []
+        for vertex in network.vertices:
+            successors.extend(index[successor] for successor in network.successors[vertex])
+            offsets.append(len(successors))
+        return numpy.array([len(network.vertices), len(successors)]
+                           + network.vertices
+                           + [network.wcets[vertex] for vertex in network.vertices]
+                           + offsets
+                           + successors,
+                           dtype=numpy.int64)
+
+    @staticmethod
+    def record_length(data: numpy.ndarray, start: int) -> int:
+        number_of_vertices, number_of_edges = data[start:start + 2].tolist()
+        return 2 + 3 * number_of_vertices + 1 + number_of_edges
+
+    @staticmethod
+    def decode(data: numpy.ndarray, start: int, task: Task):
+        number_of_vertices = int(data[start])
+        record = data[start + 2:start + TaskStore.record_length(data, start)].tolist()
+        vertices = record[:number_of_vertices]
+        wcets = record[number_of_vertices:2 * number_of_vertices]
+        offsets = record[2 * number_of_vertices:3 * number_of_vertices + 1]
+        successors = record[3 * number_of_vertices + 1:]
+        # The record was made from a parsed network, so its vertices are distinct, every edge joins two of them and
+        # every WCET has been checked: the network is filled in directly rather than one vertex and edge at a time.
+        network = task.original
+        network.vertices = vertices
+        network.wcets = dict(zip(vertices, wcets))
+        network.successors = {vertex: set() for vertex in vertices}
+        network.predecessors = {vertex: set() for vertex in vertices}
+        network.english_alphabet = all(ord('a') <= vertex <= ord('z') for vertex in vertices)
+        for i, vertex in enumerate(vertices):
+            for successor in successors[offsets[i]:offsets[i + 1]]:
+                network.successors[vertex].add(vertices[successor])
+                network.predecessors[vertices[successor]].add(vertex)
+
+    def read_index(self) -> Tuple[Dict[str, list], numpy.ndarray or None]:
+        try:
+            with open(self.index_filename) as in_file:
+                version, entries = json.load(in_file)
+            if version == TaskStore.VERSION:
+                return entries, numpy.load(self.data_filename, mmap_mode='r')
+        except (OSError, ValueError):
+            pass
+        return {}, None
+
+    def write(self, entries: Dict[str, list], records: List[numpy.ndarray]):
+        try:
+            makedirs(dirname(self.index_filename), exist_ok=True)
+            # Write to the side and rename so that a reader never sees the index and the data disagree for long.
+            with open(self.data_filename + '.new', 'wb') as out_file:
+                numpy.save(out_file, numpy.concatenate(records) if records else numpy.zeros(0, dtype=numpy.int64))
+            with open(self.index_filename + '.new', 'w') as out_file:
+                json.dump([TaskStore.VERSION, entries], out_file)
+            replace(self.data_filename + '.new', self.data_filename)
+            replace(self.index_filename + '.new', self.index_filename)
+        except OSError as e:
+            print("Cannot update task store in '{}': {}".format(dirname(self.index_filename), e))
+
+    def read(self, gml_files: List[str]) -> List[Task]:
+        entries, data = self.read_index()
+        keys = [relpath(abspath(gml_file), self.directory) for gml_file in gml_files]
+        stamps = [[status.st_mtime_ns, status.st_size] for status in map(stat, gml_files)]
+
+        tasks = []
+        stale = []
+        for gml_file, key, stamp in zip(gml_files, keys, stamps):
+            entry = entries.get(key)
+            task = Task()
+            task.filename = gml_file
+            if data is not None and entry is not None and entry[:2] == stamp:
+                task.identifier = entry[2]
+                TaskStore.decode(data, entry[3], task)
+            else:
+                stale.append(len(tasks))
+            tasks.append(task)
+
+        for i, task in zip(stale, parse_gmls([gml_files[i] for i in stale])):
+            tasks[i] = task
+
+        if stale:
+            fresh = set(stale)
+            requested = set(keys)
+            new_entries = {}
+            records = []
+            start = 0
+            for key, entry in entries.items():
+                # Tasks that were not asked for this time stay in the store unless their GML file has gone.
+                if key not in requested and isfile(join(self.directory, key)):
+                    record = numpy.array(data[entry[3]:entry[3] + TaskStore.record_length(data, entry[3])])
+                    new_entries[key] = entry[:3] + [start]
+                    records.append(record)
+                    start += len(record)
+            for i, (key, stamp, task) in enumerate(zip(keys, stamps, tasks)):
+                if i in fresh:
+                    record = TaskStore.encode(task.original)
+                else:
+                    old_start = entries[key][3]
+                    record = numpy.array(data[old_start:old_start + TaskStore.record_length(data, old_start)])
+                new_entries[key] = stamp + [task.identifier, start]
+                records.append(record)
+                start += len(record)
+            del data
+            self.write(new_entries, records)
+
+        number_tasks(tasks)
+        return tasks
+
+
 def main():
     args = parse_command_line()
     generator.update(args)
+    if args.jobs < 1:
+        error_and_quit('The number of jobs must be positive')
+    if args.samples < 1:
+        error_and_quit('The number of samples must be positive')
     set_up_matplotlib()
 
     max_identifier = 1
     if args.file:
         tasks = read_gmls(args.file)
-        analyse_tasks(tasks, args.cores)
+        analyse_tasks(tasks, args.cores, args.jobs, args.samples)
 
     if args.directory:
         dir_to_gml_files = {}
@@ -1015,9 +1546,9 @@ def main():
                 dir_to_gml_files.setdefault(directory, []).extend(gml_files)
 
         for directory, gml_files in dir_to_gml_files.items():
-            tasks = read_gmls(gml_files)
+            tasks = TaskStore(directory).read(gml_files)
             print("Gathered {} tasks from '{}'".format(len(tasks), basename(directory)))
-            analyse_tasks(tasks, args.cores)
+            analyse_tasks(tasks, args.cores, args.jobs, args.samples)
 
     if generator.tasks > 0:
         tasks = []
@@ -1025,7 +1556,7 @@ def main():
             task_generator = TaskGenerator(identifier)
             tasks.append(task_generator.task)
 
-        analyse_tasks(tasks, args.cores)
+        analyse_tasks(tasks, args.cores, args.jobs, args.samples)
 
 
 if __name__ == '__main__':
@@ -4,7 +4,7 @@ import sys
 import threading
 
 from graphs import (edges, graphs, vertices)
-from system import programs, database
+from system import programs, cache, database
 from utils import messages
 
 
@@ -15,14 +15,16 @@ def main(**kwargs):
     if kwargs['manual']:
         programs.IO.read_properties(the_program, kwargs['manual'])
 
-    with database.Database(kwargs['database']) as db:
+    with cache.Cache(the_program) as store, database.Database(kwargs['database']) as db:
         db.reset()
         for subprogram in the_program:
             messages.debug_message('Creating data for {}'.format(subprogram.name))
             subprogram.cfg.dotify()
-            ppg = graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg)
+            ppg = store.get(subprogram.name,
+                            'ppg',
+                            lambda: graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg))
             ppg.dotify()
-            lnt = graphs.LoopNests(ppg)
+            lnt = store.get(subprogram.name, 'lnt', lambda: graphs.LoopNests(ppg))
             lnt.dotify()
 
             for v in ppg:
@@ -63,6 +65,9 @@ def main(**kwargs):
                             db.add_local_wfreq(v, local_bound)
                             db.add_global_wfreq(v, global_bound)
 
+        if kwargs['columns']:
+            db.export_columns(kwargs['columns'])
+
 
 def parse_the_command_line():
     parser = argparse.ArgumentParser(description='Create a database of values needed in the WCET calculation')
@@ -75,6 +80,10 @@ def parse_the_command_line():
                         help='write the data to this file',
                         required=True)
 
+    parser.add_argument('--columns',
+                        help='also write the data to this NumPy archive, which analyses read faster than the database',
+                        metavar='<FILE>.npz')
+
     parser.add_argument('--manual',
                         help='use properties of program points as specified manually in this file')
 
@@ -1,161 +1,377 @@
 import argparse
 import enum
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
 import sys
 import threading
 import time
 import typing
 
-from graphs import graphs
+import reduction
+
+from graphs import dominators, edges, graphs, vertices
 from system import programs
 from utils import messages
 
 
-def do_verification(cfg: graphs.ControlFlowGraph, candidate_tree, reference_tree):
-    messages.debug_message("Verifying...")
-    differences = set()
-    for v in cfg:
-        if v != cfg.entry:
-            (candidate,) = candidate_tree.predecessors(v)
-            (reference,) = reference_tree.predecessors(v)
+class Algorithms(enum.Enum):
+    Betts = 'betts'
+    Cooper = 'cooper'
+    Offline = 'offline'
+    Online = 'online'
+    T0T1T2 = 't0t1t2'
+    Tarjan = 'tarjan'
+
+    def __str__(self):
+        return self.value
+
+
+def compute(algorithm: Algorithms,
+            cfg: graphs.ControlFlowGraph,
+            origin: vertices.Vertex) -> typing.Dict[vertices.Vertex, vertices.Vertex]:
+    if algorithm == Algorithms.Betts:
+        return reduction.betts(cfg, origin)
+    elif algorithm == Algorithms.Cooper:
+        return graphs.Cooper(cfg, origin).idom
+    elif algorithm == Algorithms.Offline:
+        return dominators.offline(cfg, origin)
+    elif algorithm == Algorithms.Online:
+        return dominators.online(cfg, origin)
+    elif algorithm == Algorithms.T0T1T2:
+        return reduction.t0_t1_t2_dominators(cfg, origin)
+    elif algorithm == Algorithms.Tarjan:
+        return graphs.Tarjan(cfg, origin).idom
+    else:
+        assert False
+
+
+def count_differences(candidate: typing.Dict[vertices.Vertex, vertices.Vertex],
+                      reference: typing.Dict[vertices.Vertex, vertices.Vertex]) -> int:
+    # Algorithms disagree about whether the origin and unreachable vertices have an entry, so only compare the vertices
+    # that the reference gives an immediate dominator.
+    return len([vertex for vertex, idom in reference.items() if candidate.get(vertex) != idom])
+
+
+def strip_outliers(data: typing.List[float]) -> typing.List[float]:
+    if len(data) < 4:
+        return data
+    q25, _, q75 = statistics.quantiles(data, n=4)
+    cut_off = (q75 - q25) * 1.5
+    lower, upper = q25 - cut_off, q75 + cut_off
+    return [x for x in data if lower <= x <= upper]
+
+
+def summarise(times: typing.List[float]) -> typing.Dict[str, float]:
+    kept = strip_outliers(times)
+    return {'median': statistics.median(kept),
+            'mean': statistics.mean(kept),
+            'minimum': min(kept),
+            'maximum': max(kept),
+            'repetitions': len(times),
+            'outliers': len(times) - len(kept)}
+
+
+class Measurement:
+    __slots__ = ['times', 'differences', 'error']
+
+    def __init__(self):
+        self.times = []
+        self.differences = 0
+        self.error = None
+
+
+def generate_corpus(directory: str,
+                    sizes: typing.List[int],
+                    irreducibility: typing.List[int],
+                    programs_per_configuration: int,
+                    subprograms: int,
+                    loops: int,
+                    seed: int) -> typing.List[str]:
+    """
+    Generates one set of programs per size and number of multi-entry loops with program_generator.py.  Programs are
+    named by their configuration and reused if already present, so that successive runs time the same CFGs.
+    """
+    os.makedirs(directory, exist_ok=True)
+    generator = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'program_generator.py')
+    filenames = []
+    for size in sizes:
+        for multi in irreducibility:
+            for index in range(programs_per_configuration):
+                filename = os.path.join(directory, 'v{}.m{}.{}.json'.format(size, multi, index))
+                filenames.append(filename)
+                if not os.path.exists(filename):
+                    messages.verbose_message("Generating '{}'".format(filename))
+                    args = [sys.executable, '-O', generator,
+                            '--program', filename,
+                            '--subprograms', str(subprograms),
+                            '--vertices', str(size),
+                            '--loops', str(min(max(loops, multi), size // 2)),
+                            '--multi', str(multi),
+                            '--nesting-depth', '2',
+                            '--seed', str(seed * 1000003 + size * 1009 + multi * 101 + index),
+                            '--no-calls',
+                            '--no-instructions']
+                    process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    if process.returncode != 0:
+                        messages.error_message("Running '{}' failed: {}".format(' '.join(args),
+                                                                                process.stderr.decode()))
+    return filenames
+
+
+def benchmark_subprogram(subprogram: programs.Subprogram,
+                         algorithms: typing.List[Algorithms],
+                         warm_up: int,
+                         repeat: int,
+                         verify: bool) -> typing.Dict[Algorithms, Measurement]:
+    cfg = subprogram.cfg
+    # The dummy edge from exit to entry would make the entry a loop header, which the reduction algorithms reject.
+    cfg.remove_edge(edges.Edge(cfg.exit, cfg.entry))
+
+    measurements = {algorithm: Measurement() for algorithm in algorithms}
+    reference = graphs.Tarjan(cfg, cfg.entry).idom if verify else None
+    for iteration in range(warm_up + repeat):
+        cfg.shuffle_edges()
+        order = algorithms[:]
+        random.shuffle(order)
+        for algorithm in order:
+            measurement = measurements[algorithm]
+            if measurement.error:
+                continue
+
+            try:
+                start = time.perf_counter()
+                idom = compute(algorithm, cfg, cfg.entry)
+                end = time.perf_counter()
+            except AssertionError as e:
+                # The algorithms assert their preconditions, e.g. offline rejects irreducible graphs.  Anything else is a
+                # bug and ends the run.
+                measurement.error = '{}: {}'.format(e.__class__.__name__, e)
+                messages.debug_message('{} failed on {}: {}'.format(algorithm, cfg.name, measurement.error))
+                continue
+
+            if iteration >= warm_up:
+                measurement.times.append(end - start)
+                if verify:
+                    measurement.differences = max(measurement.differences, count_differences(idom, reference))
+    return measurements
+
+
+def compare_with_baseline(results: typing.Dict, baseline: typing.Dict, tolerance: float) -> typing.List[str]:
+    regressions = []
+    for key, result in results['benchmarks'].items():
+        if key not in baseline['benchmarks']:
+            continue
+        for algorithm, data in result['algorithms'].items():
+            old = baseline['benchmarks'][key]['algorithms'].get(algorithm)
+            if not old or 'median' not in old:
+                continue
+            if 'error' in data:
+                regressions.append('{} {}: {} versus {:.6f}s'.format(key, algorithm, data['error'], old['median']))
+                continue
+            ratio = data['median'] / old['median'] if old['median'] else 1
+            data['baseline_ratio'] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append('{} {}: {:.6f}s versus {:.6f}s ({:.2f}X)'.format(key,
+                                                                                   algorithm,
+                                                                                   data['median'],
+                                                                                   old['median'],
+                                                                                   ratio))
+    return regressions
+
+
+def benchmark_program(filename: str, args: argparse.Namespace) -> typing.Dict[str, typing.Dict]:
+    random.seed(args.seed)
+    program = programs.IO.read(filename)
+    if args.subprograms_only:
+        program.keep_only(args.subprograms_only)
+
+    benchmarks = {}
+    for subprogram in program:
+        cfg = subprogram.cfg
+        key = '{}:{}'.format(os.path.basename(filename), subprogram.name)
+        messages.verbose_message('{} vertices={} edges={} branches={} merges={}'.format(key,
+                                                                                      cfg.number_of_vertices(),
+                                                                                      cfg.number_of_edges(),
+                                                                                      cfg.number_of_branches(),
+                                                                                      cfg.number_of_merges()))
+        measurements = benchmark_subprogram(subprogram, args.algorithms, args.warm_up, args.repeat, args.verify)
+
+        entry = {'vertices': cfg.number_of_vertices(), 'edges': cfg.number_of_edges(), 'algorithms': {}}
+        for algorithm, measurement in measurements.items():
+            if measurement.error:
+                data = {'error': measurement.error}
+                messages.verbose_message('  {:<8} {}'.format(str(algorithm), measurement.error))
+            else:
+                data = summarise(measurement.times)
+                messages.verbose_message('  {:<8} {:.6f}s'.format(str(algorithm), data['median']))
+                if args.verify:
+                    data['differences'] = measurement.differences
+            entry['algorithms'][str(algorithm)] = data
+        benchmarks[key] = entry
+    return benchmarks
+
+
+def main(args: argparse.Namespace):
+    random.seed(args.seed)
+
+    if args.program:
+        filenames = args.program
+    else:
+        filenames = generate_corpus(args.corpus,
+                                    args.vertices,
+                                    args.multi,
+                                    args.programs,
+                                    args.subprograms,
+                                    args.loops,
+                                    args.seed)
+
+    messages.verbose_message("Verification is {}".format("ON" if args.verify else "OFF"))
+    results = {'python': platform.python_version(),
+               'machine': platform.machine(),
+               'warm_up': args.warm_up,
+               'repeat': args.repeat,
+               'benchmarks': {}}
+    # Vertex IDs are only unique within a program and vertices are never released, so every program is read and
+    # timed in a fresh process.
+    failures = []
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        for filename in filenames:
+            benchmarks = pool.apply(benchmark_program, (filename, args))
+            for key, entry in benchmarks.items():
+                for algorithm, data in entry['algorithms'].items():
+                    if args.verify and 'error' in data:
+                        failures.append('{} {}: {}'.format(key, algorithm, data['error']))
+                    elif data.get('differences'):
+                        failures.append('{} {}: {} immediate dominators differ from {}'.format(key,
+                                                                                          algorithm,
+                                                                                          data['differences'],
+                                                                                          Algorithms.Tarjan))
+            results['benchmarks'].update(benchmarks)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as rd:
+            regressions = compare_with_baseline(results, json.load(rd), args.tolerance)
+
+    with open(args.output, 'w') as wd:
+        json.dump(results, wd, indent=2, sort_keys=True)
+        wd.write('\n')
+    messages.verbose_message("Results written to '{}'".format(args.output))
+
+    for failure in failures:
+        messages.verbose_message('Verification failed: {}'.format(failure))
+    for regression in regressions:
+        messages.verbose_message('Regression: {}'.format(regression))
+    if failures or regressions:
+        messages.error_message('{} verification failures and {} regressions'.format(len(failures), len(regressions)))
 
-            if candidate.predecessor() != reference.predecessor():
-                differences.add((v, candidate.predecessor(), reference.predecessor()))
 
-    message = "Differences ({} vs {}):\n{}".format(candidate_tree.__class__.__name__,
-                                                   reference_tree.__class__.__name__,
-                                                   '\n'.join('{}=>{} {}=>{}'.format(candidate, v, reference, v) for v, candidate, reference in differences))
+def parse_the_command_line():
+    parser = argparse.ArgumentParser(description='Benchmark dominator algorithms against each other and a baseline')
 
-    if differences:
-        messages.error_message(message)
+    parser.add_argument('--program',
+                        nargs='+',
+                        help='benchmark these programs instead of a generated corpus',
+                        metavar='<FILE>')
 
+    parser.add_argument('-s',
+                        '--subprogram',
+                        dest='subprograms_only',
+                        nargs='+',
+                        help='only do the calculation for these subprograms',
+                        metavar='<NAME>')
 
-class Algorithms(enum.Enum):
-    Betts = 'Betts'
-    Cooper = 'Cooper'
-    Tarjan = 'Tarjan'
-
-
-class Time:
-    __slots__ = ['name', 'time']
-
-    def __init__(self, name: Algorithms, time):
-        self.name = name
-        self.time = time
-
-
-def main(program_filename: str,
-         repeat:           int,
-         subprogram_names: typing.List[str],
-         verify:           bool):
-    the_program = programs.IO.read(program_filename)
-    the_program.cleanup()
-
-    messages.verbose_message("Verification is {}".format("ON" if verify else "OFF"))
-
-    analysable_subprograms = [subprogram for subprogram in the_program
-                              if not subprogram_names or (subprogram_names and subprogram.name in subprogram_names)]
-
-    results = []
-    speedups = []
-    slowdowns = []
-    for subprogram in analysable_subprograms:
-        messages.verbose_message("Analysing", subprogram.name)
-        subprogram.cfg.dotify()
-        betts_times = []
-        tarjan_times = []
-        cooper_times = []
-
-        for i in range(0, repeat):
-            subprogram.cfg.shuffle_edges()
-
-            start = time.time()
-            betts_tree = graphs.Betts(subprogram.cfg)
-            betts_times.append(time.time() - start)
-
-            start = time.time()
-            tarjan_tree = graphs.LengauerTarjan(subprogram.cfg, subprogram.cfg.entry)
-            tarjan_times.append(time.time() - start)
-
-            start = time.time()
-            cooper_tree = graphs.Cooper(subprogram.cfg)
-            cooper_times.append(time.time() - start)
-
-            if verify:
-                messages.debug_message("Betts versus Tarjan")
-                do_verification(subprogram.cfg, betts_tree, tarjan_tree)
-                messages.debug_message("Cooper versus Tarjan")
-                do_verification(subprogram.cfg, cooper_tree, tarjan_tree)
-                messages.debug_message("Betts versus Cooper")
-                do_verification(subprogram.cfg, betts_tree, cooper_tree)
-
-        betts = Time(Algorithms.Betts, sum(betts_times) / repeat)
-        cooper = Time(Algorithms.Cooper, sum(cooper_times) / repeat)
-        tarjan = Time(Algorithms.Tarjan, sum(tarjan_times) / repeat)
-        times = [betts, cooper, tarjan]
-        times.sort(key=lambda t: t.time)
-        results.append(times)
-
-        messages.verbose_message('{} vertices={} edges={} branches={} merges={}'.format(subprogram.name,
-                                                                                        subprogram.cfg.number_of_vertices(),
-                                                                                        subprogram.cfg.number_of_edges(),
-                                                                                        subprogram.cfg.number_of_branches(),
-                                                                                        subprogram.cfg.number_of_merges()))
-        messages.verbose_message('{}:: {:.4f}'.format(times[0].name.value,
-                                                      times[0].time))
-        messages.verbose_message('{}:: {:.4f} {:.1f}X faster'.format(times[1].name.value,
-                                                                     times[1].time,
-                                                                     times[1].time/times[0].time))
-        messages.verbose_message('{}:: {:.4f} {:.1f}X faster'.format(times[2].name.value,
-                                                                     times[2].time,
-                                                                     times[2].time/times[0].time))
-
-    messages.verbose_message("======> Summary")
-    for name in Algorithms:
-        first = [r for r in results if r[0].name == name]
-        if first:
-            messages.verbose_message('{} came first {} times'.format(name.value, len(first)))
-
-    for name in Algorithms:
-        second = [r for r in results if r[1].name == name]
-        if second:
-            messages.verbose_message('{} came second {} times'.format(name.value, len(second)))
-
-    for name in Algorithms:
-        third = [r for r in results if r[2].name == name]
-        if third:
-            messages.verbose_message('{} came third {} times'.format(name.value, len(third)))
+    parser.add_argument('--corpus',
+                        help='generate programs into and read them from this directory',
+                        default='dominator_corpus',
+                        metavar='<DIR>')
 
+    parser.add_argument('--vertices',
+                        type=int,
+                        nargs='+',
+                        help='generate CFGs with these numbers of basic blocks',
+                        default=[50, 200, 1000],
+                        metavar='<INT>')
 
-def parse_the_command_line():
-    parser = argparse.ArgumentParser(description='Compare dominator algorithms')
+    parser.add_argument('--multi',
+                        type=int,
+                        nargs='+',
+                        help='generate CFGs with these numbers of multi-entry (irreducible) loops',
+                        default=[0, 2],
+                        metavar='<INT>')
 
-    parser.add_argument('--program',
-                        help='read the program from this file',
-                        required=True)
+    parser.add_argument('--loops',
+                        type=int,
+                        help='the number of loops in a generated CFG',
+                        default=8,
+                        metavar='<INT>')
 
-    parser.add_argument('--repeat',
+    parser.add_argument('--programs',
                         type=int,
-                        help='repeat the dominator tree creation this many times',
+                        help='the number of programs generated per configuration',
                         default=1,
                         metavar='<INT>')
 
-    parser.add_argument('-s',
-                        '--subprogram',
+    parser.add_argument('--subprograms',
+                        type=int,
+                        help='the number of subprograms in a generated program',
+                        default=4,
+                        metavar='<INT>')
+
+    parser.add_argument('--algorithms',
+                        type=Algorithms,
+                        choices=list(Algorithms),
                         nargs='+',
-                        help='only do the calculation for these subprograms',
-                        metavar='<NAME>')
+                        help='only run these algorithms',
+                        default=list(Algorithms))
+
+    parser.add_argument('--warm-up',
+                        type=int,
+                        help='run each algorithm this many times before timing it',
+                        default=1,
+                        metavar='<INT>')
+
+    parser.add_argument('--repeat',
+                        type=int,
+                        help='time each algorithm this many times',
+                        default=5,
+                        metavar='<INT>')
+
+    parser.add_argument('--seed',
+                        type=int,
+                        help='seed for corpus generation and the shuffling of edges and algorithms',
+                        default=0,
+                        metavar='<INT>')
 
     parser.add_argument('--verify',
                         action='store_true',
                         help='verify the dominator trees against each other',
                         default=False)
 
+    parser.add_argument('--output',
+                        help='write the results as JSON to this file',
+                        default='dominators.json',
+                        metavar='<FILE>')
+
+    parser.add_argument('--baseline',
+                        help='compare median times against results previously written to this file',
+                        metavar='<FILE>')
+
+    parser.add_argument('--tolerance',
+                        type=float,
+                        help='report a regression when a median exceeds the baseline by more than this fraction',
+                        default=0.25,
+                        metavar='<FLOAT>')
+
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     threading.stack_size(2 ** 26)
     sys.setrecursionlimit(2 ** 30)
-    kwargs = vars(parse_the_command_line())
-    main(kwargs['program'], kwargs['repeat'], kwargs['subprogram'], kwargs['verify'])
-
+    main(parse_the_command_line())
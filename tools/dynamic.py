@@ -1,10 +1,13 @@
+import numpy
+import random
+
 from argparse import ArgumentParser, Namespace
 from graphs import vertices
 from os.path import splitext
 from utils.messages import verbose_message
 from random import choice
-from system import programs
-from typing import Set
+from system import programs, traces
+from typing import List, Set
 
 
 class StackFrame:
@@ -59,7 +62,133 @@ def generate_trace(program: programs.Program, root: vertices.CallVertex, uncover
     return trace
 
 
+def latency_distribution(vertex: vertices.BasicBlock) -> numpy.ndarray:
+    """
+    The probability of each execution time of the basic block, indexed by time.  It is the convolution of the latency
+    distributions of the instructions in the block.
+    """
+    distribution = numpy.ones(1)
+    for instruction in vertex.instructions:
+        latencies = numpy.zeros(instruction.worst_latency() + 1)
+        for latency, weight in zip(instruction._latencies, instruction._weights):
+            latencies[latency] += weight
+        distribution = numpy.convolve(distribution, latencies / latencies.sum())
+    return distribution
+
+
+class TraceGenerator:
+    """
+    Generates traces with the same distribution as generate_trace, a batch of runs at a time.  Every vertex of every
+    CFG gets a dense index.  Paths are walked one run at a time, drawing successors from a buffer of random numbers; the
+    execution times of all blocks in a batch are then drawn at once.  For that, the cumulative latency distribution of
+    block k is shifted by k and all of them are concatenated, so that a single searchsorted samples any mix of blocks.
+    """
+
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, program: programs.Program, root: vertices.SubprogramVertex, seed: int = None):
+        self._random = numpy.random.default_rng(seed)
+        self._uniforms = []
+        self._vertices = []
+        index = {}
+        for subprogram in program:
+            for vertex in subprogram.cfg:
+                index[vertex] = len(self._vertices)
+                self._vertices.append(vertex)
+
+        self._successors = [None] * len(self._vertices)
+        self._callee_entry = [-1] * len(self._vertices)
+        self._exit = [False] * len(self._vertices)
+        for subprogram in program:
+            cfg = subprogram.cfg
+            for vertex in cfg:
+                successors = [index[edge.successor()] for edge in cfg.successors(vertex)]
+                self._successors[index[vertex]] = successors
+                self._exit[index[vertex]] = vertex == cfg.exit
+                if len(successors) == 1:
+                    callee_vertex = program.call_graph.is_call_site(subprogram.call_vertex, vertex)
+                    if callee_vertex:
+                        self._callee_entry[index[vertex]] = index[program[callee_vertex.name].cfg.entry]
+
+        root_subprogram = program[root.name]
+        self._root_entry = index[root_subprogram.cfg.entry]
+        self._root_exit = index[root_subprogram.cfg.exit]
+
+        self._ids = numpy.array([vertex.id_ for vertex in self._vertices], dtype=numpy.int64)
+        cumulative = []
+        offsets = []
+        start = 0
+        for vertex_index, vertex in enumerate(self._vertices):
+            distribution = numpy.cumsum(latency_distribution(vertex))
+            distribution /= distribution[-1]
+            cumulative.append(distribution + vertex_index)
+            offsets.append(start)
+            start += len(distribution)
+        self._cumulative = numpy.concatenate(cumulative)
+        self._offsets = numpy.array(offsets, dtype=numpy.int64)
+
+    def walk(self) -> List[int]:
+        """
+        A path from the entry to the exit of the root, as vertex indices, following calls into callees.
+        """
+        successors = self._successors
+        callee_entry = self._callee_entry
+        exits = self._exit
+        uniforms = self._uniforms
+        path = []
+        stack = []
+        vertex = self._root_entry
+        while True:
+            path.append(vertex)
+            if exits[vertex]:
+                if vertex == self._root_exit:
+                    break
+                vertex = stack.pop()
+            elif callee_entry[vertex] >= 0:
+                stack.append(vertex)
+                vertex = callee_entry[vertex]
+                continue
+
+            candidates = successors[vertex]
+            if len(candidates) == 1:
+                vertex = candidates[0]
+            else:
+                if not uniforms:
+                    uniforms.extend(self._random.random(TraceGenerator.BUFFER_SIZE).tolist())
+                vertex = candidates[int(uniforms.pop() * len(candidates))]
+        return path
+
+    def covered(self, path: List[int]) -> List[vertices.BasicBlock]:
+        return [self._vertices[vertex] for vertex in set(path)]
+
+    def timestamp(self, paths: List[List[int]]) -> List[numpy.ndarray]:
+        """
+        Draws the execution time of every block on the paths and turns each path into a run of (id, clock) events,
+        preceded by the ghost event.  The clock restarts at the entry of the root.
+        """
+        lengths = [len(path) for path in paths]
+        blocks = numpy.fromiter((vertex for path in paths for vertex in path), dtype=numpy.int64, count=sum(lengths))
+        positions = numpy.searchsorted(self._cumulative, self._random.random(len(blocks)) + blocks, side='right')
+        times = positions - self._offsets[blocks]
+
+        starts = numpy.cumsum([0] + lengths[:-1])
+        times[starts] = 0
+        clocks = numpy.cumsum(times)
+        clocks -= numpy.repeat(clocks[starts], lengths)
+
+        runs = []
+        for start, length in zip(starts.tolist(), lengths):
+            run = numpy.zeros((length + 1, 2), dtype=numpy.int64)
+            run[1:, 0] = self._ids[blocks[start:start + length]]
+            run[1:, 1] = clocks[start:start + length]
+            runs.append(run)
+        return runs
+
+
 def main(args: Namespace):
+    if args.seed is not None:
+        random.seed(args.seed)
+
     program = programs.IO.read(args.program)
     root = program.call_graph.get_root()
     verbose_message('Root is {}'.format(root.name))
@@ -70,23 +199,32 @@ def main(args: Namespace):
             uncovered.add(vertex)
 
     count = 1
-    traces = []
     total = len(uncovered)
     attained = len(uncovered) / total
-    while attained > args.coverage and count <= args.runs:
-        if attained < args.coverage * 2:
-            print('Tests = {}. Coverage attained = {:.2f}%.'.format(count, attained * 100))
-        traces.append(generate_trace(program, root, uncovered))
-        count += 1
-        attained = len(uncovered) / total
-
     stem, _ = splitext(program.filename)
-    with open('traces.{}.txt'.format(stem), 'w') as traces_file:
-        traces_file.write('{}\n\n'.format(program.magic))
-        for trace in traces:
-            for x, y in trace:
-                traces_file.write('{} {}\n'.format(x, y))
-            traces_file.write('\n')
+    filename = 'traces.{}.{}'.format(stem, traces.extension(args.format))
+    generator = TraceGenerator(program, root, args.seed) if args.batch else None
+    with traces.create_writer(filename, program.magic, args.format, not args.uncompressed) as writer:
+        while attained > args.coverage and count <= args.runs:
+            if generator:
+                # Coverage depends only on the paths, so runs stop exactly where they would one at a time.
+                paths = []
+                while attained > args.coverage and count <= args.runs and len(paths) < args.batch:
+                    if attained < args.coverage * 2:
+                        print('Tests = {}. Coverage attained = {:.2f}%.'.format(count, attained * 100))
+                    paths.append(generator.walk())
+                    uncovered.difference_update(generator.covered(paths[-1]))
+                    count += 1
+                    attained = len(uncovered) / total
+
+                for run in generator.timestamp(paths):
+                    writer.write_run(run)
+            else:
+                if attained < args.coverage * 2:
+                    print('Tests = {}. Coverage attained = {:.2f}%.'.format(count, attained * 100))
+                writer.write_run(generate_trace(program, root, uncovered))
+                count += 1
+                attained = len(uncovered) / total
 
 
 def parse_the_command_line():
@@ -108,6 +246,30 @@ def parse_the_command_line():
                         metavar='<FLOAT>',
                         default=0.1)
 
+    parser.add_argument('--batch',
+                        type=int,
+                        help='number of runs whose block execution times are drawn together; 0 generates one run at a '
+                             'time',
+                        metavar='<INT>',
+                        default=256)
+
+    parser.add_argument('--seed',
+                        type=int,
+                        help='seed the random number generators so that runs can be reproduced',
+                        metavar='<INT>',
+                        default=None)
+
+    parser.add_argument('--format',
+                        type=traces.Format,
+                        choices=list(traces.Format),
+                        help='write traces in this format',
+                        default=traces.Format.text.name)
+
+    parser.add_argument('--uncompressed',
+                        action='store_true',
+                        help='do not compress the blocks of binary traces',
+                        default=False)
+
     return parser.parse_args()
 
 
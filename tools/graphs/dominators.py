@@ -3,60 +3,11 @@ from random import sample
 from typing import Dict, Set
 
 from graphs.edges import Edge
-from graphs.graphs import ControlFlowGraph, DirectedGraph, Tarjan
+from graphs.graphs import ControlFlowGraph, DirectedGraph, DominatorTree, Tarjan
 from graphs.vertices import Vertex, SuperBlock
 from utils import dot, messages
 
 
-class DominatorTree:
-    def __init__(self):
-        self.idom = {}
-        self.level = {}
-        self.children = {}
-        self.root = None
-
-    def set_root(self, vertex: Vertex):
-        self.root = vertex
-
-    def add_vertex(self, vertex: Vertex):
-        self.idom[vertex] = None
-        self.level[vertex] = 0
-        self.children[vertex] = set()
-
-    def add_edge(self, predecessor: Vertex, successor: Vertex):
-        self.children[predecessor].add(successor)
-        self.idom[successor] = predecessor
-        self.level[successor] = self.level[predecessor] + 1
-
-    def remove_edge(self, predecessor: Vertex, successor: Vertex):
-        self.children[predecessor].remove(successor)
-        self.idom[successor] = None
-
-    def do_lca(self, left, right) -> Vertex:
-        while self.level[left] != self.level[right]:
-            if self.level[left] > self.level[right]:
-                left = self.idom[left]
-            else:
-                right = self.idom[right]
-
-        while left != right:
-            left = self.idom[left]
-            right = self.idom[right]
-
-        return left
-
-    def __str__(self):
-        assert self.root is not None
-        value = ''
-        queue = deque([self.root])
-        while queue:
-            vertex = queue.popleft()
-            for child in self.children[vertex]:
-                value += 'idom({}) = {}\n'.format(child, vertex)
-                queue.append(child)
-        return value
-
-
 def update_join(predecessor: Vertex,
                 join: Vertex,
                 overlay: Dict[Vertex, Set],
@@ -684,7 +635,7 @@ def offline(cfg: ControlFlowGraph, origin: Vertex):
     assert forest.structured()
     if forest.structured():
         for loop in forest:
-            (vertex,) = sample(loop.body, 1)
+            (vertex,) = sample(list(loop.body), 1)
             inverse_loop = inverse_forest.vertex_to_loop[vertex]
             assert loop.body == inverse_loop.body
 
@@ -1,5 +1,7 @@
+from array import array
 from collections import deque
 from enum import Enum
+from heapq import heappop, heappush
 from graphs import vertices, edges, instrumentation
 from random import shuffle
 from utils import dot, messages
@@ -14,14 +16,119 @@ class VertexData:
         self.successors = []
 
 
+class Adjacency:
+    """
+    The edges of a graph in one direction in compressed sparse row form: the neighbours of the vertex with index i are
+    targets[indptr[i]:indptr[i + 1]], and edges holds the edge object behind each of those entries.
+    """
+
+    __slots__ = ['indptr', 'targets', 'edges']
+
+    def __init__(self, indptr: array, targets: array, edges_: list):
+        self.indptr = indptr
+        self.targets = targets
+        self.edges = edges_
+
+
+class CompactGraph:
+    """
+    A read-only snapshot of a directed graph in which vertices are numbered densely from 0 in iteration order and both
+    directions of adjacency are stored as integer arrays.  Traversals run on the indices and only translate back to
+    vertices and edges for their results, so they avoid hashing and comparing vertex and edge objects.
+    """
+
+    __slots__ = ['vertices', 'index', 'forward', 'backward']
+
+    def __init__(self, vertices_: list, index: dict, forward: Adjacency, backward: Adjacency):
+        self.vertices = vertices_
+        self.index = index
+        self.forward = forward
+        self.backward = backward
+
+    @classmethod
+    def create(cls, g: 'DirectedGraph') -> 'CompactGraph':
+        vertices_ = list(g)
+        index = {vertex: i for i, vertex in enumerate(vertices_)}
+
+        def adjacency(transitions, transition):
+            indptr = array('l', [0])
+            targets = array('l')
+            edges_ = []
+            for vertex in vertices_:
+                for edge in transitions(g, vertex):
+                    targets.append(index[transition(edge)])
+                    edges_.append(edge)
+                indptr.append(len(targets))
+            return Adjacency(indptr, targets, edges_)
+
+        return cls(vertices_,
+                   index,
+                   adjacency(DirectedGraph.successors, edges.Edge.successor),
+                   adjacency(DirectedGraph.predecessors, edges.Edge.predecessor))
+
+    def reverse(self) -> 'CompactGraph':
+        return CompactGraph(self.vertices, self.index, self.backward, self.forward)
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def successors(self, i: int) -> array:
+        return self.forward.targets[self.forward.indptr[i]:self.forward.indptr[i + 1]]
+
+    def predecessors(self, i: int) -> array:
+        return self.backward.targets[self.backward.indptr[i]:self.backward.indptr[i + 1]]
+
+    def successor_edges(self, i: int) -> list:
+        return self.forward.edges[self.forward.indptr[i]:self.forward.indptr[i + 1]]
+
+    def predecessor_edges(self, i: int) -> list:
+        return self.backward.edges[self.backward.indptr[i]:self.backward.indptr[i + 1]]
+
+
 class DirectedGraph:
     def __init__(self):
         self._data = {}
+        self._compact = None
+        self._searches = {}
+
+    def __getstate__(self):
+        # The snapshot and searches are cheap to rebuild, so do not store them.
+        state = self.__dict__.copy()
+        state['_compact'] = None
+        state['_searches'] = {}
+        # Subclasses that are also program data keep their program and name in slots rather than the dictionary.
+        slots = {name: getattr(self, name)
+                 for cls in type(self).__mro__ for name in getattr(cls, '__slots__', ()) if hasattr(self, name)}
+        if slots:
+            return state, slots
+        return state
+
+    def _changed(self):
+        self._compact = None
+        self._searches.clear()
+
+    def compact(self) -> CompactGraph:
+        """
+        An array-backed snapshot of the graph, built on first use and discarded whenever the graph changes.
+        """
+        if self._compact is None:
+            self._compact = CompactGraph.create(self)
+        return self._compact
+
+    def depth_first_search(self, root: vertices.Vertex, forwards: bool = True) -> 'DepthFirstSearch':
+        """
+        The depth-first search from the root, shared by every analysis of the graph until it changes.
+        """
+        key = (root, forwards)
+        if key not in self._searches:
+            self._searches[key] = DepthFirstSearch(self, root, forwards)
+        return self._searches[key]
 
     def add_vertex(self, vertex: vertices.Vertex):
         if vertex.id_ in self._data:
             messages.error_message('Graph already contains a vertex with ID {}'.format(vertex.id_))
         self._data[vertex.id_] = VertexData(vertex)
+        self._changed()
 
     def _get_vertex_data(self, vertex: vertices.Vertex) -> VertexData:
         try:
@@ -39,6 +146,7 @@ class DirectedGraph:
             self.remove_predecessor(edge.successor(), vertex)
 
         del self._data[vertex.id_]
+        self._changed()
 
     def __contains__(self, vertex: vertices.Vertex):
         return vertex.id_ in self._data
@@ -70,6 +178,7 @@ class DirectedGraph:
         p_info.successors.append(edge)
         s_info = self._get_vertex_data(edge.successor())
         s_info.predecessors.append(edge)
+        self._changed()
 
     def has_edge(self, p: vertices.Vertex, s: vertices.Vertex):
         return self.has_successor(p, s) and self.has_predecessor(s, p)
@@ -77,10 +186,12 @@ class DirectedGraph:
     def remove_predecessor(self, vertex: vertices.Vertex, predecessor: vertices.Vertex):
         info = self._get_vertex_data(vertex)
         info.predecessors = [edge for edge in info.predecessors if edge.predecessor() != predecessor]
+        self._changed()
 
     def remove_successor(self, vertex: vertices.Vertex, successor: vertices.Vertex):
         info = self._get_vertex_data(vertex)
         info.successors = [edge for edge in info.successors if edge.successor() != successor]
+        self._changed()
 
     def remove_edge(self, edge: edges.Edge):
         self.remove_successor(edge.predecessor(), edge.successor())
@@ -96,12 +207,14 @@ class DirectedGraph:
         info = self._get_vertex_data(vertex)
         info.predecessors = []
         info.successors = []
+        self._changed()
 
     def shuffle_edges(self):
         for vertex in self:
             info = self._get_vertex_data(vertex)
             shuffle(info.predecessors)
             shuffle(info.successors)
+        self._changed()
 
     def __str__(self):
         value = ''
@@ -177,6 +290,7 @@ class FlowGraph(DirectedGraph, ProgramData):
     @entry.setter
     def entry(self, value):
         self._entry = value
+        self._pre_dominator_tree = None
 
     @property
     def exit(self):
@@ -185,22 +299,53 @@ class FlowGraph(DirectedGraph, ProgramData):
     @exit.setter
     def exit(self, value):
         self._exit = value
+        self._post_dominator_tree = None
+
+    def add_edge(self, edge: edges.Edge) -> None:
+        DirectedGraph.add_edge(self, edge)
+        if self._pre_dominator_tree and not self._pre_dominator_tree.insert_edge(edge):
+            self._pre_dominator_tree = None
+        if self._post_dominator_tree and not self._post_dominator_tree.insert_edge(edge):
+            self._post_dominator_tree = None
+
+    def remove_edge(self, edge: edges.Edge):
+        DirectedGraph.remove_edge(self, edge)
+        if self._pre_dominator_tree and not self._pre_dominator_tree.delete_edge(edge):
+            self._pre_dominator_tree = None
+        if self._post_dominator_tree and not self._post_dominator_tree.delete_edge(edge):
+            self._post_dominator_tree = None
 
     def remove_vertex(self, v: vertices.Vertex):
+        # Detach the vertex edge by edge so that the dominator trees follow along.
+        if self._pre_dominator_tree or self._post_dominator_tree:
+            for edge in self.predecessors(v) + self.successors(v):
+                self.remove_edge(edge)
         DirectedGraph.remove_vertex(self, v)
         if v == self._entry:
-            self._entry = None
+            self.entry = None
         if v == self._exit:
-            self._exit = None
+            self.exit = None
 
-    def pre_dominator_tree(self):
+    def wipe_edges(self, vertex: vertices.Vertex):
+        DirectedGraph.wipe_edges(self, vertex)
+        self._pre_dominator_tree = None
+        self._post_dominator_tree = None
+
+    def pre_dominator_tree(self) -> 'IncrementalDominatorTree':
+        """
+        The dominator tree rooted at the entry.  Once built, it is updated as edges are added and removed rather than
+        computed again.
+        """
         if self._pre_dominator_tree is None:
-            self._pre_dominator_tree = Tarjan(self, self.entry)
+            self._pre_dominator_tree = IncrementalDominatorTree(self, self.entry)
         return self._pre_dominator_tree
 
-    def post_dominator_tree(self):
+    def post_dominator_tree(self) -> 'IncrementalDominatorTree':
+        """
+        The post-dominator tree rooted at the exit, maintained in the same way as the dominator tree.
+        """
         if self._post_dominator_tree is None:
-            self._post_dominator_tree = Tarjan(self, self.exit)
+            self._post_dominator_tree = IncrementalDominatorTree(self, self.exit)
         return self._post_dominator_tree
 
     def dotify(self, suffix=''):
@@ -241,8 +386,8 @@ class ControlFlowGraph(FlowGraph):
                     self.remove_edge(e)
 
         # Remove vertices that cannot be reached from the entry vertex.
-        dfs = DepthFirstSearch(self, self.entry)
-        dead_vertices = [v for v in self if v not in dfs.pre_order()]
+        dfs = self.depth_first_search(self.entry)
+        dead_vertices = [v for v in self if v not in dfs]
         for v in dead_vertices:
             messages.debug_message("Basic block {} is unreachable in subprogram '{}'".format(v, self.name))
             self.remove_vertex(v)
@@ -355,7 +500,7 @@ class ProgramPointGraph(FlowGraph):
     def dotify(self, suffix=''):
         data = []
         if self._entry:
-            dfs = DepthFirstSearch(self, self.entry)
+            dfs = self.depth_first_search(self.entry)
             order = list(reversed(dfs.post_order()))
         else:
             order = [v for v in self]
@@ -402,7 +547,7 @@ class DependenceGraph(DirectedGraph):
                 self.add_edge(edges.Edge(entry_v, v))
 
         # Compute
-        dfs = DepthFirstSearch(self, entry_v)
+        dfs = self.depth_first_search(entry_v)
         data = {v: set() for v in self}
         for v in reversed(dfs.post_order()):
             for e in self.predecessors(v):
@@ -426,31 +571,76 @@ class DependenceGraph(DirectedGraph):
 
 
 class DepthFirstSearch:
+    """
+    Numbers the vertices reachable from the root in pre- and post-order and finds the back edges, all in one pass with an
+    explicit stack so that the depth of the graph is not limited by the recursion limit.  Orders are built once; prefer
+    DirectedGraph.depth_first_search, which shares one search per root between analyses.
+    """
+
     def __init__(self, g: DirectedGraph, root: vertices.Vertex, forwards: bool = True):
-        self._vertex_to_pre = {}
-        self._vertex_to_post = {}
-        self._pre_to_vertex = {}
-        self._post_to_vertex = {}
+        compact = g.compact() if forwards else g.compact().reverse()
+        self._compact = compact
+        self._vertices = compact.vertices
+        self._index = compact.index
+        # Pre- and post-order numbers start from 1, so 0 marks a vertex the search has not reached.
+        self._pre = array('l', [0]) * len(compact)
+        self._post = array('l', [0]) * len(compact)
+        self._parent = array('l', [-1]) * len(compact)
+        self._pre_order = array('l')
+        self._post_order = array('l')
         self._back_edges = {}
-        self._search(g, root, forwards)
+        self._search(compact, compact.index[root])
+        self._pre_order_vertices = [self._vertices[i] for i in self._pre_order]
+        self._post_order_vertices = [self._vertices[i] for i in self._post_order]
+
+    @property
+    def compact(self) -> CompactGraph:
+        """
+        The snapshot searched, oriented so that its forward adjacency is the direction of the search.
+        """
+        return self._compact
+
+    @property
+    def pre_order_indices(self) -> array:
+        return self._pre_order
+
+    @property
+    def post_order_indices(self) -> array:
+        return self._post_order
+
+    @property
+    def parents(self) -> array:
+        """
+        The index of the parent of each vertex in the search tree, or -1 for the root and unreached vertices.
+        """
+        return self._parent
 
     def pre_order(self):
-        return list(e[0] for e in sorted(self._vertex_to_pre.items(), key=lambda e: e[1]))
+        return self._pre_order_vertices
 
     def post_order(self):
-        return list(e[0] for e in sorted(self._vertex_to_post.items(), key=lambda e: e[1]))
+        return self._post_order_vertices
+
+    def __contains__(self, v: vertices.Vertex):
+        return v in self._index and self._pre[self._index[v]] > 0
+
+    def _number(self, numbers, v: vertices.Vertex):
+        number = numbers[self._index[v]]
+        if not number:
+            raise KeyError(v)
+        return number
 
     def pre_order_number(self, v: vertices.Vertex):
-        return self._vertex_to_pre[v]
+        return self._number(self._pre, v)
 
     def post_order_number(self, v: vertices.Vertex):
-        return self._vertex_to_post[v]
+        return self._number(self._post, v)
 
     def pre_order_vertex(self, i: int):
-        return self._post_to_vertex[i]
+        return self._pre_order_vertices[i - 1]
 
     def post_order_vertex(self, i: int):
-        return self._post_to_vertex[i]
+        return self._post_order_vertices[i - 1]
 
     def back_edges(self, vertex: vertices.Vertex):
         return self._back_edges[vertex]
@@ -458,59 +648,131 @@ class DepthFirstSearch:
     def has_back_edges(self):
         return sum([len(backedges) for backedges in self._back_edges.values()])
 
-    def _search(self, g, root, forwards):
-        def explore(vertex):
-            nonlocal pre_id
-            pre_id += 1
-            self._vertex_to_pre[vertex] = pre_id
-            self._pre_to_vertex[pre_id] = vertex
-            self._back_edges[vertex] = set()
-
-            for edge in forward_transitions(g, vertex):
-                destination = forward_transition(edge)
-                if destination not in self._vertex_to_pre:
+    def _search(self, compact: CompactGraph, root: int):
+        pre = self._pre
+        post = self._post
+        parent = self._parent
+        pre_order = self._pre_order
+        post_order = self._post_order
+        indptr = compact.forward.indptr
+        targets = compact.forward.targets
+        back_edges = [[] for _ in range(len(compact))]
+
+        # The next edge to explore from each vertex on the stack.
+        cursor = array('l', indptr)
+        pre_order.append(root)
+        pre[root] = 1
+        stack = [root]
+        while stack:
+            i = stack[-1]
+            position = cursor[i]
+            if position < indptr[i + 1]:
+                cursor[i] = position + 1
+                destination = targets[position]
+                if not pre[destination]:
                     # Not yet visited
-                    explore(destination)
-                elif self._vertex_to_pre[vertex] < self._vertex_to_pre[destination]:
+                    parent[destination] = i
+                    pre_order.append(destination)
+                    pre[destination] = len(pre_order)
+                    stack.append(destination)
+                elif pre[i] < pre[destination]:
                     pass
-                elif destination not in self._vertex_to_post:
-                    self._back_edges[destination].add(edge)
-
-            nonlocal post_id
-            post_id += 1
-            self._vertex_to_post[vertex] = post_id
-            self._post_to_vertex[post_id] = vertex
+                elif not post[destination]:
+                    back_edges[destination].append(position)
+            else:
+                stack.pop()
+                post_order.append(i)
+                post[i] = len(post_order)
+
+        for i in pre_order:
+            self._back_edges[self._vertices[i]] = {compact.forward.edges[position] for position in back_edges[i]}
+
+
+class EulerTour:
+    """
+    The walk around a tree that lists a vertex on entry and again after returning from each of its children.  A vertex
+    is an ancestor of another exactly when its first and last appearances enclose those of the other, and the lowest
+    common ancestor of two vertices is the shallowest vertex between their first appearances, found with a sparse
+    table of minima.  Both questions take constant time.
+    """
+
+    __slots__ = ['first', 'last', 'tour', 'depth', '_table']
+
+    def __init__(self, root: vertices.Vertex, children):
+        self.first = {root: 0}
+        self.last = {}
+        self.tour = [root]
+        self.depth = [0]
+        self._table = None
+
+        stack = [(root, iter(children(root)))]
+        while stack:
+            vertex, remaining = stack[-1]
+            child = next(remaining, None)
+            if child is None:
+                stack.pop()
+                self.last[vertex] = len(self.tour) - 1
+                if stack:
+                    self.tour.append(stack[-1][0])
+                    self.depth.append(len(stack) - 1)
+            else:
+                self.first[child] = len(self.tour)
+                self.tour.append(child)
+                self.depth.append(len(stack))
+                stack.append((child, iter(children(child))))
 
-        if forwards:
-            forward_transitions = DirectedGraph.successors
-            forward_transition = edges.Edge.successor
-        else:
-            forward_transitions = DirectedGraph.predecessors
-            forward_transition = edges.Edge.predecessor
+    def __contains__(self, vertex: vertices.Vertex):
+        return vertex in self.first
 
-        pre_id = 0
-        post_id = 0
-        explore(root)
+    def is_ancestor(self, a: vertices.Vertex, v: vertices.Vertex):
+        return self.first[a] <= self.first[v] and self.last[v] <= self.last[a]
+
+    def _shallower(self, left: int, right: int):
+        return left if self.depth[left] <= self.depth[right] else right
+
+    def lca(self, left: vertices.Vertex, right: vertices.Vertex) -> vertices.Vertex:
+        if self._table is None:
+            # Row k holds the position of the shallowest vertex among the 2^k positions starting at each position.
+            self._table = [list(range(len(self.tour)))]
+            span = 1
+            while 2 * span <= len(self.tour):
+                previous = self._table[-1]
+                self._table.append([self._shallower(previous[i], previous[i + span])
+                                    for i in range(len(self.tour) - 2 * span + 1)])
+                span *= 2
+
+        i, j = self.first[left], self.first[right]
+        if i > j:
+            i, j = j, i
+        k = (j - i + 1).bit_length() - 1
+        row = self._table[k]
+        return self.tour[self._shallower(row[i], row[j - (1 << k) + 1])]
 
 
 class Tree(DirectedGraph):
     def __init__(self):
         DirectedGraph.__init__(self)
         self._root = None
+        self._euler_tour = None
+
+    def _changed(self):
+        DirectedGraph._changed(self)
+        self._euler_tour = None
 
     @property
     def root(self):
         return self._root
 
+    def euler_tour(self) -> EulerTour:
+        """
+        The Euler tour from the root, built on first use and discarded whenever the tree changes.
+        """
+        if self._euler_tour is None:
+            self._euler_tour = EulerTour(self.root, lambda v: [e.successor() for e in self.successors(v)])
+        return self._euler_tour
+
     def is_proper_ancestor(self, a: vertices.Vertex, v: vertices.Vertex):
-        if v == self.root:
-            return False
-        else:
-            (predecessor_e,) = self.predecessors(v)
-            if predecessor_e.predecessor() == a:
-                return True
-            else:
-                return self.is_proper_ancestor(a, predecessor_e.predecessor())
+        return a != v and self.euler_tour().is_ancestor(a, v)
 
     def is_ancestor(self, a: vertices.Vertex, v: vertices.Vertex):
         return a == v or self.is_proper_ancestor(a, v)
@@ -532,7 +794,7 @@ class Tarjan(ProgramData):
             self._type = Tarjan.Type.POST
 
     def __compute(self, flow_graph):
-        def link(left: vertices.Vertex, right: vertices.Vertex):
+        def link(left: int, right: int):
             s = right
             while semi[label[right]] < semi[label[child[s]]]:
                 if size[s] + size[child[child[s]]] >= 2 * size[child[s]]:
@@ -549,19 +811,24 @@ class Tarjan(ProgramData):
             if size[left] < 2 * size[right]:
                 s, child[left] = child[left], s
 
-            while s != self._root:
+            while s != root:
                 ancestor[s] = left
                 s = child[s]
 
-        def compress(vertex: vertices.Vertex):
-            if ancestor[ancestor[vertex]] != self._root:
-                compress(ancestor[vertex])
+        def compress(vertex: int):
+            # Walk up to the top of the path first, then compress on the way back down.
+            path = []
+            while ancestor[ancestor[vertex]] != root:
+                path.append(vertex)
+                vertex = ancestor[vertex]
+            while path:
+                vertex = path.pop()
                 if semi[label[ancestor[vertex]]] < semi[label[vertex]]:
                     label[vertex] = label[ancestor[vertex]]
                 ancestor[vertex] = ancestor[ancestor[vertex]]
 
-        def evaluate(vertex: vertices.Vertex):
-            if ancestor[vertex] == self._root:
+        def evaluate(vertex: int):
+            if ancestor[vertex] == root:
                 return label[vertex]
             else:
                 compress(vertex)
@@ -570,90 +837,63 @@ class Tarjan(ProgramData):
                 else:
                     return label[ancestor[vertex]]
 
-        class Bijection(dict):
-            def __setitem__(self, key, value):
-                if key in self:
-                    del self[key]
-                if value in self:
-                    del self[value]
-                dict.__setitem__(self, key, value)
-                dict.__setitem__(self, value, key)
-
-            def __delitem__(self, key):
-                dict.__delitem__(self, self[key])
-                dict.__delitem__(self, key)
-
-        if self._root == flow_graph.entry:
-            forward_transitions = DirectedGraph.successors
-            forward_transition = edges.Edge.successor
-            backward_transitions = DirectedGraph.predecessors
-            backward_transition = edges.Edge.predecessor
-        else:
-            forward_transitions = DirectedGraph.predecessors
-            forward_transition = edges.Edge.predecessor
-            backward_transitions = DirectedGraph.successors
-            backward_transition = edges.Edge.successor
-
-        label = {}
-        parent = {}
-        ancestor = {}
-        child = {}
-        pre_order = Bijection()
-        size = {}
-        bucket = {}
-        size[self._root] = 0
-        ancestor[self._root] = self._root
-        label[self._root] = self._root
-        semi = {}
-
-        def visit(vertex: vertices.Vertex):
-            nonlocal pre_id
-            pre_id += 1
-            semi[vertex] = pre_id
-            pre_order[pre_id] = vertex
-            label[vertex] = vertex
-            ancestor[vertex] = self._root
-            child[vertex] = self._root
+        # Stage 1: Do depth-first search.  Vertices are the indices of the compact graph that it searched, which is
+        # oriented so that forward transitions lead away from the root.
+        dfs = flow_graph.depth_first_search(self._root, self._root == flow_graph.entry)
+        compact = dfs.compact
+
+        n = len(compact)
+        root = compact.index[self._root]
+        label = list(range(n))
+        parent = dfs.parents
+        ancestor = [root] * n
+        child = [root] * n
+        pre_order = [root]
+        size = [0] * n
+        bucket = [[] for _ in range(n)]
+        # Semi-dominator numbers start from 1, so 0 marks an unvisited vertex.
+        semi = [0] * n
+        idom = [root] * n
+
+        for vertex in dfs.pre_order_indices:
+            pre_order.append(vertex)
+            semi[vertex] = len(pre_order) - 1
             size[vertex] = 1
-            bucket[vertex] = set()
-
-            for edge in forward_transitions(flow_graph, vertex):
-                tentacle = forward_transition(edge)
-                if tentacle not in semi:
-                    parent[tentacle] = vertex
-                    visit(tentacle)
-
-        # Stage 1: Do depth-first search
-        pre_id = 0
-        stack = [self._root]
-        visit(self._root)
+        pre_id = len(pre_order) - 1
 
         # Stage 2: Compute semi-dominators
         for i in reversed(range(2, pre_id + 1)):
             # Reverse pre-order
             w = pre_order[i]
 
-            for edge in backward_transitions(flow_graph, w):
-                u = evaluate(backward_transition(edge))
+            for predecessor in compact.predecessors(w):
+                if not semi[predecessor]:
+                    # Unreachable from the root
+                    continue
+                u = evaluate(predecessor)
                 if semi[u] < semi[w]:
                     semi[w] = semi[u]
 
-            bucket[pre_order[semi[w]]].update({w})
+            bucket[pre_order[semi[w]]].append(w)
             link(parent[w], w)
 
             while bucket[parent[w]]:
                 v = bucket[parent[w]].pop()
                 u = evaluate(v)
                 if semi[u] < semi[v]:
-                    self.idom[v] = u
+                    idom[v] = u
                 else:
-                    self.idom[v] = parent[w]
+                    idom[v] = parent[w]
 
         # Stage 3: Set immediate dominators
         for i in range(2, pre_id + 1):
             w = pre_order[i]
-            if self.idom[w] != pre_order[semi[w]]:
-                self.idom[w] = self.idom[self.idom[w]]
+            if idom[w] != pre_order[semi[w]]:
+                idom[w] = idom[idom[w]]
+
+        for i in range(2, pre_id + 1):
+            w = pre_order[i]
+            self.idom[compact.vertices[w]] = compact.vertices[idom[w]]
 
     def dotify(self):
         data = []
@@ -670,20 +910,271 @@ class Tarjan(ProgramData):
         dot.generate(filename, data)
 
 
+class DominatorTree:
+    def __init__(self):
+        self.idom = {}
+        self.level = {}
+        self.children = {}
+        self.root = None
+        self._euler_tour = None
+        self._walked = 0
+
+    def _changed(self):
+        self._euler_tour = None
+        self._walked = 0
+
+    def set_root(self, vertex: vertices.Vertex):
+        self.root = vertex
+        self._changed()
+
+    def add_vertex(self, vertex: vertices.Vertex):
+        self.idom[vertex] = None
+        self.level[vertex] = 0
+        self.children[vertex] = set()
+        self._changed()
+
+    def add_edge(self, predecessor: vertices.Vertex, successor: vertices.Vertex):
+        self.children[predecessor].add(successor)
+        self.idom[successor] = predecessor
+        self.level[successor] = self.level[predecessor] + 1
+        self._changed()
+
+    def remove_edge(self, predecessor: vertices.Vertex, successor: vertices.Vertex):
+        self.children[predecessor].remove(successor)
+        self.idom[successor] = None
+        self._changed()
+
+    def __contains__(self, vertex: vertices.Vertex):
+        return vertex in self.idom
+
+    def _covering_euler_tour(self, left: vertices.Vertex, right: vertices.Vertex):
+        """
+        The Euler tour of the tree if it covers both vertices, otherwise None.  Algorithms that interleave queries
+        with changes to the tree would pay for a new tour after every change, so the tour is only built once the
+        queries since the last change have walked as many steps as there are vertices in the tree.
+        """
+        if self._euler_tour is None and self.root is not None and self._walked > len(self.idom):
+            self._euler_tour = EulerTour(self.root, self.children.__getitem__)
+        if self._euler_tour is not None and left in self._euler_tour and right in self._euler_tour:
+            return self._euler_tour
+        return None
+
+    def is_ancestor(self, a: vertices.Vertex, v: vertices.Vertex):
+        if a not in self.level or v not in self.level:
+            return False
+
+        euler_tour = self._covering_euler_tour(a, v)
+        if euler_tour is not None:
+            return euler_tour.is_ancestor(a, v)
+
+        walked = 0
+        while self.level[v] > self.level[a]:
+            v = self.idom[v]
+            walked += 1
+        self._walked += walked
+        return a == v
+
+    def is_proper_ancestor(self, a: vertices.Vertex, v: vertices.Vertex):
+        return a != v and self.is_ancestor(a, v)
+
+    def do_lca(self, left, right) -> vertices.Vertex:
+        euler_tour = self._covering_euler_tour(left, right)
+        if euler_tour is not None:
+            return euler_tour.lca(left, right)
+
+        walked = 0
+        while self.level[left] != self.level[right]:
+            if self.level[left] > self.level[right]:
+                left = self.idom[left]
+            else:
+                right = self.idom[right]
+            walked += 1
+
+        while left != right:
+            left = self.idom[left]
+            right = self.idom[right]
+            walked += 2
+
+        self._walked += walked
+        return left
+
+    def _set_levels(self, roots):
+        stack = list(roots)
+        while stack:
+            vertex = stack.pop()
+            for child in self.children[vertex]:
+                self.level[child] = self.level[vertex] + 1
+                stack.append(child)
+
+    def __str__(self):
+        assert self.root is not None
+        value = ''
+        queue = deque([self.root])
+        while queue:
+            vertex = queue.popleft()
+            for child in self.children[vertex]:
+                value += 'idom({}) = {}\n'.format(child, vertex)
+                queue.append(child)
+        return value
+
+
+class IncrementalDominatorTree(DominatorTree):
+    """
+    The dominator tree of a flow graph rooted at its entry, or its post-dominator tree when rooted at the exit, kept
+    up to date while edges are added to and removed from the flow graph.
+
+    Inserting an edge re-parents the affected vertices under the nearest common dominator of its end points; they are
+    found by a search from the target of the edge that visits vertices deepest in the tree first.  Removing an edge
+    can only affect vertices dominated by the old immediate dominator of its target, so only their dominators are
+    recomputed.  Either update gives up, returning False, when vertices become reachable or unreachable, and the tree
+    must then be rebuilt.
+    """
+
+    def __init__(self, flow_graph: 'FlowGraph', root: vertices.Vertex):
+        DominatorTree.__init__(self)
+        self._flow_graph = flow_graph
+        self._forwards = root == flow_graph.entry
+        tarjan = Tarjan(flow_graph, root)
+        self.set_root(root)
+        # Every dominator precedes the vertices it dominates in pre-order, so parents are always added first.
+        for vertex in flow_graph.depth_first_search(root, self._forwards).pre_order():
+            self.add_vertex(vertex)
+            if vertex != root:
+                self.add_edge(tarjan.idom[vertex], vertex)
+
+    def _successors(self, vertex: vertices.Vertex):
+        if self._forwards:
+            return [edge.successor() for edge in self._flow_graph.successors(vertex)]
+        else:
+            return [edge.predecessor() for edge in self._flow_graph.predecessors(vertex)]
+
+    def _predecessors(self, vertex: vertices.Vertex):
+        if self._forwards:
+            return [edge.predecessor() for edge in self._flow_graph.predecessors(vertex)]
+        else:
+            return [edge.successor() for edge in self._flow_graph.successors(vertex)]
+
+    def _orient(self, edge: edges.Edge):
+        if self._forwards:
+            return edge.predecessor(), edge.successor()
+        else:
+            return edge.successor(), edge.predecessor()
+
+    def insert_edge(self, edge: edges.Edge) -> bool:
+        """
+        Updates the tree after the edge has been added to the flow graph.
+        """
+        source, destination = self._orient(edge)
+        if source not in self:
+            return True
+        if destination not in self:
+            return False
+
+        nca = self.do_lca(source, destination)
+        depth = self.level[nca] + 1
+        if self.level[destination] <= depth:
+            return True
+
+        # A vertex is affected if it is deeper than the child of the common dominator and reachable from the
+        # destination through vertices that are at least as deep as itself.
+        affected = [destination]
+        visited = {destination}
+        queue = [(-self.level[destination], destination.id_, destination)]
+        while queue:
+            _, _, top = heappop(queue)
+            level = self.level[top]
+            stack = [top]
+            while stack:
+                vertex = stack.pop()
+                for successor in self._successors(vertex):
+                    if successor not in visited and self.level[successor] > depth:
+                        visited.add(successor)
+                        if self.level[successor] > level:
+                            stack.append(successor)
+                        else:
+                            affected.append(successor)
+                            heappush(queue, (-self.level[successor], successor.id_, successor))
+
+        for vertex in affected:
+            self.remove_edge(self.idom[vertex], vertex)
+            self.add_edge(nca, vertex)
+        self._set_levels(affected)
+        return True
+
+    def delete_edge(self, edge: edges.Edge) -> bool:
+        """
+        Updates the tree after the edge has been removed from the flow graph.
+        """
+        source, destination = self._orient(edge)
+        if source not in self or destination not in self or destination == self.root:
+            return True
+
+        top = self.idom[destination]
+        below = [top]
+        for vertex in below:
+            below.extend(self.children[vertex])
+        members = set(below)
+
+        # Every path into the subtree goes through its top, so searching inside the subtree alone must reach all of
+        # it unless some vertex is now unreachable.
+        post_order = []
+        visited = {top}
+        stack = [(top, iter(self._successors(top)))]
+        while stack:
+            vertex, successors = stack[-1]
+            for successor in successors:
+                if successor in members and successor not in visited:
+                    visited.add(successor)
+                    stack.append((successor, iter(self._successors(successor))))
+                    break
+            else:
+                stack.pop()
+                post_order.append(vertex)
+
+        if len(post_order) != len(members):
+            return False
+
+        post = {vertex: i for i, vertex in enumerate(post_order)}
+        idom = {top: top}
+
+        def intersect(left, right):
+            while left != right:
+                while post[left] < post[right]:
+                    left = idom[left]
+                while post[right] < post[left]:
+                    right = idom[right]
+            return left
+
+        changed = True
+        while changed:
+            changed = False
+            for vertex in reversed(post_order[:-1]):
+                new_idom = None
+                for predecessor in self._predecessors(vertex):
+                    if predecessor in idom:
+                        new_idom = predecessor if new_idom is None else intersect(predecessor, new_idom)
+                if idom.get(vertex) != new_idom:
+                    idom[vertex] = new_idom
+                    changed = True
+
+        moved = [vertex for vertex in below[1:] if idom[vertex] != self.idom[vertex]]
+        for vertex in moved:
+            self.remove_edge(self.idom[vertex], vertex)
+            self.add_edge(idom[vertex], vertex)
+        self._set_levels([top])
+        return True
+
+
 class DominatorGraph(FlowGraph):
     def __init__(self, pre_dominator_tree: Tarjan, post_dominator_tree: Tarjan):
         FlowGraph.__init__(self, pre_dominator_tree.program, pre_dominator_tree.name)
 
-        for v in pre_dominator_tree:
-            self.add_vertex(v)
-
-        for v in pre_dominator_tree:
-            for edge in pre_dominator_tree.successors(v):
-                self.add_edge(edges.Edge(v, edge.successor()))
-
-        for v in post_dominator_tree:
-            for edge in post_dominator_tree.successors(v):
-                self.add_edge(edges.Edge(v, edge.successor()))
+        for tree in [pre_dominator_tree, post_dominator_tree]:
+            for v, dominator in tree.idom.items():
+                for w in [dominator, v]:
+                    if w not in self:
+                        self.add_vertex(w)
+                self.add_edge(edges.Edge(dominator, v))
 
     def dotify(self):
         data = []
@@ -726,55 +1217,52 @@ class DominanceFrontiers:
 
 class StrongComponents:
     def __init__(self, directed_graph: DirectedGraph, origin: vertices.Vertex = None):
+        compact = directed_graph.compact()
+        self._compact = compact
         self._stack = []
-        self._pre_order = {}
-        self._low_link = {}
-        self._on_stack = {}
-        self._vertex_to_scc = {}
+        # Pre-order numbers start from 1, so 0 marks an unvisited vertex.
+        self._pre_order = array('l', [0]) * len(compact)
+        self._low_link = array('l', [0]) * len(compact)
+        self._on_stack = bytearray(len(compact))
         self._singletons = set()
         self._non_trivial_sccs = set()
 
-        for vertex in directed_graph:
-            self._pre_order[vertex] = 0
-            self._low_link[vertex] = 0
-            self._on_stack[vertex] = False
-            self._vertex_to_scc[vertex] = None
-
         self._pre_id = 0
         if origin:
-            self._explore(directed_graph, origin)
+            self._explore(compact.index[origin])
         else:
-            for vertex in directed_graph:
-                if self._pre_order[vertex] == 0:
-                    self._explore(directed_graph, vertex)
-
-    def _explore(self, directed_graph: DirectedGraph, vertex: vertices.Vertex):
+            for i in range(len(compact)):
+                if self._pre_order[i] == 0:
+                    self._explore(i)
+
+    def _explore(self, i: int):
+        pre_order = self._pre_order
+        low_link = self._low_link
+        on_stack = self._on_stack
         self._pre_id += 1
-        self._pre_order[vertex] = self._pre_id
-        self._low_link[vertex] = self._pre_id
-        self._on_stack[vertex] = True
-        self._stack.append(vertex)
-
-        for edge in directed_graph.successors(vertex):
-            successor = edge.successor()
-
-            if self._pre_order[successor] == 0:
-                self._explore(directed_graph, edge.successor())
-                self._low_link[vertex] = min(self._low_link[vertex], self._low_link[successor])
-            elif self._on_stack[successor]:
-                self._low_link[vertex] = min(self._low_link[vertex], self._pre_order[successor])
-
-        if self._low_link[vertex] == self._pre_order[vertex]:
+        pre_order[i] = self._pre_id
+        low_link[i] = self._pre_id
+        on_stack[i] = True
+        self._stack.append(i)
+
+        successors = self._compact.successors(i)
+        for successor in successors:
+            if pre_order[successor] == 0:
+                self._explore(successor)
+                low_link[i] = min(low_link[i], low_link[successor])
+            elif on_stack[successor]:
+                low_link[i] = min(low_link[i], pre_order[successor])
+
+        if low_link[i] == pre_order[i]:
             scc = []
             done = False
             while not done:
                 z = self._stack.pop()
-                self._on_stack[z] = False
-                scc.append(z)
-                self._vertex_to_scc[z] = scc
-                done = z == vertex
+                on_stack[z] = False
+                scc.append(self._compact.vertices[z])
+                done = z == i
 
-            if len(scc) == 1 and not directed_graph.has_edge(vertex, vertex):
+            if len(scc) == 1 and i not in successors:
                 self._singletons.update(scc)
             else:
                 self._non_trivial_sccs.add(frozenset(scc))
@@ -787,73 +1275,62 @@ class StrongComponents:
         for scc in self._non_trivial_sccs:
             yield scc
 
+    def __iter__(self):
+        for v in self._singletons:
+            yield frozenset([v])
+        yield from self.non_trivial()
+
 
 class Cooper(Tree):
     def __init__(self, g: FlowGraph, entry: vertices.Vertex):
         Tree.__init__(self)
-        idom = self._solve(g, entry)
-
-    def _intersect(self, dfs, idom, b1, b2):
-        finger1 = dfs.post_order_number(b1)
-        finger2 = dfs.post_order_number(b2)
-
-        while finger1 != finger2:
-            while finger1 < finger2:
-                n = idom[dfs.post_order_vertex(finger1)]
-                finger1 = dfs.post_order_number(n)
-
-            while finger2 < finger1:
-                n = idom[dfs.post_order_vertex(finger2)]
-                finger2 = dfs.post_order_number(n)
-
-        return dfs.post_order_vertex(finger1)
+        self.idom = self._solve(g, entry)
 
     def _solve(self, g: FlowGraph, entry: vertices.Vertex):
-        if entry == g.entry:
-            forward_transitions = DirectedGraph.successors
-            forward_transition = edges.Edge.successor
-            backward_transitions = DirectedGraph.predecessors
-            backward_transition = edges.Edge.predecessor
-        else:
-            forward_transitions = DirectedGraph.predecessors
-            forward_transition = edges.Edge.predecessor
-            backward_transitions = DirectedGraph.successors
-            backward_transition = edges.Edge.successor
-
-        dfs = DepthFirstSearch(g, entry, entry == g.entry)
-        idom = {}
-        for vertex in g:
-            idom[vertex] = None
-        idom[entry] = entry
+        def intersect(b1: int, b2: int):
+            while b1 != b2:
+                while post[b1] < post[b2]:
+                    b1 = idom[b1]
+
+                while post[b2] < post[b1]:
+                    b2 = idom[b2]
+            return b1
+
+        # Vertices are the indices of the compact graph, oriented so that forward transitions lead away from the entry.
+        dfs = g.depth_first_search(entry, entry == g.entry)
+        compact = dfs.compact
+        post = [0] * len(compact)
+        for i, vertex in enumerate(dfs.post_order_indices, start=1):
+            post[vertex] = i
+        order = list(reversed(dfs.post_order_indices[:-1]))
+
+        # An immediate dominator of -1 means none has been found yet.
+        idom = [-1] * len(compact)
+        idom[compact.index[entry]] = compact.index[entry]
 
         iteration = 0
         changed = True
         while changed:
             iteration += 1
             changed = False
-            for vertex in reversed(dfs.post_order()[:-1]):
-                chosen = None
-                i = 0
-                while not chosen and i < len(backward_transitions(g, vertex)):
-                    edge = backward_transitions(g, vertex)[i]
-                    if idom[backward_transition(edge)]:
-                        chosen = edge
-                    i += 1
-
-                if chosen:
-                    current_idom = backward_transition(chosen)
-                    for edge in backward_transitions(g, vertex):
-                        if edge != chosen and idom[backward_transition(edge)]:
-                            current_idom = self._intersect(dfs, idom, backward_transition(edge), current_idom)
-
-                    if current_idom != idom[vertex]:
-                        idom[vertex] = current_idom
-                        changed = True
+            for vertex in order:
+                current_idom = -1
+                for predecessor in compact.predecessors(vertex):
+                    if idom[predecessor] >= 0:
+                        if current_idom < 0:
+                            current_idom = predecessor
+                        else:
+                            current_idom = intersect(predecessor, current_idom)
+
+                if current_idom >= 0 and current_idom != idom[vertex]:
+                    idom[vertex] = current_idom
+                    changed = True
 
             if iteration == 1 and not dfs.has_back_edges():
                 changed = False
 
-        return idom
+        return {vertex: compact.vertices[idom[i]] if idom[i] >= 0 else None
+                for i, vertex in enumerate(compact.vertices)}
 
 
 class LoopNests(FlowGraph):
@@ -871,33 +1348,35 @@ class LoopNests(FlowGraph):
         (self.exit,) = [loop for loop in self if ppg.exit in loop]
 
     def __discover_loop_bodies(self, ppg):
-        def do_search(v):
+        def do_search(v: int):
             visited.add(v)
             if v != header:
-                for e in ppg.predecessors(v):
-                    where_next = containment[e.predecessor()]
+                for predecessor in compact.predecessors(v):
+                    where_next = containment[predecessor]
                     if where_next not in visited:
                         do_search(where_next)
             order.append(v)
 
-        containment = {v: v for v in ppg}
-        data = {v: None for v in ppg}
-        dfs = DepthFirstSearch(ppg, ppg.entry)
+        # The searches run on the indices of the compact graph; -1 means no reachability information.
+        compact = ppg.compact()
+        containment = list(range(len(compact)))
+        data = [-1] * len(compact)
+        dfs = ppg.depth_first_search(ppg.entry)
         for v in reversed(dfs.pre_order()):
-            back_edges = [e for e in ppg.predecessors(v) if e in dfs.back_edges]
+            back_edges = list(dfs.back_edges(v))
             if back_edges:
                 # Sort back edges according to their post-order numbering, then reverse, so that we visit all successors
                 # of a vertex before the vertex itself
                 back_edges.sort(key=lambda e: dfs.post_order_number(e.predecessor()), reverse=True)
                 order = []
                 visited = set()
-                header = v
+                header = compact.index[v]
                 tails = set()
                 for e in back_edges:
                     if not ppg.pre_dominator_tree().is_ancestor(e.successor(), e.predecessor()):
                         messages.error_message(
                             "Edge {} in '{}' identifies an irreducible loop".format(str(e.predecessor()), ppg.name))
-                    do_search(e.predecessor())
+                    do_search(compact.index[e.predecessor()])
                     tails.add(e.predecessor())
 
                 for w in reversed(order):
@@ -907,25 +1386,26 @@ class LoopNests(FlowGraph):
                     if w != header:
                         # Propagate reachability information concerning loop tails to immediate predecessors.
                         # We ignore the loop header so that the information does not spill out to enclosing loop.
-                        for e in ppg.predecessors(w):
-                            data[containment[e.predecessor()]] = data[w]
+                        for predecessor in compact.predecessors(w):
+                            data[containment[predecessor]] = data[w]
 
                 loop_vertices = {}
                 for w in order:
+                    vertex = compact.vertices[w]
                     # Do not add an inner loop header to the partition for this header.
-                    if w not in [loop.header for loop in self._loops]:
+                    if vertex not in [loop.header for loop in self._loops]:
                         if data[w] not in loop_vertices:
-                            loop = vertices.LoopBody(vertices.Vertex.get_vertex_id(), header)
+                            loop = vertices.LoopBody(vertices.Vertex.get_vertex_id(), v)
                             loop_vertices[data[w]] = loop
                             self.add_vertex(loop)
-                            self._headers[header] = loop
+                            self._headers[v] = loop
                             for tail in tails:
                                 self._tails[tail] = loop
                         loop = loop_vertices[data[w]]
-                        loop.append(w)
+                        loop.add(vertex)
 
                 # Clear the reachability information in readiness for enclosing loops.
-                data[header] = None
+                data[header] = -1
 
     def __model_control_flow_into_and_out_of_loop(self, ppg):
         transitions = {}
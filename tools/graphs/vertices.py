@@ -32,6 +32,13 @@ class VertexPool:
             self._min = min(self._min, v.id_)
         self._allocation[v.id_] = v
 
+    def reserve(self, id_: int):
+        # Keeps allocated IDs clear of an ID that is registered later.
+        if id_ > VertexPool.CUTOFF:
+            self._max = max(self._max, id_)
+        elif id_ < VertexPool.CUTOFF:
+            self._min = min(self._min, id_)
+
     def deregister(self, v):
         del self._allocation[v.id_]
 
@@ -370,9 +377,10 @@ class SuperBlock(Vertex, list):
 
 
 class LoopBody(Vertex, set):
-    def __init__(self, id_):
+    def __init__(self, id_, header=None):
         Vertex.__init__(self, id_)
         set.__init__(self)
+        self.header = header
 
 
 class Sequence(Vertex):
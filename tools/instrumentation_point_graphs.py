@@ -5,24 +5,26 @@ import sys
 import threading
 
 from graphs import graphs
-from system import (programs, database, calculations)
+from system import (programs, cache, database, calculations, solvers)
 from utils import messages
 
 
 def main(**kwargs):
-    messages.verbose_message("Reading program from '{}'".format(kwargs['filename']))
-    prog = programs.IO.read(kwargs['filename'])
+    messages.verbose_message("Reading program from '{}'".format(kwargs['program']))
+    prog = programs.IO.read(kwargs['program'], lazy=True)
     prog.cleanup()
 
     failures = set()
-    with database.Database(kwargs['database']) as db:
+    with cache.Cache(prog) as store, database.create(kwargs['database']) as db:
         messages.verbose_message("Using database '{}'".format(kwargs['database']))
         for subprogram in prog:
             if not kwargs['subprograms'] or (kwargs['subprograms'] and subprogram.name in kwargs['subprograms']):
                 subprogram.cfg.dotify()
-                ppg = graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg)
+                ppg = store.get(subprogram.name,
+                                'ppg',
+                                lambda: graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg))
                 ppg.dotify()
-                lnt = graphs.LoopNests(ppg)
+                lnt = store.get(subprogram.name, 'lnt', lambda: graphs.LoopNests(ppg))
                 lnt.dotify()
 
                 ilp_for_ppg = calculations.create_ilp_for_program_point_graph(ppg, lnt, db)
@@ -56,7 +58,7 @@ def parse_the_command_line():
                         required=True)
 
     parser.add_argument('--database',
-                        help='use the data in this file',
+                        help='use the data in this file, either a database or a .npz archive from database_generator.py',
                         required=True)
 
     parser.add_argument('--repeat',
@@ -70,12 +72,21 @@ def parse_the_command_line():
                         help='only do the calculation for these subprograms',
                         metavar='<NAME>')
 
+    parser.add_argument('--solver',
+                        help='choose the backend that solves integer linear programs',
+                        type=solvers.Backend,
+                        choices=list(solvers.Backend),
+                        default=solvers.Backend.lp_solve.name)
+
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     assert sys.version_info >= (3, 0), 'Script requires Python 3.0 or greater to run'
-    assert shutil.which('lp_solve', mode=os.X_OK), 'Script requires lp_solve to be in your path'
     threading.stack_size(2 ** 26)
     sys.setrecursionlimit(2 ** 20)
-    main(**vars(parse_the_command_line()))
+    kwargs = vars(parse_the_command_line())
+    if kwargs['solver'] == solvers.Backend.lp_solve:
+        assert shutil.which('lp_solve', mode=os.X_OK), 'Script requires lp_solve to be in your path'
+    solvers.set_default(kwargs['solver'])
+    main(**kwargs)
@@ -1,7 +1,7 @@
 from argparse import Action, ArgumentError, ArgumentParser, Namespace
 from graphs import edges, graphs, vertices
 from low_level import instructions
-from random import choice, choices, getrandbits, random, randint, sample, shuffle
+from random import choice, choices, getrandbits, random, randint, sample, seed, shuffle
 from sys import setrecursionlimit
 from system import programs
 from threading import stack_size
@@ -171,7 +171,7 @@ class LoopBody:
 
     def add_backedges(self, cfg: graphs.ControlFlowGraph):
         has_backedges = randint(0, len(self._entries))
-        chosen_headers = sample(self._entries, has_backedges)
+        chosen_headers = sample(list(self._entries), has_backedges)
         candidate_tails = [vertex for vertex in self._vertices if vertex not in self._entries]
         if candidate_tails:
             for header_vertex in chosen_headers:
@@ -204,7 +204,7 @@ def create_loop_hierarchy(total_loops: int, nesting_depth: int, number_of_vertic
 
     # Connect loops, thus creating a hierarchy.
     vertex_to_level = {vertex: 0 for vertex in lnt}
-    (root_vertex,) = sample(vertex_to_level.keys(), 1)
+    (root_vertex,) = sample(list(vertex_to_level.keys()), 1)
     parent_vertex = root_vertex
     for vertex in lnt:
         if vertex != root_vertex:
@@ -515,6 +515,9 @@ def add_instructions(program: programs.Program):
 
 
 def main(args: Namespace):
+    if args.seed is not None:
+        seed(args.seed)
+
     if args.vertices < args.loops * 2:
         error_message('The number of vertices in a control flow graph must be at least twice the number of loops')
 
@@ -606,6 +609,12 @@ def parse_the_command_line():
                         help='do not add instructions to basic blocks',
                         default=False)
 
+    parser.add_argument('--seed',
+                        type=int,
+                        help='seed the random number generator so that programs can be reproduced',
+                        metavar='<INT>',
+                        default=None)
+
     return parser.parse_args()
 
 
@@ -3,8 +3,7 @@ from graphs import dominators, edges, graphs, vertices
 from collections import deque
 from miscellaneous.helpful import error_message
 from multiprocessing import Manager
-from numpy import percentile
-from random import sample, shuffle
+from random import sample
 from sys import setrecursionlimit
 from system import programs
 from threading import stack_size
@@ -25,35 +24,15 @@ def loop_body(cfg: graphs.ControlFlowGraph,
                 loop_body(cfg, header, where_next, containment, visited)
 
 
-def compute_visit_times(tree: graphs.Tree, vertex: vertices.Vertex, start, finish, clock: int):
-    start[vertex] = clock
-    clock += 1
-
-    for edge in tree.successors(vertex):
-        clock = compute_visit_times(tree, edge.successor(), start, finish, clock)
-
-    finish[vertex] = clock
-    clock += 1
-    return clock
-
-
-def is_ancestor(left: vertices.Vertex, right: vertices.Vertex, start, finish):
-    return start[left] <= start[right] and finish[right] <= finish[left]
-
-
 def ramalingam_loops(cfg: graphs.ControlFlowGraph):
     containment = {}
     for vertex in cfg:
         containment[vertex] = vertex
 
-    tarjan_tree = graphs.Tarjan(cfg, cfg.entry)
-    start = {}
-    finish = {}
-    clock = 0
-    compute_visit_times(tarjan_tree, tarjan_tree.root, start, finish, clock)
+    dominator_tree = cfg.pre_dominator_tree()
 
     loop_nest = graphs.LoopNest()
-    dfs = graphs.DepthFirstSearch(cfg, cfg.entry)
+    dfs = cfg.depth_first_search(cfg.entry)
     for vertex in reversed(dfs.pre_order()):
         back_edges = dfs.back_edges(vertex)
         if back_edges:
@@ -62,7 +41,7 @@ def ramalingam_loops(cfg: graphs.ControlFlowGraph):
             loop_nest.add_to_body(vertex, loop_id)
             visited = {}
             for edge in back_edges:
-                if is_ancestor(edge.successor(), edge.predecessor(), start, finish):
+                if dominator_tree.is_ancestor(edge.successor(), edge.predecessor()):
                     loop_body(cfg, vertex, edge.predecessor(), containment, visited)
 
             for other in visited:
@@ -374,6 +353,7 @@ def t0_t1_t2_dominators(cfg: graphs.ControlFlowGraph, entry: vertices.Vertex):
     # print('reduce', u-t)
     # tree.dotify('{}.t0_t1_t2'.format(cfg.name))
     # verify(cfg, tree)
+    return idom
 
 
 class AuxiliaryVertex:
@@ -671,7 +651,7 @@ def reduce_by_t0(auxiliary_origin: AuxiliaryVertex,
                     if vertex_to_component[vertex_id] != vertex_to_component[predecessor_id]:
                         scc_entries.add(vertex_id)
 
-            (representative_id,) = sample(scc_entries, 1)
+            (representative_id,) = sample(list(scc_entries), 1)
             auxiliary_representative = auxiliary_vertices[representative_id]
 
             new_predecessors = {}
@@ -788,14 +768,6 @@ def betts(cfg: graphs.ControlFlowGraph, origin: vertices.Vertex):
     return idom
 
 
-def strip_outliers(data: List[float]):
-    q25, q75 = percentile(data, 25), percentile(data, 75)
-    iqr = q75 - q25
-    cut_off = iqr * 1.5
-    lower, upper = q25 - cut_off, q75 + cut_off
-    return [x for x in data if lower <= x <= upper]
-
-
 def main(filename: str, subprogram_names: List[str], repeat: int, verify: bool):
     program = programs.IO.read(filename)
     program.cleanup()
@@ -814,36 +786,6 @@ def main(filename: str, subprogram_names: List[str], repeat: int, verify: bool):
             subprogram.cfg.shuffle_edges()
         dominators.offline(subprogram.cfg, subprogram.cfg.entry)
 
-    if False:
-        for subprogram in program:
-            subprogram.cfg.shuffle_edges()
-
-            print('{}: |V|={}  |E|={}'.format(subprogram.cfg.name,
-                                              subprogram.cfg.number_of_vertices(),
-                                              subprogram.cfg.number_of_edges()))
-            algorithms = [dominators.offline, graphs.Tarjan, graphs.Cooper]
-            total_time = {alg: [] for alg in algorithms}
-
-            for i in range(repeat):
-                subprogram.cfg.shuffle_edges()
-                mutated = algorithms[:]
-                shuffle(mutated)
-
-                for alg in mutated:
-                    begin = time()
-                    idom = alg(subprogram.cfg, subprogram.cfg.entry)
-                    end = time()
-                    total_time[alg].append(end - begin)
-                    if verify and alg == dominators.offline:
-                        verify_immediate_dominators(subprogram.cfg, idom)
-
-            for alg in algorithms:
-                # print('  '.join(str(t) for t in sorted(total_time[alg])))
-                # total_time[alg] = strip_outliers(total_time[alg])
-                print(alg.__name__.capitalize(), '{:.8f}'.format(sum(total_time[alg]) / len(total_time[alg])))
-
-            print()
-
 
 def parse_command_line():
     parser = ArgumentParser(description='Compute immediate dominators')
@@ -1,130 +1,242 @@
 import argparse
+import multiprocessing
 import os
 import shutil
 import sys
 import threading
 import typing
+from concurrent.futures import ProcessPoolExecutor
 
 from graphs import graphs
-from system import (programs, database, calculations)
+from system import (programs, cache, database, calculations, solvers)
 from utils import messages
 
 
+class Measurement:
+    """
+    The outcome of the calculations on one subprogram.  The PPG and super-block ILPs must agree on the WCET; if they do
+    not, the ILPs are kept for the report, otherwise the WCET and the construction and solve times of every repetition
+    are.
+    """
+
+    __slots__ = ['name', 'failure', 'wcet', 'ppg_construction_times', 'ppg_solve_times', 'ppg_size',
+                 'super_construction_times', 'super_solve_times', 'super_size']
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failure = None
+        self.wcet = None
+        self.ppg_construction_times = []
+        self.ppg_solve_times = []
+        self.ppg_size = (0, 0)
+        self.super_construction_times = []
+        self.super_solve_times = []
+        self.super_size = (0, 0)
+
+
+def analyse(the_program:            programs.Program,
+            subprogram:             programs.Subprogram,
+            store:                  cache.Cache,
+            db:                     database.Database,
+            repeat:                 int,
+            fold_optimisation:      bool,
+            dominator_optimisation: bool) -> Measurement:
+    measurement = Measurement(subprogram.name)
+    subprogram.cfg.dotify()
+    ppg = store.get(subprogram.name,
+                    'ppg',
+                    lambda: graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg))
+    ppg.dotify()
+    lnt = store.get(subprogram.name, 'lnt', lambda: graphs.LoopNests(ppg))
+    lnt.dotify()
+
+    ilp_for_ppg = calculations.create_ilp_for_program_point_graph(ppg, lnt, db)
+    ilp_for_ppg.solve('{}.{}.ppg.ilp'.format(the_program.basename(), ppg.name))
+
+    ilp_for_super = calculations.create_ilp_for_super_block_graph(ppg,
+                                                                  lnt,
+                                                                  db,
+                                                                  fold_optimisation,
+                                                                  dominator_optimisation)
+    ilp_for_super.solve('{}.{}.super.ilp'.format(the_program.basename(), ppg.name))
+
+    if ilp_for_ppg.wcet != ilp_for_super.wcet:
+        measurement.failure = (str(ilp_for_ppg), str(ilp_for_super))
+        return measurement
+    measurement.wcet = ilp_for_ppg.wcet
+
+    for i in range(0, repeat):
+        ilp_for_ppg = calculations.create_ilp_for_program_point_graph(ppg, lnt, db)
+        ilp_for_ppg.solve('{}.{}.ppg.ilp'.format(the_program.basename(), ppg.name))
+        measurement.ppg_construction_times.append(ilp_for_ppg.construction_time)
+        measurement.ppg_solve_times.append(ilp_for_ppg.solve_time)
+
+        ilp_for_super = calculations.create_ilp_for_super_block_graph(ppg,
+                                                                      lnt,
+                                                                      db,
+                                                                      fold_optimisation,
+                                                                      dominator_optimisation)
+        ilp_for_super.solve('{}.{}.{}.super.ilp'.format(the_program.basename(), i, ppg.name))
+        measurement.super_construction_times.append(ilp_for_super.construction_time)
+        measurement.super_solve_times.append(ilp_for_super.solve_time)
+
+    measurement.ppg_size = (ilp_for_ppg.number_of_variables(), ilp_for_ppg.number_of_constraints())
+    measurement.super_size = (ilp_for_super.number_of_variables(), ilp_for_super.number_of_constraints())
+    return measurement
+
+
+def report(measurement: Measurement, repeat: int):
+    messages.verbose_message('>>>>>', measurement.name)
+    if measurement.failure:
+        ppg_ilp, super_ilp = measurement.failure
+        messages.verbose_message('FAILED')
+        messages.verbose_message(ppg_ilp)
+        messages.verbose_message(super_ilp, new_lines=2)
+        return
+
+    messages.verbose_message('PASSED')
+    messages.verbose_message('wcet={}'.format(measurement.wcet))
+    ppg_solve_time = sum(measurement.ppg_solve_times)/repeat
+    ppg_construction_time = sum(measurement.ppg_construction_times)/repeat
+    super_solve_time = sum(measurement.super_solve_times)/repeat
+    super_construction_time = sum(measurement.super_construction_times)/repeat
+
+    factor = ppg_solve_time/super_solve_time
+    if factor > 1:
+        solve_message = '{:.2}X speed up'.format(factor)
+    else:
+        solve_message = '{:.2}X slow down'.format(1/factor)
+
+    factor = (ppg_construction_time+ppg_solve_time)/(super_solve_time+super_construction_time)
+    if factor > 1:
+        total_message = '{:.2}X speed up'.format(factor)
+    else:
+        total_message = '{:.2}X slow down'.format(1 / factor)
+
+    messages.verbose_message('solve={}'.format(solve_message))
+    messages.verbose_message('total={}'.format(total_message))
+    messages.verbose_message('solve={:.5f} '
+                             'construction={:.5f} '
+                             'total={:.5f} '
+                             'variables={} '
+                             'constraints={} '
+                             '[PPG]'.format(ppg_solve_time,
+                                            ppg_construction_time,
+                                            ppg_solve_time + ppg_construction_time,
+                                            *measurement.ppg_size))
+    messages.verbose_message('solve={:.5f} '
+                             'construction={:.5f} '
+                             'total={:.5f} '
+                             'variables={} '
+                             'constraints={} '
+                             '[SUPER]'.format(super_solve_time,
+                                              super_construction_time,
+                                              super_solve_time + super_construction_time,
+                                              *measurement.super_size))
+
+
+# The state of a worker process, set up once by initialise_worker.
+_worker = None
+
+
+def initialise_worker(program_filename:       str,
+                      database_filename:      str,
+                      backend:                solvers.Backend,
+                      repeat:                 int,
+                      fold_optimisation:      bool,
+                      dominator_optimisation: bool):
+    # Workers are spawned rather than forked so that each reads the program into an empty vertex ID space.
+    global _worker
+    sys.setrecursionlimit(2 ** 20)
+    solvers.set_default(backend)
+    the_program = programs.IO.read(program_filename, lazy=True)
+    the_program.cleanup()
+    # The parent has already filled the cache, so workers only read it.
+    store = cache.Cache(the_program)
+    store.load()
+    with database.create(database_filename) as db:
+        db.load_into_memory()
+    _worker = (the_program, store, db, repeat, fold_optimisation, dominator_optimisation)
+
+
+def analyse_in_worker(subprogram_name: str) -> Measurement:
+    the_program, store, db, repeat, fold_optimisation, dominator_optimisation = _worker
+    return analyse(the_program,
+                   the_program[subprogram_name],
+                   store,
+                   db,
+                   repeat,
+                   fold_optimisation,
+                   dominator_optimisation)
+
+
 def main(program_filename:       str,
          database_filename:      str,
          repeat:                 int,
          subprogram_names:       typing.List[str],
          fold_optimisation:      bool,
-         dominator_optimisation: bool):
-    the_program = programs.IO.read(program_filename)
+         dominator_optimisation: bool,
+         jobs:                   int = 1) -> typing.List[Measurement]:
+    the_program = programs.IO.read(program_filename, lazy=True)
     the_program.cleanup()
 
-    failures = set()
-    with database.Database(database_filename) as db:
+    with cache.Cache(the_program) as store, database.create(database_filename) as db:
         messages.verbose_message("Using database '{}'".format(database_filename))
         db.load_into_memory()
 
         analysable_subprograms = [subprogram for subprogram in the_program
                                   if not subprogram_names or (subprogram_names and subprogram.name in subprogram_names)]
+
+        all_measurements = []
         all_ppg_solve_times = []
         all_super_solve_times = []
-        for subprogram in analysable_subprograms:
-            subprogram.cfg.dotify()
-            ppg = graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg)
-            ppg.dotify()
-            lnt = graphs.LoopNests(ppg)
-            lnt.dotify()
-
-            ilp_for_ppg = calculations.create_ilp_for_program_point_graph(ppg, lnt, db)
-            ilp_for_ppg.solve('{}.{}.ppg.ilp'.format(the_program.basename(), ppg.name))
-
-            ilp_for_super = calculations.create_ilp_for_super_block_graph(ppg,
-                                                                          lnt,
-                                                                          db,
-                                                                          fold_optimisation,
-                                                                          dominator_optimisation)
-            ilp_for_super.solve('{}.{}.super.ilp'.format(the_program.basename(), ppg.name))
-
-            messages.verbose_message('>>>>>', ppg.name)
-            if ilp_for_ppg.wcet != ilp_for_super.wcet:
-                messages.verbose_message('FAILED')
-                messages.verbose_message(ilp_for_ppg)
-                messages.verbose_message(ilp_for_super, new_lines=2)
-                failures.add(ppg.name)
-            else:
-                messages.verbose_message('PASSED')
-                ppg_construction_times = []
-                ppg_solve_times = []
-                super_construction_times = []
-                super_solve_times = []
-
-                for i in range(0, repeat):
-                    ilp_for_ppg = calculations.create_ilp_for_program_point_graph(ppg, lnt, db)
-                    ilp_for_ppg.solve('{}.{}.ppg.ilp'.format(the_program.basename(), ppg.name))
-                    ppg_construction_times.append(ilp_for_ppg.construction_time)
-                    ppg_solve_times.append(ilp_for_ppg.solve_time)
-
-                    ilp_for_super = calculations.create_ilp_for_super_block_graph(ppg,
-                                                                                  lnt,
-                                                                                  db,
-                                                                                  fold_optimisation,
-                                                                                  dominator_optimisation)
-                    ilp_for_super.solve('{}.{}.{}.super.ilp'.format(the_program.basename(), i, ppg.name))
-                    super_construction_times.append(ilp_for_super.construction_time)
-                    super_solve_times.append(ilp_for_super.solve_time)
-
-                ppg_solve_time = sum(ppg_solve_times)/repeat
-                ppg_construction_time = sum(ppg_construction_times)/repeat
-                super_solve_time = sum(super_solve_times)/repeat
-                super_construction_time = sum(super_construction_times)/repeat
-
-                all_ppg_solve_times.extend(ppg_solve_times)
-                all_super_solve_times.extend(super_solve_times)
-
-                factor = ppg_solve_time/super_solve_time
-                if factor > 1:
-                    solve_message = '{:.2}X speed up'.format(factor)
-                else:
-                    solve_message = '{:.2}X slow down'.format(1/factor)
-
-                factor = (ppg_construction_time+ppg_solve_time)/(super_solve_time+super_construction_time)
-                if factor > 1:
-                    total_message = '{:.2}X speed up'.format(factor)
-                else:
-                    total_message = '{:.2}X slow down'.format(1 / factor)
-
-                messages.verbose_message('solve={}'.format(solve_message))
-                messages.verbose_message('total={}'.format(total_message))
-                messages.verbose_message('solve={:.5f} '
-                                         'construction={:.5f} '
-                                         'total={:.5f} '
-                                         'variables={} '
-                                         'constraints={} '
-                                         '[PPG]'.format(ppg_solve_time,
-                                                        ppg_construction_time,
-                                                        ppg_solve_time + ppg_construction_time,
-                                                        ilp_for_ppg.number_of_variables(),
-                                                        ilp_for_ppg.number_of_constraints()))
-                messages.verbose_message('solve={:.5f} '
-                                         'construction={:.5f} '
-                                         'total={:.5f} '
-                                         'variables={} '
-                                         'constraints={} '
-                                         '[SUPER]'.format(super_solve_time,
-                                                          super_construction_time,
-                                                          super_solve_time + super_construction_time,
-                                                          ilp_for_super.number_of_variables(),
-                                                          ilp_for_super.number_of_constraints()))
-
-        total_trials = repeat * len(analysable_subprograms)
-        factor = sum(all_ppg_solve_times) / sum(all_super_solve_times)
-        if factor > 1:
-            solve_message = '{:.2}X speed up'.format(factor)
+
+        def gather(measurements: typing.Iterable[Measurement]):
+            for measurement in measurements:
+                report(measurement, repeat)
+                all_measurements.append(measurement)
+                all_ppg_solve_times.extend(measurement.ppg_solve_times)
+                all_super_solve_times.extend(measurement.super_solve_times)
+
+        if jobs > 1:
+            for subprogram in analysable_subprograms:
+                ppg = store.get(subprogram.name,
+                                'ppg',
+                                lambda: graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg))
+                store.get(subprogram.name, 'lnt', lambda: graphs.LoopNests(ppg))
+            store.save()
+
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=jobs,
+                                     mp_context=context,
+                                     initializer=initialise_worker,
+                                     initargs=(program_filename,
+                                               database_filename,
+                                               solvers.get_default(),
+                                               repeat,
+                                               fold_optimisation,
+                                               dominator_optimisation)) as executor:
+                # Results come back in the order of the subprograms, so the report reads the same as a serial run.
+                gather(executor.map(analyse_in_worker, [subprogram.name for subprogram in analysable_subprograms]))
         else:
-            solve_message = '{:.2}X slow down'.format(1 / factor)
-        messages.verbose_message('Average solve [PPG]={:.5f}'.format(sum(all_ppg_solve_times) / total_trials))
-        messages.verbose_message('Average solve [SUPER]={:.5f}'.format(sum(all_super_solve_times) / total_trials))
-        messages.verbose_message('solve={}'.format(solve_message))
+            gather(analyse(the_program,
+                           subprogram,
+                           store,
+                           db,
+                           repeat,
+                           fold_optimisation,
+                           dominator_optimisation) for subprogram in analysable_subprograms)
+
+    total_trials = repeat * len(analysable_subprograms)
+    factor = sum(all_ppg_solve_times) / sum(all_super_solve_times)
+    if factor > 1:
+        solve_message = '{:.2}X speed up'.format(factor)
+    else:
+        solve_message = '{:.2}X slow down'.format(1 / factor)
+    messages.verbose_message('Average solve [PPG]={:.5f}'.format(sum(all_ppg_solve_times) / total_trials))
+    messages.verbose_message('Average solve [SUPER]={:.5f}'.format(sum(all_super_solve_times) / total_trials))
+    messages.verbose_message('solve={}'.format(solve_message))
+    return all_measurements
 
 
 def parse_the_command_line():
@@ -135,7 +247,7 @@ def parse_the_command_line():
                         required=True)
 
     parser.add_argument('--database',
-                        help='use the WCET data in this file',
+                        help='use the WCET data in this file, either a database or a .npz archive from database_generator.py',
                         required=True)
 
     parser.add_argument('--repeat',
@@ -160,17 +272,34 @@ def parse_the_command_line():
                              'program points',
                         default=False)
 
+    parser.add_argument('--solver',
+                        help='choose the backend that solves integer linear programs',
+                        type=solvers.Backend,
+                        choices=list(solvers.Backend),
+                        default=solvers.Backend.lp_solve.name)
+
+    parser.add_argument('--jobs',
+                        help='analyse subprograms in this many processes',
+                        type=int,
+                        default=1,
+                        metavar='<INT>')
+
     return parser.parse_args()
 
 
 if __name__ == '__main__':
-    assert shutil.which('lp_solve', mode=os.X_OK), 'Script requires lp_solve to be in your path'
     threading.stack_size(2 ** 26)
     sys.setrecursionlimit(2 ** 20)
     kwargs = vars(parse_the_command_line())
+    if kwargs['jobs'] < 1:
+        messages.error_message('The number of jobs must be at least 1.')
+    if kwargs['solver'] == solvers.Backend.lp_solve:
+        assert shutil.which('lp_solve', mode=os.X_OK), 'Script requires lp_solve to be in your path'
+    solvers.set_default(kwargs['solver'])
     main(kwargs['program'],
          kwargs['database'],
          kwargs['repeat'],
          kwargs['subprograms'],
          kwargs['fold_optimisation'],
-         kwargs['dominator_optimisation'])
+         kwargs['dominator_optimisation'],
+         kwargs['jobs'])
@@ -0,0 +1,194 @@
+import hashlib
+import io
+import os
+import pickle
+
+from graphs import edges, vertices
+from system import programs
+from utils import messages
+
+
+def _create(cls):
+    return cls.__new__(cls)
+
+
+def _restore(obj, state):
+    attributes, items = state
+    obj.__dict__.update(attributes)
+    if isinstance(obj, list):
+        obj.extend(items)
+    else:
+        obj.update(items)
+
+
+class _Pickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        # Vertices and edges that are also containers would otherwise be rebuilt through their constructors, which
+        # allocate IDs.
+        if isinstance(obj, (vertices.Vertex, edges.Edge)) and isinstance(obj, (list, set)):
+            return _create, (type(obj),), (obj.__dict__, list(obj)), None, None, _restore
+        return NotImplemented
+
+
+class Cache:
+    """
+    An on-disk store of structures derived from the CFGs of a program, such as program point graphs, loop nests and
+    instrumentation point graphs.  There is one file per program, named by its magic, holding entries keyed by
+    subprogram name and kind of structure.
+
+    The program itself, its CFGs, the call graph and their vertices and edges are stored by reference, so loaded
+    structures share them with the program already in memory and the file only holds what was derived.  The file
+    records a digest of the program file and is ignored once that changes.
+
+    Entries must be loaded straight after the program is read, before anything else allocates vertex or edge IDs,
+    because derived vertices and edges keep the IDs they were created with.  A lazily read program stays lazy: the CFG
+    of a subprogram is only built when a loaded entry refers to it.
+    """
+
+    VERSION = 6
+
+    def __init__(self, program: programs.Program, directory: str = None):
+        self._program = program
+        if directory is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(program.filename)), '.cache')
+        self._filename = os.path.join(directory, '{}.pickle'.format(program.magic))
+        with open(program.filename, 'rb') as rd:
+            self._digest = hashlib.sha1(rd.read()).hexdigest()
+        self._entries = {}
+        self._dirty = False
+
+        # Everything the program owns gets a key that is stable from one run to the next.  The keys of a subprogram
+        # are added once its CFG has been built.
+        self._references = {}
+        self._objects = {}
+        self._own(('program',), program)
+        self._own(('call graph',), program.call_graph)
+        self._own_graph('', program.call_graph)
+        self._owners = set()
+        for subprogram in program:
+            self._own(('subprogram', subprogram.name), subprogram)
+
+    def _own(self, key, obj):
+        self._references[id(obj)] = key
+        self._objects[key] = obj
+
+    def _own_graph(self, graph_name: str, graph):
+        for vertex in graph:
+            self._own(('vertex', graph_name, vertex.id_), vertex)
+            for position, edge in enumerate(graph.successors(vertex)):
+                self._own(('edge', graph_name, vertex.id_, position), edge)
+
+    def _own_loaded_subprograms(self):
+        for subprogram in self._program:
+            if subprogram.loaded and subprogram.name not in self._owners:
+                self._owners.add(subprogram.name)
+                self._own(('cfg', subprogram.name), subprogram.cfg)
+                self._own_graph(subprogram.name, subprogram.cfg)
+
+    def _find(self, key):
+        if key not in self._objects and key[0] in ['cfg', 'vertex', 'edge'] and key[1] in self._program:
+            # The key belongs to a subprogram whose CFG has not been built yet.
+            self._program[key[1]].cfg
+            self._own_loaded_subprograms()
+        return self._objects[key]
+
+    def __enter__(self):
+        self.load()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if exception_type is None:
+            self.save()
+
+    def get(self, subprogram_name: str, kind: str, create):
+        """
+        Returns the structure of the given kind for the subprogram, calling create to derive it on a miss.
+        """
+        key = (subprogram_name, kind)
+        if key not in self._entries:
+            self._entries[key] = create()
+            self._dirty = True
+        return self._entries[key]
+
+    def put(self, subprogram_name: str, kind: str, value):
+        self._entries[(subprogram_name, kind)] = value
+        self._dirty = True
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def dumps(self, value) -> bytes:
+        """
+        Pickles a value the way entries are pickled, with everything the program owns stored by reference, so that a
+        process holding the same program can load it.  Derived vertices are not registered with the vertex pool when
+        loaded, so values from different processes may hold vertices with the same IDs and must be kept apart.
+        """
+        buffer = io.BytesIO()
+        self._own_loaded_subprograms()
+        pickler = _Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: self._references.get(id(obj))
+        pickler.dump(value)
+        return buffer.getvalue()
+
+    def loads(self, data: bytes):
+        unpickler = pickle.Unpickler(io.BytesIO(data))
+        unpickler.persistent_load = self._find
+        return unpickler.load()
+
+    def load(self):
+        if not os.path.exists(self._filename):
+            return
+
+        try:
+            with open(self._filename, 'rb') as rd:
+                unpickler = pickle.Unpickler(rd)
+                unpickler.persistent_load = self._find
+                header = unpickler.load()
+                if header[:2] != (Cache.VERSION, self._digest):
+                    messages.debug_message("Ignoring stale cache '{}'".format(self._filename))
+                    return
+                _, _, last_edge_id = header
+                # Edges of CFGs built while the entries are loaded must not take the IDs of derived edges.
+                edges.edge_id = max(edges.edge_id, last_edge_id)
+                entries = unpickler.load()
+                derived_vertices = unpickler.load()
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError) as e:
+            messages.debug_message("Ignoring unreadable cache '{}': {}".format(self._filename, e))
+            return
+
+        if any(vertex in vertices.Vertex.id_pool for vertex in derived_vertices):
+            messages.debug_message("Ignoring cache '{}' because its vertex IDs are taken".format(self._filename))
+            return
+
+        for vertex in derived_vertices:
+            vertices.Vertex.id_pool.register(vertex)
+        self._entries = entries
+        messages.debug_message("Loaded {} entries from cache '{}'".format(len(entries), self._filename))
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        self._own_loaded_subprograms()
+        derived_vertices = {}
+
+        def persistent_id(obj):
+            key = self._references.get(id(obj))
+            if key is not None:
+                return key
+            if isinstance(obj, vertices.Vertex):
+                derived_vertices[id(obj)] = obj
+            return None
+
+        os.makedirs(os.path.dirname(self._filename), exist_ok=True)
+        temporary = '{}.{}'.format(self._filename, os.getpid())
+        with open(temporary, 'wb') as wd:
+            pickler = _Pickler(wd, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = persistent_id
+            # Edges hash to their ID and every derived edge has an ID below the last one handed out.
+            pickler.dump((Cache.VERSION, self._digest, edges.edge_id))
+            pickler.dump(self._entries)
+            # The same pickler memoises the vertices, so this only stores references to them.
+            pickler.dump(list(derived_vertices.values()))
+        os.replace(temporary, self._filename)
+        self._dirty = False
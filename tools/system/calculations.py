@@ -1,13 +1,9 @@
-import decimal
-import os
+import abc
 import random
-import re
-import subprocess
 import timeit
 
 from graphs import edges, graphs, vertices
-from system import database
-from utils import messages
+from system import database, solvers
 
 
 class VertexVariable:
@@ -108,15 +104,39 @@ class Term:
         self._coefficient = coefficient
         self._variable = variable
 
+    @property
+    def coefficient(self):
+        return self._coefficient
+
+    @property
+    def variable(self):
+        return self._variable
+
     def __str__(self):
         return '{} {}'.format(self._coefficient, self._variable if self._variable else '')
 
 
 class LinearExpr(list):
+    def terms(self):
+        # Elements are terms, bare variables (with an implicit coefficient of 1), or constants.
+        for element in self:
+            if isinstance(element, Term):
+                yield to_number(element.coefficient), element.variable
+            elif isinstance(element, (int, float, str)):
+                yield to_number(element), None
+            else:
+                yield 1, element
+
     def __str__(self):
         return ' + '.join(str(term) for term in self)
 
 
+def to_number(value):
+    if isinstance(value, str):
+        return float(value) if '.' in value else int(value)
+    return value
+
+
 class Constraint:
     EQUALITY = '='
     LESS_OR_EQUAL = '<='
@@ -126,11 +146,23 @@ class Constraint:
         self._right = right
         self._relation = relation
 
+    @property
+    def left(self) -> LinearExpr:
+        return self._left
+
+    @property
+    def right(self) -> LinearExpr:
+        return self._right
+
+    @property
+    def relation(self):
+        return self._relation
+
     def __str__(self):
         return '{} {} {}'.format(self._left, self._relation, self._right)
 
 
-class ConstraintSystem:
+class ConstraintSystem(metaclass=abc.ABCMeta):
     """
     A constraint system that solves to a WCET estimate.
     """
@@ -140,9 +172,7 @@ class ConstraintSystem:
         self._solve_time = 0
         self._construction_time = []
         self._variable_execution_counts = {}
-        self._objective = LinearExpr()
-        self._constraints = []
-        self._variables = set()
+        self._model = None
 
     @property
     def wcet(self):
@@ -152,11 +182,17 @@ class ConstraintSystem:
     def solve_time(self):
         return self._solve_time
 
+    @property
+    def variable_execution_counts(self):
+        return self._variable_execution_counts
+
+    @abc.abstractmethod
     def number_of_constraints(self):
-        return len(self._constraints)
+        pass
 
+    @abc.abstractmethod
     def number_of_variables(self):
-        return len(self._variables)
+        pass
 
     @property
     def construction_time(self):
@@ -165,14 +201,49 @@ class ConstraintSystem:
     def add_to_construction_time(self, time):
         self._construction_time.append(time)
 
-    def add_to_objective(self, term: Term):
-        self._objective.append(term)
-
-    def add_variable(self, variable: ProgramPointVariable):
-        self._variables.add(variable)
+    @abc.abstractmethod
+    def write(self, filename):
+        pass
+
+    @abc.abstractmethod
+    def matrix(self) -> solvers.ConstraintMatrix:
+        pass
+
+    def solve(self, filename, solver: solvers.Solver = None):
+        if solver is None:
+            solver = solvers.create()
+        self._set_solution(solver.solve(self, filename))
+
+    def load(self, solver: solvers.Solver = None) -> solvers.Model:
+        """
+        Loads the system into the solver and keeps it there.  Change the objective and row bounds through the model
+        returned, then call resolve; the system itself is left as it was built.
+        """
+        if solver is None:
+            solver = solvers.create()
+        self._model = solver.load(self.matrix())
+        return self._model
+
+    def resolve(self, filename):
+        """
+        Solves the loaded model again, loading it first if need be, and warm starting where the solver allows.
+        """
+        if self._model is None:
+            self.load()
+        self._set_solution(self._model.solve(filename))
+
+    def _set_solution(self, solution: solvers.Solution):
+        self._wcet = solution.wcet
+        self._variable_execution_counts = solution.variable_execution_counts
+        self._solve_time = solution.solve_time
 
-    def add_constraint(self, constraint: Constraint):
-        self._constraints.append(constraint)
+    def output(self, function_name):
+        print()
+        print('wcet({})={}'.format(function_name, self._wcet))
+        for variable in sorted(self._variable_execution_counts.keys()):
+            if self._variable_execution_counts[variable] > 0:
+                print('{} = {}'.format(variable,
+                                       self._variable_execution_counts[variable]))
 
     def __str__(self):
         return """
@@ -182,8 +253,8 @@ constraints:  {}
 construction: {}
 solve:        {}
 total:        {}""".format(self.wcet,
-                           len(self._variables),
-                           len(self._constraints),
+                           self.number_of_variables(),
+                           self.number_of_constraints(),
                            self.construction_time,
                            self.solve_time,
                            self.construction_time + self.solve_time)
@@ -194,7 +265,28 @@ class IntegerLinearProgram(ConstraintSystem):
     A constraint system that contains linear constraints only.
     """
 
-    def solve(self, filename):
+    def __init__(self):
+        ConstraintSystem.__init__(self)
+        self._objective = LinearExpr()
+        self._constraints = []
+        self._variables = set()
+
+    def number_of_constraints(self):
+        return len(self._constraints)
+
+    def number_of_variables(self):
+        return len(self._variables)
+
+    def add_to_objective(self, term: Term):
+        self._objective.append(term)
+
+    def add_variable(self, variable: ProgramPointVariable):
+        self._variables.add(variable)
+
+    def add_constraint(self, constraint: Constraint):
+        self._constraints.append(constraint)
+
+    def write(self, filename):
         def get_new_line(num=1):
             return '\n' * num
 
@@ -211,94 +303,122 @@ class IntegerLinearProgram(ConstraintSystem):
             wd.write('int\n{};'.format(',\n'.join(str(variable) for variable in self._variables)))
             wd.write(get_new_line())
 
-        # Launch lp_solve with the created file
-        args = ['lp_solve', filename]
-        start = timeit.default_timer()
-        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, _ = process.communicate()
-        end = timeit.default_timer()
-        self._solve_time = end - start
-
-        if process.returncode != 0:
-            messages.error_message("Running '{}' failed with {}".format(' '.join(args), process.returncode))
-
-        # Grab the WCET estimate and the execution counts of variables.
-        stdout = stdout.decode()
-        for line in stdout.split(os.linesep):
-            line = line.strip()
-            # Process if the line is not whitespace and has digits in it
-            if line and re.search('\d+', line):
-                lexemes = re.split('\s+', line)
-                if len(lexemes) == 2:
-                    self._variable_execution_counts[lexemes[0]] = int(decimal.Decimal(lexemes[1]))
+    def matrix(self) -> solvers.ConstraintMatrix:
+        matrix = solvers.ConstraintMatrix()
+        for variable in self._variables:
+            matrix.integers[matrix.add_column(str(variable))] = True
+
+        for coefficient, variable in self._objective.terms():
+            if variable is not None:
+                matrix.objective[matrix.add_column(str(variable))] += coefficient
+
+        for constraint in self._constraints:
+            # Move variables to the left-hand side and constants to the right-hand side.
+            coefficients = {}
+            constant = 0
+            for coefficient, variable in constraint.left.terms():
+                if variable is None:
+                    constant -= coefficient
+                else:
+                    column = matrix.add_column(str(variable))
+                    coefficients[column] = coefficients.get(column, 0) + coefficient
+            for coefficient, variable in constraint.right.terms():
+                if variable is None:
+                    constant += coefficient
                 else:
-                    self._wcet = int(round(float(lexemes[-1])))
+                    column = matrix.add_column(str(variable))
+                    coefficients[column] = coefficients.get(column, 0) - coefficient
 
-    def output(self, function_name):
-        print()
-        print('wcet({})={}'.format(function_name, self._wcet))
-        for variable in sorted(self._variable_execution_counts.keys()):
-            if self._variable_execution_counts[variable] > 0:
-                print('{} = {}'.format(variable,
-                                       self._variable_execution_counts[variable]))
+            if constraint.relation == Constraint.EQUALITY:
+                matrix.add_row(coefficients, constant, constant)
+            else:
+                matrix.add_row(coefficients, -float('inf'), constant)
+
+        return matrix
+
+
+class CompactIntegerLinearProgram(ConstraintSystem):
+    """
+    An integer linear program assembled straight into a sparse constraint matrix. Variables are integer columns keyed
+    by the vertex or edge they count, so no Constraint, LinearExpr or Term objects are created.
+    """
+
+    def __init__(self, matrix: solvers.ConstraintMatrix = None):
+        ConstraintSystem.__init__(self)
+        self._matrix = solvers.ConstraintMatrix() if matrix is None else matrix
+
+    def number_of_constraints(self):
+        return self._matrix.number_of_rows()
+
+    def number_of_variables(self):
+        return self._matrix.number_of_columns()
+
+    def add_variable(self, key, variable) -> int:
+        column = self._matrix.add_column(key, variable)
+        self._matrix.integers[column] = True
+        return column
+
+    def column(self, key) -> int:
+        return self._matrix.column(key)
+
+    def add_to_objective(self, column: int, coefficient):
+        self._matrix.objective[column] += coefficient
+
+    def add_constraint(self, left, right, relation, constant=0, coefficient=1):
+        """
+        Adds the constraint sum(left) relation coefficient * sum(right) + constant, where left and right are columns.
+        """
+        coefficients = {}
+        for column in left:
+            coefficients[column] = coefficients.get(column, 0) + 1
+        for column in right:
+            coefficients[column] = coefficients.get(column, 0) - coefficient
+
+        if relation == Constraint.EQUALITY:
+            self._matrix.add_row(coefficients, constant, constant)
+        else:
+            self._matrix.add_row(coefficients, -float('inf'), constant)
+
+    def write(self, filename):
+        self._matrix.write_lp(filename, shuffle=True)
+
+    def write_mps(self, filename):
+        self._matrix.write_mps(filename)
+
+    def matrix(self) -> solvers.ConstraintMatrix:
+        return self._matrix
 
 
 def create_ilp_for_program_point_graph(ppg: graphs.ProgramPointGraph, lnt: graphs.LoopNests, db: database.Database):
     def create_objective_function():
         for v in ppg:
-            variable = ProgramPointVariable(v)
-            ilp.add_variable(variable)
-            term = Term(db.get_wcet(v), variable)
-            ilp.add_to_objective(term)
+            column = ilp.add_variable(v, ProgramPointVariable(v))
+            ilp.add_to_objective(column, db.get_wcet(v))
 
     def create_structural_constraints():
         for v in ppg:
             if isinstance(v.program_point, vertices.Vertex):
-                flow_in_lhs = LinearExpr()
-                for predecessor_edge in ppg.predecessors(v):
-                    variable = ProgramPointVariable(predecessor_edge.predecessor())
-                    flow_in_lhs.append(variable)
-
-                flow_in_rhs = LinearExpr()
-                flow_in_rhs.append(ProgramPointVariable(v))
-
-                flow_in_constraint = Constraint(flow_in_lhs, flow_in_rhs, Constraint.EQUALITY)
-                ilp.add_constraint(flow_in_constraint)
-
-                flow_out_lhs = LinearExpr()
-                for predecessor_edge in ppg.predecessors(v):
-                    variable = ProgramPointVariable(predecessor_edge.predecessor())
-                    flow_out_lhs.append(variable)
-
-                flow_out_rhs = LinearExpr()
-                for successor_edge in ppg.successors(v):
-                    variable = ProgramPointVariable(successor_edge.successor())
-                    flow_out_rhs.append(variable)
+                flow_in = [ilp.column(predecessor_edge.predecessor()) for predecessor_edge in ppg.predecessors(v)]
+                ilp.add_constraint(flow_in, [ilp.column(v)], Constraint.EQUALITY)
 
-                flow_out_constraint = Constraint(flow_out_lhs, flow_out_rhs, Constraint.EQUALITY)
-                ilp.add_constraint(flow_out_constraint)
+                flow_out = [ilp.column(successor_edge.successor()) for successor_edge in ppg.successors(v)]
+                ilp.add_constraint(flow_in, flow_out, Constraint.EQUALITY)
 
     def create_loop_bound_constraints():
         for loop in lnt:
-            lhs = LinearExpr()
-            lhs.append(ProgramPointVariable(loop.header))
-
-            rhs = LinearExpr()
+            lhs = [ilp.column(loop.header)]
             if lnt.is_outermost_loop(loop):
-                coefficient = db.get_global_wfreq(loop.header)
-                rhs.append(str(coefficient))
-                constraint = Constraint(lhs, rhs, Constraint.EQUALITY)
+                ilp.add_constraint(lhs, [], Constraint.EQUALITY, constant=db.get_global_wfreq(loop.header))
             else:
-                coefficient = db.get_local_wfreq(loop.header)
                 (loop_transition,) = [predecessor_edge for predecessor_edge in lnt.predecessors(loop)
                                       if predecessor_edge.direction == edges.LoopTransition.Direction.ENTRY]
-                for transition in loop_transition:
-                    rhs.append(Term(str(coefficient), ProgramPointVariable(transition.predecessor())))
-                constraint = Constraint(lhs, rhs, Constraint.LESS_OR_EQUAL)
-
-            ilp.add_constraint(constraint)
+                rhs = [ilp.column(transition.predecessor()) for transition in loop_transition]
+                ilp.add_constraint(lhs,
+                                   rhs,
+                                   Constraint.LESS_OR_EQUAL,
+                                   coefficient=db.get_local_wfreq(loop.header))
 
-    ilp = IntegerLinearProgram()
+    ilp = CompactIntegerLinearProgram()
     start = timeit.default_timer()
     create_objective_function()
     create_structural_constraints()
@@ -314,23 +434,23 @@ def create_ilp_for_super_block_graph(ppg:                    graphs.ProgramPoint
                                      fold_optimisation:      bool,
                                      dominator_optimisation: bool):
 
+    def representative(super_block):
+        return ilp.column(super_block.representative)
+
     def create_objective_function(super_graph):
         for super_block in super_graph.super_blocks():
-            ilp.add_variable(ProgramPointVariable(super_block.representative))
+            column = ilp.add_variable(super_block.representative, ProgramPointVariable(super_block.representative))
             if fold_optimisation:
                 wcet = 0
                 for v in super_block:
                     if isinstance(v.program_point, vertices.Vertex):
                         wcet += db.get_wcet(v)
-                term = Term(wcet, ProgramPointVariable(super_block.representative))
-                ilp.add_to_objective(term)
+                ilp.add_to_objective(column, wcet)
             else:
                 for v in super_block:
                     if isinstance(v.program_point, vertices.Vertex):
-                        variable = ProgramPointVariable(v)
-                        ilp.add_variable(variable)
-                        term = Term(db.get_wcet(v), variable)
-                        ilp.add_to_objective(term)
+                        column = ilp.add_variable(v, ProgramPointVariable(v))
+                        ilp.add_to_objective(column, db.get_wcet(v))
 
     def create_intra_super_block_constraints(super_graph):
         if not fold_optimisation:
@@ -338,68 +458,44 @@ def create_ilp_for_super_block_graph(ppg:                    graphs.ProgramPoint
                 for v in super_block:
                     if isinstance(v.program_point, vertices.Vertex):
                         if v != super_block.representative:
-                            lhs = LinearExpr()
-                            lhs.append(ProgramPointVariable(v))
-                            rhs = LinearExpr()
-                            rhs.append(ProgramPointVariable(super_block.representative))
-                            constraint = Constraint(lhs, rhs, Constraint.EQUALITY)
-                            ilp.add_constraint(constraint)
+                            ilp.add_constraint([ilp.column(v)], [representative(super_block)], Constraint.EQUALITY)
 
     def create_fork_constraints(super_graph):
         for fork in super_graph.forks():
-            lhs = LinearExpr()
             (super_block,) = [predecessor_edge.predecessor() for predecessor_edge in super_graph.predecessors(fork)]
-            lhs.append(ProgramPointVariable(super_block.representative))
-            rhs = LinearExpr()
-            for successor_edge in super_graph.successors(fork):
-                rhs.append(ProgramPointVariable(successor_edge.successor().representative))
-            constraint = Constraint(lhs, rhs, Constraint.EQUALITY)
-            ilp.add_constraint(constraint)
+            rhs = [representative(successor_edge.successor()) for successor_edge in super_graph.successors(fork)]
+            ilp.add_constraint([representative(super_block)], rhs, Constraint.EQUALITY)
 
     def create_merge_constraints(super_graph):
         for merge in super_graph.merges():
             redundant_constraint = False
             if dominator_optimisation and not lnt.is_header(merge.program_point):
-                (parent_edge,) = super_graph.pre_dominator_tree.predecessors(merge.program_point)
-                immediate_pre_dominator = parent_edge.predecessor()
-                (parent_edge,) = super_graph.post_dominator_tree.predecessors(immediate_pre_dominator)
-                immediate_post_dominator = parent_edge.predecessor()
+                immediate_pre_dominator = super_graph.pre_dominator_tree.idom[merge.program_point]
+                immediate_post_dominator = super_graph.post_dominator_tree.idom[immediate_pre_dominator]
                 # This merge immediately post-dominates the branch.
                 redundant_constraint = immediate_post_dominator == merge.program_point
 
             if not redundant_constraint:
-                lhs = LinearExpr()
                 (super_block,) = [successor_edge.successor() for successor_edge in super_graph.successors(merge)]
-                lhs.append(ProgramPointVariable(super_block.representative))
-                rhs = LinearExpr()
-                for predecessor_edge in super_graph.predecessors(merge):
-                    rhs.append(ProgramPointVariable(predecessor_edge.predecessor().representative))
-                constraint = Constraint(lhs, rhs, Constraint.EQUALITY)
-                ilp.add_constraint(constraint)
+                rhs = [representative(predecessor_edge.predecessor())
+                       for predecessor_edge in super_graph.predecessors(merge)]
+                ilp.add_constraint([representative(super_block)], rhs, Constraint.EQUALITY)
 
     def create_loop_bound_constraints(super_graph):
         for loop in lnt:
-            lhs = LinearExpr()
-            super_block = super_graph[loop.header]
-            lhs.append(ProgramPointVariable(super_block.representative))
-
-            rhs = LinearExpr()
+            lhs = [representative(super_graph[loop.header])]
             if lnt.is_outermost_loop(loop):
-                coefficient = db.get_global_wfreq(loop.header)
-                rhs.append(str(coefficient))
-                constraint = Constraint(lhs, rhs, Constraint.EQUALITY)
+                ilp.add_constraint(lhs, [], Constraint.EQUALITY, constant=db.get_global_wfreq(loop.header))
             else:
-                coefficient = db.get_local_wfreq(loop.header)
                 (loop_transition,) = [successor_edge for successor_edge in lnt.successors(loop)
                                       if successor_edge.direction == edges.LoopTransition.Direction.EXIT]
-                for transition in loop_transition:
-                    super_block = super_graph[transition.successor()]
-                    rhs.append(Term(str(coefficient), ProgramPointVariable(super_block.representative)))
-                constraint = Constraint(lhs, rhs, Constraint.LESS_OR_EQUAL)
+                rhs = [representative(super_graph[transition.successor()]) for transition in loop_transition]
+                ilp.add_constraint(lhs,
+                                   rhs,
+                                   Constraint.LESS_OR_EQUAL,
+                                   coefficient=db.get_local_wfreq(loop.header))
 
-            ilp.add_constraint(constraint)
-
-    ilp = IntegerLinearProgram()
+    ilp = CompactIntegerLinearProgram()
     start = timeit.default_timer()
     super_graph = graphs.SuperBlockGraph(ppg, lnt)
     create_objective_function(super_graph)
@@ -418,9 +514,9 @@ def create_ilp_for_instrumentation_point_graph(ipg: graphs.InstrumentationPointG
                                                db: database.Database):
     def add_variables():
         for v in ipg:
-            ilp.add_variable(ProgramPointVariable(v))
+            ilp.add_variable(v, ProgramPointVariable(v))
             for successor_edge in ipg.successors(v):
-                ilp.add_variable(TransitionVariable(successor_edge))
+                ilp.add_variable(successor_edge, TransitionVariable(successor_edge))
 
     def create_objective_function():
         # Bring data into memory from the database so that this stage is not memory bound.
@@ -433,38 +529,18 @@ def create_ilp_for_instrumentation_point_graph(ipg: graphs.InstrumentationPointG
                         wcets[w] = db.get_wcet(w)
 
         for v in ipg:
-            term = Term(wcets[v], ProgramPointVariable(v))
-            ilp.add_to_objective(term)
+            ilp.add_to_objective(ilp.column(v), wcets[v])
             for successor_edge in ipg.successors(v):
                 wcet = sum([wcets[w] for w in successor_edge])
-                term = Term(wcet, TransitionVariable(successor_edge))
-                ilp.add_to_objective(term)
+                ilp.add_to_objective(ilp.column(successor_edge), wcet)
 
     def create_structural_constraints():
         for v in ipg:
-            flow_in_lhs = LinearExpr()
-            for predecessor_edge in ipg.predecessors(v):
-                variable = TransitionVariable(predecessor_edge)
-                flow_in_lhs.append(variable)
-
-            flow_in_rhs = LinearExpr()
-            flow_in_rhs.append(ProgramPointVariable(v))
-
-            flow_in_constraint = Constraint(flow_in_lhs, flow_in_rhs, Constraint.EQUALITY)
-            ilp.add_constraint(flow_in_constraint)
-
-            flow_out_lhs = LinearExpr()
-            for predecessor_edge in ipg.predecessors(v):
-                variable = TransitionVariable(predecessor_edge)
-                flow_out_lhs.append(variable)
-
-            flow_out_rhs = LinearExpr()
-            for successor_edge in ipg.successors(v):
-                variable = TransitionVariable(successor_edge)
-                flow_out_rhs.append(variable)
+            flow_in = [ilp.column(predecessor_edge) for predecessor_edge in ipg.predecessors(v)]
+            ilp.add_constraint(flow_in, [ilp.column(v)], Constraint.EQUALITY)
 
-            flow_out_constraint = Constraint(flow_out_lhs, flow_out_rhs, Constraint.EQUALITY)
-            ilp.add_constraint(flow_out_constraint)
+            flow_out = [ilp.column(successor_edge) for successor_edge in ipg.successors(v)]
+            ilp.add_constraint(flow_in, flow_out, Constraint.EQUALITY)
 
     def create_loop_bound_constraints(ipg, lnt, db):
         program_point_mapping = {}
@@ -485,34 +561,21 @@ def create_ilp_for_instrumentation_point_graph(ipg: graphs.InstrumentationPointG
                         program_point_mapping[w].add(successor_edge)
 
         for loop in lnt:
-            lhs = LinearExpr()
-            for program_point in program_point_mapping[loop.header]:
-                if isinstance(program_point, edges.TransitionEdge):
-                    lhs.append(TransitionVariable(program_point))
-                else:
-                    lhs.append(ProgramPointVariable(program_point))
-
-            rhs = LinearExpr()
+            lhs = [ilp.column(program_point) for program_point in program_point_mapping[loop.header]]
             if lnt.is_outermost_loop(loop):
-                coefficient = db.get_global_wfreq(loop.header)
-                rhs.append(str(coefficient))
-                constraint = Constraint(lhs, rhs, Constraint.EQUALITY)
+                ilp.add_constraint(lhs, [], Constraint.EQUALITY, constant=db.get_global_wfreq(loop.header))
             else:
-                coefficient = db.get_local_wfreq(loop.header)
                 (loop_transition,) = [predecessor_edge for predecessor_edge in lnt.predecessors(loop)
                                       if predecessor_edge.direction == edges.LoopTransition.Direction.ENTRY]
-                for transition in loop_transition:
-                    for program_point in program_point_mapping[transition.predecessor()]:
-                        if isinstance(program_point, edges.TransitionEdge):
-                            rhs.append(Term(str(coefficient), TransitionVariable(program_point)))
-                        else:
-                            rhs.append(Term(str(coefficient), ProgramPointVariable(program_point)))
-
-                constraint = Constraint(lhs, rhs, Constraint.LESS_OR_EQUAL)
-
-            ilp.add_constraint(constraint)
-
-    ilp = IntegerLinearProgram()
+                rhs = [ilp.column(program_point)
+                       for transition in loop_transition
+                       for program_point in program_point_mapping[transition.predecessor()]]
+                ilp.add_constraint(lhs,
+                                   rhs,
+                                   Constraint.LESS_OR_EQUAL,
+                                   coefficient=db.get_local_wfreq(loop.header))
+
+    ilp = CompactIntegerLinearProgram()
     start = timeit.default_timer()
     add_variables()
     create_objective_function()
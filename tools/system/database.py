@@ -1,6 +1,9 @@
+import numpy
+import os
 import sqlite3
 
 from graphs import vertices
+from utils import messages
 
 
 class Table:
@@ -10,19 +13,35 @@ class Table:
         self._columns = {'source_id': 'int',
                          'destination_id': 'int',
                          'value': 'int'}
-        self._rows = []
+        self._index = {}
+        self._pending = []
 
     @property
     def name(self):
         return self._name
 
     @property
-    def rows(self):
-        return self._rows
+    def index(self):
+        return self._index
+
+    @property
+    def pending(self):
+        return self._pending
 
     def key(self, index):
         return self._key[index]
 
+    def schema(self):
+        return ', '.join(['{} {}'.format(key, value) for key, value in self])
+
+    def covering_index(self):
+        # Lookups by key read the value from the index alone.  It is created once the rows are in, which is far
+        # cheaper than maintaining a primary key row by row.
+        return 'CREATE INDEX IF NOT EXISTS {0}_key ON {0} ({1}, value)'.format(self._name, ', '.join(self._key))
+
+    def __getitem__(self, key):
+        return self._index[key]
+
     def __iter__(self):
         for column_name, data_type in self._columns.items():
             yield column_name, data_type
@@ -30,9 +49,19 @@ class Table:
 
 def get_key(v: vertices.ProgramPointVertex):
     if isinstance(v.program_point, vertices.Vertex):
-        return [v.program_point.id_, None]
+        return v.program_point.id_, None
     else:
-        return [v.program_point.predecessor().id_, v.program_point.successor().id_]
+        return v.program_point.predecessor().id_, v.program_point.successor().id_
+
+
+def create(filename):
+    """
+    Opens the timing data in the given file: a columnar side file written by Database.export_columns if the name ends
+    in '.npz', otherwise an SQLite database.
+    """
+    if os.path.splitext(filename)[1] == '.npz':
+        return ColumnarDatabase(filename)
+    return Database(filename)
 
 
 class Database:
@@ -42,6 +71,7 @@ class Database:
         self._local_wfreq = Table('local_wfreq')
         self._global_wfreq = Table('global_wfreq')
         self._tables = [self._wcet, self._local_wfreq, self._global_wfreq]
+        self._loaded = False
 
     def __enter__(self):
         self.__connection = sqlite3.connect(self.__filename)
@@ -49,47 +79,120 @@ class Database:
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
+        self.flush()
         self.__connection.commit()
         self.__connection.close()
 
     def reset(self):
+        # The journal mode sticks to the file, so readers are not blocked while a database is generated.
+        self.__cursor.execute('PRAGMA journal_mode=WAL')
+        self.__cursor.execute('PRAGMA synchronous=NORMAL')
         for table in self._tables:
             self.__cursor.execute('DROP TABLE if exists {}'.format(table.name))
-            self.__cursor.execute('CREATE TABLE {} ({})'.format(table.name,
-                                                                ', '.join(['{} {}'.format(key, value) for key, value in table])))
+            self.__cursor.execute('CREATE TABLE {} ({})'.format(table.name, table.schema()))
+            table.index.clear()
+            table.pending.clear()
+
+    def flush(self):
+        # Rows are buffered by the add methods and written with one statement per table, all in one transaction.
+        with self.__connection:
+            for table in self._tables:
+                if table.pending:
+                    self.__cursor.executemany('INSERT INTO {} VALUES (?, ?, ?)'.format(table.name), table.pending)
+                    table.pending.clear()
+                    self.__cursor.execute(table.covering_index())
+
+    def export_columns(self, filename):
+        """
+        Writes the tables to a NumPy archive with one array per column, which ColumnarDatabase reads without SQLite.
+        Program points that are vertices have no destination, which the has_destination column records.
+        """
+        self.flush()
+        columns = {}
+        for table in self._tables:
+            rows = self.__cursor.execute('SELECT * from {}'.format(table.name)).fetchall()
+            columns['{}.source'.format(table.name)] = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+            columns['{}.destination'.format(table.name)] = numpy.array([0 if row[1] is None else row[1]
+                                                                        for row in rows], dtype=numpy.int64)
+            columns['{}.has_destination'.format(table.name)] = numpy.array([row[1] is not None for row in rows],
+                                                                           dtype=bool)
+            columns['{}.value'.format(table.name)] = numpy.array([row[2] for row in rows], dtype=numpy.int64)
+        numpy.savez(filename, **columns)
+
+    def __add(self, table: Table, v: vertices.ProgramPointVertex, value: int):
+        key = get_key(v)
+        table.pending.append((*key, value))
+        if self._loaded:
+            table.index[key] = value
 
     def add_wcet(self, v: vertices.ProgramPointVertex, wcet: int):
-        row = get_key(v)
-        row.append(wcet)
-        self.__cursor.execute('INSERT INTO {} VALUES (?, ?, ?)'.format(self._wcet.name), row)
+        self.__add(self._wcet, v, wcet)
 
     def add_local_wfreq(self, v: vertices.ProgramPointVertex, wfreq: int):
-        row = get_key(v)
-        row.append(wfreq)
-        self.__cursor.execute('INSERT INTO {} VALUES (?, ?, ?)'.format(self._local_wfreq.name), row)
+        self.__add(self._local_wfreq, v, wfreq)
 
     def add_global_wfreq(self, v: vertices.ProgramPointVertex, wfreq: int):
-        row = get_key(v)
-        row.append(wfreq)
-        self.__cursor.execute('INSERT INTO {} VALUES (?, ?, ?)'.format(self._global_wfreq.name), row)
+        self.__add(self._global_wfreq, v, wfreq)
 
     def load_into_memory(self):
+        self.flush()
         for table in self._tables:
             query = "SELECT * from {}".format(table.name)
-            self.__cursor.execute(query)
-            table.rows.extend(self.__cursor.fetchall())
+            table.index.clear()
+            for source_id, destination_id, value in self.__cursor.execute(query):
+                table.index[(source_id, destination_id)] = value
+        self._loaded = True
+
+    def __get(self, table: Table, v: vertices.ProgramPointVertex):
+        if not self._loaded:
+            self.load_into_memory()
+        try:
+            return table[get_key(v)]
+        except KeyError:
+            messages.error_message("No row in table '{}' for program point {}".format(table.name, v))
 
     def get_wcet(self, v: vertices.ProgramPointVertex):
-        key = get_key(v)
-        (row,) = [row for row in self._wcet.rows if row[0] == key[0] and row[1] == key[1]]
-        return row[2]
+        return self.__get(self._wcet, v)
 
     def get_local_wfreq(self, v: vertices.ProgramPointVertex):
-        key = get_key(v)
-        (row,) = [row for row in self._local_wfreq.rows if row[0] == key[0] and row[1] == key[1]]
-        return row[2]
+        return self.__get(self._local_wfreq, v)
 
     def get_global_wfreq(self, v: vertices.ProgramPointVertex):
-        key = get_key(v)
-        (row,) = [row for row in self._global_wfreq.rows if row[0] == key[0] and row[1] == key[1]]
-        return row[2]
+        return self.__get(self._global_wfreq, v)
+
+
+class ColumnarDatabase(Database):
+    """
+    The timing data exported by Database.export_columns, read straight from its arrays.  The archive is uncompressed,
+    so each column is a single read and no SQL is involved; it cannot be written to.
+    """
+
+    def __init__(self, filename):
+        Database.__init__(self, filename)
+        self.__filename = filename
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        pass
+
+    def reset(self):
+        messages.error_message("Cannot write to the columnar database '{}'".format(self.__filename))
+
+    def flush(self):
+        for table in self._tables:
+            if table.pending:
+                messages.error_message("Cannot write to the columnar database '{}'".format(self.__filename))
+
+    def load_into_memory(self):
+        with numpy.load(self.__filename) as columns:
+            for table in self._tables:
+                def column(name):
+                    return columns['{}.{}'.format(table.name, name)].tolist()
+
+                destinations = [destination if present else None
+                                for destination, present in zip(column('destination'), column('has_destination'))]
+                table.index.clear()
+                table.index.update(zip(zip(column('source'), destinations), column('value')))
+        self._loaded = True
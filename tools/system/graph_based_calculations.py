@@ -1,145 +1,258 @@
 from graphs.edges import Edge
-from graphs.graphs import ControlFlowGraph
+from graphs.graphs import FlowGraph
 from graphs.vertices import Vertex
-from typing import List, Set
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class Loop:
+    __slots__ = ['headers', 'body', 'parent']
+
+    def __init__(self, headers: Set[Vertex], body: Set[Vertex], parent: 'Loop' or None):
+        self.headers = headers
+        self.body = body
+        self.parent = parent
 
 
 class LoopHierarchy:
     def __init__(self):
         self._loops = []
-        self._representatives = {}
-        self._predecessors = {}
-        self._successors = {}
-        self._parent = {}
+        self._loop = {}
 
-    def add_loop(self, loop: List[Vertex]):
+    def add_loop(self, headers: Set[Vertex], body: List[Vertex]) -> Loop:
+        loop = Loop(headers, set(body), self._loop.get(body[0]))
         self._loops.append(loop)
 
-        for vertex in loop:
-            if vertex in self._parent:
-                self._parent[vertex].remove(vertex)
-            self._parent[vertex] = loop
-
-    def get_loop(self, vertex: Vertex):
-        return self._parent[vertex]
+        for vertex in body:
+            if vertex in self._loop:
+                self._loop[vertex].body.remove(vertex)
+            self._loop[vertex] = loop
+        return loop
 
-    def add_edges(self, cfg: ControlFlowGraph):
-        for loop in self._loops:
-            loop.sort()
-            representative = loop[0]
-            self._predecessors[representative] = set()
-            self._successors[representative] = set()
-
-        for loop in self._loops:
-            representative = loop[0]
-
-            for vertex in loop:
-                for edge in cfg.predecessors(vertex):
-                    other_loop = self.get_loop(edge.predecessor())
-                    if other_loop != loop:
-                        other_representative = other_loop[0]
-                        self._successors[other_representative].add(representative)
-                        self._predecessors[representative].add(other_representative)
-
-                for edge in cfg.successors(vertex):
-                    other_loop = self.get_loop(edge.successor())
-                    if other_loop != loop:
-                        other_representative = other_loop[0]
-                        self._predecessors[other_representative].add(representative)
-                        self._successors[representative].add(other_representative)
+    def get_loop(self, vertex: Vertex) -> Loop or None:
+        return self._loop.get(vertex)
 
     def __str__(self):
         value = ''
         for loop in self._loops:
-            representative = loop[0]
-            value += 'Loop: ' + ' '.join(str(vertex) for vertex in loop) + '\n'
-            for other_representative in self._successors[representative]:
-                value += '{}=>{}'.format(representative, other_representative) + '\n'
-            value += '\n'
+            value += 'Headers: {}\n'.format(','.join(str(vertex) for vertex in sorted(loop.headers)))
+            value += 'Body: {}\n'.format(','.join(str(vertex) for vertex in sorted(loop.body)))
         return value
 
     def __len__(self):
         return len(self._loops)
 
     def __iter__(self):
+        # Outer loops are always added before the loops they contain.
         for loop in self._loops:
             yield loop
 
 
-def identify_loops(cfg: ControlFlowGraph):
-    pre_id = 0
-    stack = []
+def identify_loops(flow_graph: FlowGraph) -> LoopHierarchy:
     pre_order = {}
     low_link = {}
-    on_stack = {}
+    on_stack = set()
     dead_edges = set()
 
-    def explore(vertex: Vertex, killed_vertices: Set[Vertex], loops: Set[Set[Vertex]]):
-        nonlocal pre_id
-
-        pre_id += 1
-        pre_order[vertex] = pre_id
-        low_link[vertex] = pre_id
-        on_stack[vertex] = True
-        stack.append(vertex)
-
-        for edge in cfg.successors(vertex):
+    def successors(vertex: Vertex) -> Iterable[Vertex]:
+        for edge in flow_graph.successors(vertex):
             if edge not in dead_edges:
-                successor = edge.successor()
+                yield edge.successor()
 
-                if pre_order[successor] == 0:
-                    explore(successor, killed_vertices, forest)
-                    low_link[vertex] = min(low_link[vertex], low_link[successor])
-                elif on_stack[successor]:
+    def explore(root: Vertex, killed_vertices: Set[Vertex], loops: List[Tuple[Vertex, List[Vertex]]]):
+        pre_order[root] = low_link[root] = len(pre_order)
+        stack = [root]
+        on_stack.add(root)
+        frames = [(root, successors(root))]
+        while frames:
+            vertex, remaining = frames[-1]
+            descended = False
+            for successor in remaining:
+                if successor not in pre_order:
+                    pre_order[successor] = low_link[successor] = len(pre_order)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    frames.append((successor, successors(successor)))
+                    descended = True
+                    break
+                elif successor in on_stack:
                     low_link[vertex] = min(low_link[vertex], pre_order[successor])
 
-        if low_link[vertex] == pre_order[vertex]:
-            loop = []
-            done = False
-            while not done:
-                z = stack.pop()
-                on_stack[z] = False
-                loop.append(z)
-                done = z == vertex
+            if not descended:
+                frames.pop()
+                if frames:
+                    parent = frames[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[vertex])
+
+                if low_link[vertex] == pre_order[vertex]:
+                    loop = []
+                    done = False
+                    while not done:
+                        z = stack.pop()
+                        on_stack.remove(z)
+                        loop.append(z)
+                        done = z == vertex
 
-            if len(loop) == 1 and not cfg.has_edge(vertex, vertex):
-                killed_vertices.add(vertex)
-            else:
-                loops.append(loop)
+                    if len(loop) == 1 and vertex not in successors(vertex):
+                        killed_vertices.add(vertex)
+                    else:
+                        loops.append((vertex, loop))
 
     forest = LoopHierarchy()
-    alive_vertices = {vertex for vertex in cfg}
+    alive_vertices = {vertex for vertex in flow_graph}
     while alive_vertices:
-        pre_id = 0
-        for vertex in alive_vertices:
-            pre_order[vertex] = 0
-            low_link[vertex] = 0
-            on_stack[vertex] = False
+        pre_order.clear()
+        pre_order.update((vertex, -1) for vertex in flow_graph if vertex not in alive_vertices)
+        low_link.clear()
 
         killed_vertices = set()
         loops = []
         for vertex in alive_vertices:
-            if pre_order[vertex] == 0:
+            if vertex not in pre_order:
                 explore(vertex, killed_vertices, loops)
 
         alive_vertices.difference_update(killed_vertices)
 
-        for loop in loops:
-            forest.add_loop(loop)
+        for root, loop in loops:
+            members = set(loop)
             headers = set()
             for vertex in loop:
-                for edge in cfg.predecessors(vertex):
-                    if edge.successor() == cfg.entry or edge.predecessor() not in loop:
+                for edge in flow_graph.predecessors(vertex):
+                    if vertex == flow_graph.entry or edge.predecessor() not in members:
                         headers.add(vertex)
 
-                if vertex in headers:
-                    for edge in cfg.predecessors(vertex):
-                        if edge.predecessor() in loop:
-                            dead_edges.add(edge)
+            if not headers:
+                # Nothing enters the component, so the vertex where the search found it has to stand in as header.
+                headers.add(root)
+
+            for vertex in headers:
+                for edge in flow_graph.predecessors(vertex):
+                    if edge.predecessor() in members:
+                        dead_edges.add(edge)
+
+            forest.add_loop(headers, loop)
+
+    return forest
+
+
+def calculate(flow_graph: FlowGraph,
+              vertex_times: Dict[Vertex, int],
+              bounds: Dict[Vertex, int],
+              edge_times: Dict[Edge, int] = None) -> int or None:
+    """
+    Computes the WCET of a flow graph as a longest path rather than through an ILP.  Loops are collapsed bottom-up: the
+    body of each loop, with its inner loops already collapsed, is acyclic once the back edges are ignored, so one pass
+    in topological order gives the longest iteration and the longest path to each exit edge.  Every entry into a loop
+    then costs (bound - 1) longest iterations plus the longest path to the exit taken, where 'bounds' gives the number
+    of times each header executes per entry into its loop.  This is the same answer an ILP with relative loop bounds
+    would give.  Returns None when the graph has an irreducible loop or a loop without a bound, so that the caller can
+    fall back to an ILP.
+    """
+    if edge_times is None:
+        edge_times = {}
+
+    hierarchy = identify_loops(flow_graph)
+    exits = {}
+    closed = {}
+
+    def enter(vertex: Vertex, loop: Loop or None) -> Tuple[Vertex or Loop or None, bool]:
+        # Finds what is entered within 'loop' on reaching 'vertex': the vertex itself, the inner loop containing it,
+        # or nothing because the vertex lies outside the loop.  Inner loops must be entered through their header.
+        inner = hierarchy.get_loop(vertex)
+        child = None
+        while inner != loop:
+            if inner is None:
+                return None, True
+            child = inner
+            inner = inner.parent
+
+        if child is None:
+            return vertex, True
+        return child, vertex in child.headers
+
+    def transitions(node: Vertex or Loop) -> Iterable[Tuple[Edge, int]]:
+        if isinstance(node, Loop):
+            yield from exits[node].items()
+        else:
+            for edge in flow_graph.successors(node):
+                yield edge, vertex_times[node] + edge_times.get(edge, 0)
+
+    def traverse(start: Vertex or Loop, loop: Loop or None):
+        successors = {}
+        in_degree = {start: 0}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            successors[node] = []
+            for edge, cost in transitions(node):
+                if loop and edge.successor() in loop.headers:
+                    successors[node].append((loop, edge, cost))
+                else:
+                    target, reducible = enter(edge.successor(), loop)
+                    if not reducible:
+                        return None
+                    successors[node].append((target, edge, cost))
+                    if target is not None:
+                        if target not in in_degree:
+                            in_degree[target] = 0
+                            stack.append(target)
+                        in_degree[target] += 1
+
+        distances = {start: 0}
+        iteration = None
+        leaving = {}
+        ready = [start]
+        while ready:
+            node = ready.pop()
+            for target, edge, cost in successors[node]:
+                value = distances[node] + cost
+                if target is None:
+                    leaving[edge] = max(leaving.get(edge, value), value)
+                elif target is loop:
+                    iteration = value if iteration is None else max(iteration, value)
+                else:
+                    distances[target] = max(distances.get(target, value), value)
+                    in_degree[target] -= 1
+                    if in_degree[target] == 0:
+                        ready.append(target)
+
+        if any(in_degree[node] for node in successors):
+            return None
+        return distances, iteration, leaving
+
+    for loop in reversed(list(hierarchy)):
+        if len(loop.headers) != 1:
+            return None
+
+        header = next(iter(loop.headers))
+        if bounds.get(header) is None:
+            return None
+
+        result = traverse(header, loop)
+        if result is None:
+            return None
+
+        _, iteration, leaving = result
+        bound = bounds[header]
+        exits[loop] = {}
+        if bound > 0:
+            repeats = (bound - 1) * iteration if iteration is not None else 0
+            for edge, cost in leaving.items():
+                exits[loop][edge] = cost + repeats
+            if not leaving and iteration is not None:
+                closed[loop] = bound * iteration
+
+    start, reducible = enter(flow_graph.entry, None)
+    if not reducible:
+        return None
 
-    forest.add_edges(cfg)
-    print(forest)
+    result = traverse(start, None)
+    if result is None:
+        return None
 
+    distances, _, _ = result
+    candidates = [distance + closed[node] for node, distance in distances.items() if node in closed]
+    if flow_graph.exit in distances:
+        candidates.append(distances[flow_graph.exit] + vertex_times[flow_graph.exit])
 
-def calculate(cfg: ControlFlowGraph):
-    identify_loops(cfg)
+    if candidates:
+        return max(candidates)
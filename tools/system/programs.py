@@ -2,21 +2,26 @@ from collections import OrderedDict
 from graphs import edges, graphs, vertices
 from low_level import instructions
 from random import randint
-from typing import List
+from typing import Callable, Dict, List
 from utils import messages
 
 import json
 import os
+import re
 
 
 class Subprogram:
-    def __init__(self, cfg: graphs.ControlFlowGraph, call_vertex: vertices.SubprogramVertex):
+    def __init__(self,
+                 cfg: graphs.ControlFlowGraph,
+                 call_vertex: vertices.SubprogramVertex,
+                 loader: Callable[[], None] = None):
         if not cfg.name == call_vertex.name:
             raise ValueError('Subprogram name mismatch: Found {} and {}'.format(cfg.name, call_vertex.name))
         self._cfg = cfg
         self._call_vertex = call_vertex
         self._lnt = None
         self._ipg = None
+        self._loader = loader
 
     @property
     def name(self):
@@ -24,8 +29,16 @@ class Subprogram:
 
     @property
     def cfg(self) -> graphs.ControlFlowGraph:
+        # A lazily read program fills in the CFG the first time it is asked for.
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            loader()
         return self._cfg
 
+    @property
+    def loaded(self) -> bool:
+        return self._loader is None
+
     @property
     def lnt(self) -> graphs.LoopNest:
         return self._lnt
@@ -117,6 +130,8 @@ class Program:
 
 
 class IO:
+    INDEX_VERSION = 1
+
     @classmethod
     def write(cls, program: Program, filename: str):
         subprograms_json = {}
@@ -148,68 +163,57 @@ class IO:
 
 
     @classmethod
-    def read(cls, filename: str) -> Program:
+    def read(cls, filename: str, lazy: bool = False) -> Program:
+        """
+        Reads a program.  A lazy read builds the call graph straight away but leaves the CFG of each subprogram, apart
+        from its call sites, unread until the subprogram's CFG is first asked for, so tools that analyse a few
+        subprograms do not pay for the rest.  It relies on an index of where each subprogram lies in the file; a
+        program that cannot be indexed is read in full.  IDs of vertices still to be built are reserved, so every
+        vertex gets the same ID whichever way the program is read.
+        """
         messages.debug_message("Reading program from '{}'".format(filename))
 
+        index = cls._read_index(filename) if lazy else None
         program = Program(filename)
         cfgs = []
+        loaders = {}
         calls = []
-        with open(filename) as json_file:
-            program_json = json.load(json_file)
-            magic_info = program_json[0]
-            program.magic = magic_info[1]
-            subprograms_json = program_json[1]
-            for subprogram_name, (vertices_json, edges_json) in subprograms_json.items():
+        if index is not None:
+            program.magic, subprograms_index = index
+            for subprogram_name, start, end, lowest, highest, sites_json in subprograms_index:
                 cfg = graphs.ControlFlowGraph(program, subprogram_name)
                 cfgs.append(cfg)
-
-                for vertex_json in vertices_json:
-                    vertex_id = int(vertex_json[0])
-                    vertex = vertices.BasicBlock(vertex_id)
-                    cfg.add_vertex(vertex)
-
-                    instruction_json = vertex_json[1]
-                    for instruction_text in instruction_json:
-                        if instruction_text[0] == instructions.CallInstruction.OPCODE:
-                            callee = instruction_text[1]
-                            calls.append([cfg.name, callee, vertex])
-                            vertex.instructions.append(instructions.CallInstruction(callee))
-                        elif instruction_text[0] == instructions.BranchInstruction.OPCODE:
-                            vertex.instructions.append(instructions.BranchInstruction())
-                        elif instruction_text[0] == instructions.StoreInstruction.OPCODE:
-                            vertex.instructions.append(instructions.StoreInstruction())
-                        elif instruction_text[0] == instructions.LoadInstruction.OPCODE:
-                            vertex.instructions.append(instructions.LoadInstruction())
-                        elif instruction_text[0] == instructions.AddInstruction.OPCODE:
-                            vertex.instructions.append(instructions.AddInstruction())
-                        elif instruction_text[0] == instructions.SubtractInstruction.OPCODE:
-                            vertex.instructions.append(instructions.SubtractInstruction())
-                        elif instruction_text[0] == instructions.MultiplyInstruction.OPCODE:
-                            vertex.instructions.append(instructions.MultiplyInstruction())
-                        elif instruction_text[0] == instructions.DivideInstruction.OPCODE:
-                            vertex.instructions.append(instructions.DivideInstruction())
-
-                for edge_json in edges_json:
-                    predecessor_id, successor_id = edge_json
-                    predecessor = vertices.Vertex.id_pool[int(predecessor_id)]
-                    successor = vertices.Vertex.id_pool[int(successor_id)]
-                    cfg.add_edge(edges.ControlFlowEdge(predecessor, successor))
+                vertices.Vertex.id_pool.reserve(lowest)
+                vertices.Vertex.id_pool.reserve(highest)
+                sites = {}
+                for vertex_json in sites_json:
+                    sites[int(vertex_json[0])] = cls._create_basic_block(vertex_json, cfg.name, calls)
+
+                def load(cfg=cfg, start=start, end=end, sites=sites):
+                    with open(filename, 'rb') as rd:
+                        rd.seek(start)
+                        vertices_json, edges_json = json.loads(rd.read(end - start))
+                    cls._fill(cfg, vertices_json, edges_json, sites, [])
+                    cls._close(cfg)
+
+                loaders[cfg.name] = load
+        else:
+            with open(filename) as json_file:
+                program_json = json.load(json_file)
+                magic_info = program_json[0]
+                program.magic = magic_info[1]
+                subprograms_json = program_json[1]
+                for subprogram_name, (vertices_json, edges_json) in subprograms_json.items():
+                    cfg = graphs.ControlFlowGraph(program, subprogram_name)
+                    cfgs.append(cfg)
+                    cls._fill(cfg, vertices_json, edges_json, {}, calls)
 
         for cfg in cfgs:
             call = vertices.SubprogramVertex(vertices.Vertex.get_vertex_id(), cfg.name)
-            subprogram = Subprogram(cfg, call)
+            subprogram = Subprogram(cfg, call, loaders.get(cfg.name))
             program.add_subprogram(subprogram)
-
-            for vertex in cfg:
-                if len(cfg.predecessors(vertex)) == 0:
-                    assert cfg.entry is None
-                    cfg.entry = vertex
-
-                if len(cfg.successors(vertex)) == 0:
-                    assert cfg.exit is None
-                    cfg.exit = vertex
-
-            cfg.add_edge(edges.ControlFlowEdge(cfg.exit, cfg.entry))
+            if subprogram.loaded:
+                cls._close(cfg)
 
         for caller, callee, site in calls:
             caller = program[caller].call_vertex
@@ -217,3 +221,133 @@ class IO:
             program.call_graph.add_edge(edges.CallGraphEdge(caller, callee, site))
 
         return program
+
+    @classmethod
+    def _read_index(cls, filename: str):
+        """
+        Returns the magic of the program and, for each subprogram in file order, its name, where its JSON starts and
+        ends in the file, its smallest and largest vertex IDs and the JSON of its call sites.  The index is kept beside
+        the cache of the program and rebuilt, with one pass over the file, whenever the file changes.  Returns None if
+        the file cannot be indexed.
+        """
+        status = os.stat(filename)
+        stamp = [cls.INDEX_VERSION, status.st_size, status.st_mtime_ns]
+        directory, basename = os.path.split(os.path.abspath(filename))
+        index_filename = os.path.join(directory, '.cache', '{}.index'.format(basename))
+        try:
+            with open(index_filename) as rd:
+                saved_stamp, magic, subprograms_index = json.load(rd)
+            if saved_stamp == stamp:
+                return magic, subprograms_index
+        except (OSError, ValueError):
+            pass
+
+        with open(filename, 'rb') as rd:
+            text = rd.read().decode()
+        if not text.isascii():
+            # Offsets into the text are then not offsets into the file.
+            return None
+
+        decoder = json.JSONDecoder()
+        whitespace = re.compile(r'[ \t\n\r]*')
+
+        def skip(position: int, expected: str = None) -> int:
+            position = whitespace.match(text, position).end()
+            if expected is not None:
+                if text[position] != expected:
+                    raise ValueError("Expected '{}' at offset {}".format(expected, position))
+                position = whitespace.match(text, position + 1).end()
+            return position
+
+        try:
+            position = skip(0, '[')
+            magic_info, position = decoder.raw_decode(text, position)
+            position = skip(position, ',')
+            position = skip(position, '{')
+            subprograms_index = []
+            while text[position] != '}':
+                subprogram_name, position = decoder.raw_decode(text, position)
+                start = skip(position, ':')
+                (vertices_json, _), end = decoder.raw_decode(text, start)
+                vertex_ids = [int(vertex_json[0]) for vertex_json in vertices_json]
+                sites_json = [vertex_json for vertex_json in vertices_json
+                              if any(instruction_text[0] == instructions.CallInstruction.OPCODE
+                                     for instruction_text in vertex_json[1])]
+                subprograms_index.append([subprogram_name,
+                                          start,
+                                          end,
+                                          min(vertex_ids, default=0),
+                                          max(vertex_ids, default=0),
+                                          sites_json])
+                position = skip(end)
+                if text[position] == ',':
+                    position = skip(position, ',')
+        except (ValueError, IndexError) as e:
+            messages.debug_message("Cannot index '{}': {}".format(filename, e))
+            return None
+
+        try:
+            os.makedirs(os.path.dirname(index_filename), exist_ok=True)
+            with open(index_filename, 'w') as wd:
+                json.dump([stamp, magic_info[1], subprograms_index], wd)
+        except OSError as e:
+            messages.debug_message("Cannot write index '{}': {}".format(index_filename, e))
+        return magic_info[1], subprograms_index
+
+    @classmethod
+    def _create_basic_block(cls, vertex_json, subprogram_name: str, calls: List) -> vertices.BasicBlock:
+        vertex = vertices.BasicBlock(int(vertex_json[0]))
+        instruction_json = vertex_json[1]
+        for instruction_text in instruction_json:
+            if instruction_text[0] == instructions.CallInstruction.OPCODE:
+                callee = instruction_text[1]
+                calls.append([subprogram_name, callee, vertex])
+                vertex.instructions.append(instructions.CallInstruction(callee))
+            elif instruction_text[0] == instructions.BranchInstruction.OPCODE:
+                vertex.instructions.append(instructions.BranchInstruction())
+            elif instruction_text[0] == instructions.StoreInstruction.OPCODE:
+                vertex.instructions.append(instructions.StoreInstruction())
+            elif instruction_text[0] == instructions.LoadInstruction.OPCODE:
+                vertex.instructions.append(instructions.LoadInstruction())
+            elif instruction_text[0] == instructions.AddInstruction.OPCODE:
+                vertex.instructions.append(instructions.AddInstruction())
+            elif instruction_text[0] == instructions.SubtractInstruction.OPCODE:
+                vertex.instructions.append(instructions.SubtractInstruction())
+            elif instruction_text[0] == instructions.MultiplyInstruction.OPCODE:
+                vertex.instructions.append(instructions.MultiplyInstruction())
+            elif instruction_text[0] == instructions.DivideInstruction.OPCODE:
+                vertex.instructions.append(instructions.DivideInstruction())
+        return vertex
+
+    @classmethod
+    def _fill(cls,
+              cfg: graphs.ControlFlowGraph,
+              vertices_json,
+              edges_json,
+              sites: Dict[int, vertices.BasicBlock],
+              calls: List):
+        for vertex_json in vertices_json:
+            vertex_id = int(vertex_json[0])
+            if vertex_id in sites:
+                cfg.add_vertex(sites[vertex_id])
+            else:
+                cfg.add_vertex(cls._create_basic_block(vertex_json, cfg.name, calls))
+
+        for edge_json in edges_json:
+            predecessor_id, successor_id = edge_json
+            predecessor = vertices.Vertex.id_pool[int(predecessor_id)]
+            successor = vertices.Vertex.id_pool[int(successor_id)]
+            cfg.add_edge(edges.ControlFlowEdge(predecessor, successor))
+
+    @classmethod
+    def _close(cls, cfg: graphs.ControlFlowGraph):
+        for vertex in cfg:
+            if len(cfg.predecessors(vertex)) == 0:
+                assert cfg.entry is None
+                cfg.entry = vertex
+
+            if len(cfg.successors(vertex)) == 0:
+                assert cfg.exit is None
+                cfg.exit = vertex
+
+        cfg.add_edge(edges.ControlFlowEdge(cfg.exit, cfg.entry))
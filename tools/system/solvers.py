@@ -0,0 +1,494 @@
+import abc
+import decimal
+import os
+import random
+import re
+import subprocess
+import timeit
+
+from array import array
+from enum import Enum
+from math import inf
+from typing import Dict, List
+from utils import messages
+
+
+class Backend(Enum):
+    lp_solve = 'lp_solve'
+    scipy = 'scipy'
+
+    def __str__(self):
+        return self.value
+
+
+class ConstraintMatrix:
+    """
+    An integer linear program in compressed sparse row (CSR) form: one column per variable and one row per constraint.
+    Columns are found through an arbitrary hashable key so that callers can index variables by the vertices and edges
+    they model; the variable object itself is only needed when the program is written out or the solution is reported.
+    Rows are bounded on both sides: an equality has equal bounds and a less-or-equal has an infinite lower bound.
+    """
+
+    def __init__(self):
+        self.variables = []
+        self.objective = array('d')
+        self.integers = array('b')
+        self.indptr = array('q', [0])
+        self.columns = array('q')
+        self.values = array('d')
+        self.lower = array('d')
+        self.upper = array('d')
+        self._key_to_column = {}
+
+    def column(self, key) -> int:
+        return self._key_to_column[key]
+
+    def add_column(self, key, variable=None) -> int:
+        """
+        The column of the key, which is appended with a zero objective coefficient if the key has no column yet.
+        """
+        try:
+            return self._key_to_column[key]
+        except KeyError:
+            column = len(self.variables)
+            self._key_to_column[key] = column
+            self.variables.append(key if variable is None else variable)
+            self.objective.append(0)
+            self.integers.append(False)
+            return column
+
+    def has_column(self, key) -> bool:
+        return key in self._key_to_column
+
+    def add_row(self, coefficients: Dict[int, float], lower, upper):
+        for column, value in coefficients.items():
+            if value:
+                self.columns.append(column)
+                self.values.append(value)
+        self.indptr.append(len(self.columns))
+        self.lower.append(lower)
+        self.upper.append(upper)
+
+    def detach(self) -> 'ConstraintMatrix':
+        """
+        A copy that shares the coefficient arrays but keys and names columns by strings, so that it pickles without
+        dragging the graphs behind its variables into another process.
+        """
+        matrix = ConstraintMatrix()
+        matrix.variables = self.names
+        matrix._key_to_column = {name: column for column, name in enumerate(matrix.variables)}
+        for attribute in ['objective', 'integers', 'indptr', 'columns', 'values', 'lower', 'upper']:
+            setattr(matrix, attribute, getattr(self, attribute))
+        return matrix
+
+    def copy(self, share_structure=True) -> 'ConstraintMatrix':
+        """
+        A copy whose objective and row bounds can be changed without touching this matrix.  With share_structure, the
+        columns, their keys and the coefficient arrays are shared rather than copied, as they are never changed once
+        the program is built.
+        """
+        matrix = ConstraintMatrix()
+        if share_structure:
+            matrix.variables = self.variables
+            matrix._key_to_column = self._key_to_column
+            for attribute in ['integers', 'indptr', 'columns', 'values']:
+                setattr(matrix, attribute, getattr(self, attribute))
+        else:
+            matrix.variables = list(self.variables)
+            matrix._key_to_column = dict(self._key_to_column)
+            for attribute in ['integers', 'indptr', 'columns', 'values']:
+                setattr(matrix, attribute, array(getattr(self, attribute).typecode, getattr(self, attribute)))
+        for attribute in ['objective', 'lower', 'upper']:
+            setattr(matrix, attribute, array('d', getattr(self, attribute)))
+        return matrix
+
+    @property
+    def names(self) -> List[str]:
+        return [str(variable) for variable in self.variables]
+
+    def number_of_rows(self):
+        return len(self.lower)
+
+    def number_of_columns(self):
+        return len(self.variables)
+
+    def row(self, index):
+        for i in range(self.indptr[index], self.indptr[index + 1]):
+            yield self.columns[i], self.values[i]
+
+    def write_lp(self, filename, shuffle=False):
+        """
+        Writes the program in lp_solve's format.  With shuffle, the objective terms, the constraints and the integer
+        declarations come out in a random order, so that repeated timings of a solver do not all see the same one.
+        """
+        names = self.names
+        objective = [(column, value) for column, value in enumerate(self.objective) if value]
+        rows = list(range(self.number_of_rows()))
+        integers = [column for column, integer in enumerate(self.integers) if integer]
+        if shuffle:
+            random.shuffle(objective)
+            random.shuffle(rows)
+            random.shuffle(integers)
+
+        with open(filename, 'w') as wd:
+            wd.write('max:\n{};\n\n'.format(' +\n'.join('{} {}'.format(number(value), names[column])
+                                                         for column, value in objective)))
+            for index in rows:
+                if self.indptr[index] < self.indptr[index + 1]:
+                    label = ''
+                    left = linear_sum((value, names[column]) for column, value in self.row(index))
+                elif self.lower[index] <= 0 <= self.upper[index]:
+                    # Every coefficient cancelled out and 0 is within the bounds, so the row constrains nothing.
+                    continue
+                else:
+                    # Every coefficient cancelled out but 0 is outside the bounds, so the program is infeasible.  lp_solve
+                    # reads a row with one variable as a bound unless the row is named.
+                    label = 'R{}: '.format(index)
+                    left = '0 {}'.format(names[0])
+                if self.lower[index] == self.upper[index]:
+                    wd.write('{}{} = {};\n'.format(label, left, number(self.upper[index])))
+                elif self.lower[index] == -inf:
+                    wd.write('{}{} <= {};\n'.format(label, left, number(self.upper[index])))
+                elif self.upper[index] == inf:
+                    wd.write('{}{} >= {};\n'.format(label, left, number(self.lower[index])))
+                else:
+                    wd.write('{}{} <= {} <= {};\n'.format(label,
+                                                          number(self.lower[index]),
+                                                          left,
+                                                          number(self.upper[index])))
+            wd.write('\n\nint\n{};\n'.format(',\n'.join(names[column] for column in integers)))
+
+    def write_mps(self, filename, name='WCET'):
+        """
+        Writes the program in free MPS format.  A row bounded on both sides is written as a greater-or-equal on its
+        lower bound with a range up to its upper bound.
+        """
+        names = self.names
+        entries = [[] for _ in range(self.number_of_columns())]
+        for index in range(self.number_of_rows()):
+            for column, value in self.row(index):
+                entries[column].append(('R{}'.format(index), value))
+
+        with open(filename, 'w') as wd:
+            wd.write('NAME {}\n'.format(name))
+            wd.write('OBJSENSE\n    MAX\n')
+            wd.write('ROWS\n N  COST\n')
+            for index in range(self.number_of_rows()):
+                if self.lower[index] == self.upper[index]:
+                    kind = 'E'
+                elif self.lower[index] == -inf:
+                    kind = 'L'
+                else:
+                    kind = 'G'
+                wd.write(' {}  R{}\n'.format(kind, index))
+
+            wd.write('COLUMNS\n')
+            in_integer_block = False
+            for column in range(self.number_of_columns()):
+                if self.integers[column] != in_integer_block:
+                    in_integer_block = self.integers[column]
+                    wd.write("    MARKER 'MARKER' {}\n".format("'INTORG'" if in_integer_block else "'INTEND'"))
+                if self.objective[column]:
+                    wd.write('    {} COST {}\n'.format(names[column], number(self.objective[column])))
+                for row, value in entries[column]:
+                    wd.write('    {} {} {}\n'.format(names[column], row, number(value)))
+                if not entries[column] and not self.objective[column]:
+                    wd.write('    {} COST 0\n'.format(names[column]))
+            if in_integer_block:
+                wd.write("    MARKER 'MARKER' 'INTEND'\n")
+
+            wd.write('RHS\n')
+            for index in range(self.number_of_rows()):
+                value = self.upper[index] if self.lower[index] == -inf else self.lower[index]
+                if value:
+                    wd.write('    RHS R{} {}\n'.format(index, number(value)))
+
+            wd.write('RANGES\n')
+            for index in range(self.number_of_rows()):
+                if -inf < self.lower[index] < self.upper[index] < inf:
+                    wd.write('    RNG R{} {}\n'.format(index, number(self.upper[index] - self.lower[index])))
+
+            # Some readers give integer columns a default upper bound of 1, so make the bounds explicit.
+            wd.write('BOUNDS\n')
+            for column in range(self.number_of_columns()):
+                wd.write(' PL BND {}\n'.format(names[column]))
+            wd.write('ENDATA\n')
+
+
+def number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def linear_sum(terms):
+    text = ''
+    for coefficient, name in terms:
+        if not text:
+            text = '{} {}'.format(number(coefficient), name)
+        elif coefficient < 0:
+            text += ' - {} {}'.format(number(-coefficient), name)
+        else:
+            text += ' + {} {}'.format(number(coefficient), name)
+    return text
+
+
+class Solution:
+    __slots__ = ['wcet', 'variable_execution_counts', 'solve_time']
+
+    def __init__(self, wcet, variable_execution_counts, solve_time):
+        self.wcet = wcet
+        self.variable_execution_counts = variable_execution_counts
+        self.solve_time = solve_time
+
+
+class Model:
+    """
+    A constraint matrix loaded into a solver and kept there, so that it can be solved again after its objective or the
+    bounds of its rows change.  The matrix passed in is left alone: the model owns copies of the objective and bounds.
+
+    This implementation has no state in the solver worth keeping, so every solve hands the whole program over again.
+    Solvers that can do better return their own model from Solver.load.
+    """
+
+    def __init__(self, solver: 'Solver', matrix: ConstraintMatrix):
+        self._solver = solver
+        self._matrix = matrix.copy()
+
+    def column(self, key) -> int:
+        return self._matrix.column(key)
+
+    def set_objective(self, column: int, coefficient):
+        self._matrix.objective[column] = coefficient
+
+    def set_row_bounds(self, row: int, lower, upper):
+        self._matrix.lower[row] = lower
+        self._matrix.upper[row] = upper
+
+    def matrix(self) -> ConstraintMatrix:
+        return self._matrix
+
+    def write(self, filename):
+        self._matrix.write_lp(filename)
+
+    def solve(self, filename: str) -> Solution:
+        return self._solver.solve(self, filename)
+
+
+class Solver(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    def solve(self, ilp, filename: str) -> Solution:
+        pass
+
+    def load(self, matrix: ConstraintMatrix) -> Model:
+        return Model(self, matrix)
+
+
+class LpSolve(Solver):
+    """
+    Writes the constraint system to a file and launches lp_solve on it.
+    """
+
+    def solve(self, ilp, filename: str) -> Solution:
+        ilp.write(filename)
+
+        # Launch lp_solve with the created file
+        args = ['lp_solve', filename]
+        start = timeit.default_timer()
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, _ = process.communicate()
+        end = timeit.default_timer()
+
+        if process.returncode != 0:
+            messages.error_message("Running '{}' failed with {}".format(' '.join(args), process.returncode))
+
+        # Grab the WCET estimate and the execution counts of variables.
+        wcet = 0
+        variable_execution_counts = {}
+        stdout = stdout.decode()
+        for line in stdout.split(os.linesep):
+            line = line.strip()
+            # Process if the line is not whitespace and has digits in it
+            if line and re.search(r'\d+', line):
+                lexemes = re.split(r'\s+', line)
+                if len(lexemes) == 2:
+                    variable_execution_counts[lexemes[0]] = int(decimal.Decimal(lexemes[1]))
+                else:
+                    wcet = int(round(float(lexemes[-1])))
+
+        return Solution(wcet, variable_execution_counts, end - start)
+
+
+class SciPy(Solver):
+    """
+    Solves the constraint system in process through the HiGHS bindings in scipy.optimize.milp.
+    No file is written.
+    """
+
+    def solve(self, ilp, filename: str) -> Solution:
+        import numpy
+        from scipy.optimize import Bounds, LinearConstraint, milp
+        from scipy.sparse import csr_array
+
+        start = timeit.default_timer()
+        matrix = ilp.matrix()
+        shape = (matrix.number_of_rows(), matrix.number_of_columns())
+        # milp minimises, so negate the objective to maximise.
+        objective = -numpy.frombuffer(matrix.objective, dtype=numpy.float64)
+        constraints = []
+        if matrix.number_of_rows():
+            A = csr_array((numpy.frombuffer(matrix.values, dtype=numpy.float64),
+                           numpy.frombuffer(matrix.columns, dtype=numpy.int64),
+                           numpy.frombuffer(matrix.indptr, dtype=numpy.int64)),
+                          shape=shape)
+            constraints.append(LinearConstraint(A,
+                                                numpy.frombuffer(matrix.lower, dtype=numpy.float64),
+                                                numpy.frombuffer(matrix.upper, dtype=numpy.float64)))
+        result = milp(objective,
+                      constraints=constraints,
+                      integrality=numpy.frombuffer(matrix.integers, dtype=numpy.int8),
+                      bounds=Bounds(0, numpy.inf))
+        end = timeit.default_timer()
+
+        if result.status != 0 or result.x is None:
+            messages.error_message("Solving '{}' in process failed: {}".format(filename, result.message))
+
+        wcet = int(round(-result.fun))
+        variable_execution_counts = {name: int(round(value)) for name, value in zip(matrix.names, result.x)}
+        return Solution(wcet, variable_execution_counts, end - start)
+
+    def load(self, matrix: ConstraintMatrix) -> Model:
+        return SciPyModel(self, matrix)
+
+
+class SciPyModel(Model):
+    """
+    Keeps the sparse matrix, bounds and integrality that scipy.optimize.milp wants, so a solve only converts the
+    objective.  When the highspy package is installed, the program instead stays loaded in a HiGHS instance: changes
+    are applied to it in place and each solve starts from the previous solution, which remains feasible after an
+    objective change and is otherwise discarded by HiGHS.
+    """
+
+    def __init__(self, solver: 'SciPy', matrix: ConstraintMatrix):
+        import numpy
+        from scipy.sparse import csr_array
+
+        Model.__init__(self, solver, matrix)
+        matrix = self._matrix
+        self._lower = numpy.frombuffer(matrix.lower, dtype=numpy.float64)
+        self._upper = numpy.frombuffer(matrix.upper, dtype=numpy.float64)
+        self._integrality = numpy.frombuffer(matrix.integers, dtype=numpy.int8)
+        self._A = None
+        if matrix.number_of_rows():
+            self._A = csr_array((numpy.frombuffer(matrix.values, dtype=numpy.float64),
+                                 numpy.frombuffer(matrix.columns, dtype=numpy.int64),
+                                 numpy.frombuffer(matrix.indptr, dtype=numpy.int64)),
+                                shape=(matrix.number_of_rows(), matrix.number_of_columns()))
+
+        try:
+            import highspy
+        except ImportError:
+            self._highs = None
+        else:
+            self._highs = self._load_into_highs(highspy, numpy)
+
+    def _load_into_highs(self, highspy, numpy):
+        matrix = self._matrix
+        lp = highspy.HighsLp()
+        lp.num_col_ = matrix.number_of_columns()
+        lp.num_row_ = matrix.number_of_rows()
+        lp.sense_ = highspy.ObjSense.kMaximize
+        lp.col_cost_ = numpy.frombuffer(matrix.objective, dtype=numpy.float64)
+        lp.col_lower_ = numpy.zeros(lp.num_col_)
+        lp.col_upper_ = numpy.full(lp.num_col_, highspy.kHighsInf)
+        lp.row_lower_ = numpy.maximum(self._lower, -highspy.kHighsInf)
+        lp.row_upper_ = numpy.minimum(self._upper, highspy.kHighsInf)
+        lp.integrality_ = [highspy.HighsVarType.kInteger if integer else highspy.HighsVarType.kContinuous
+                           for integer in matrix.integers]
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        lp.a_matrix_.num_col_ = lp.num_col_
+        lp.a_matrix_.num_row_ = lp.num_row_
+        lp.a_matrix_.start_ = numpy.frombuffer(matrix.indptr, dtype=numpy.int64).astype(numpy.int32)
+        lp.a_matrix_.index_ = numpy.frombuffer(matrix.columns, dtype=numpy.int64).astype(numpy.int32)
+        lp.a_matrix_.value_ = numpy.frombuffer(matrix.values, dtype=numpy.float64)
+
+        highs = highspy.Highs()
+        highs.setOptionValue('output_flag', False)
+        highs.passModel(lp)
+        self._highspy = highspy
+        self._incumbent = None
+        return highs
+
+    def set_objective(self, column: int, coefficient):
+        Model.set_objective(self, column, coefficient)
+        if self._highs is not None:
+            self._highs.changeColCost(column, coefficient)
+
+    def set_row_bounds(self, row: int, lower, upper):
+        Model.set_row_bounds(self, row, lower, upper)
+        if self._highs is not None:
+            highspy = self._highspy
+            self._highs.changeRowBounds(row, max(lower, -highspy.kHighsInf), min(upper, highspy.kHighsInf))
+
+    def solve(self, filename: str) -> Solution:
+        if self._highs is not None:
+            return self._solve_with_highs(filename)
+
+        import numpy
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        start = timeit.default_timer()
+        objective = -numpy.frombuffer(self._matrix.objective, dtype=numpy.float64)
+        constraints = []
+        if self._A is not None:
+            constraints.append(LinearConstraint(self._A, self._lower, self._upper))
+        result = milp(objective, constraints=constraints, integrality=self._integrality, bounds=Bounds(0, numpy.inf))
+        end = timeit.default_timer()
+
+        if result.status != 0 or result.x is None:
+            messages.error_message("Solving '{}' in process failed: {}".format(filename, result.message))
+        return self._solution(-result.fun, result.x, end - start)
+
+    def _solve_with_highs(self, filename: str) -> Solution:
+        highs = self._highs
+        start = timeit.default_timer()
+        if self._incumbent is not None:
+            highs.setSolution(self._incumbent)
+        highs.run()
+        end = timeit.default_timer()
+
+        if highs.getModelStatus() != self._highspy.HighsModelStatus.kOptimal:
+            messages.error_message("Solving '{}' in process failed: {}".format(filename,
+                                                                               highs.modelStatusToString(
+                                                                                   highs.getModelStatus())))
+        self._incumbent = highs.getSolution()
+        return self._solution(highs.getInfo().objective_function_value, self._incumbent.col_value, end - start)
+
+    def _solution(self, objective_value, values, solve_time) -> Solution:
+        wcet = int(round(objective_value))
+        variable_execution_counts = {name: int(round(value)) for name, value in zip(self._matrix.names, values)}
+        return Solution(wcet, variable_execution_counts, solve_time)
+
+
+_default_backend = Backend.lp_solve
+
+
+def set_default(backend: Backend):
+    global _default_backend
+    _default_backend = backend
+
+
+def get_default() -> Backend:
+    return _default_backend
+
+
+def create(backend: Backend = None) -> Solver:
+    if backend is None:
+        backend = _default_backend
+
+    if backend == Backend.lp_solve:
+        return LpSolve()
+    elif backend == Backend.scipy:
+        return SciPy()
+    else:
+        assert False
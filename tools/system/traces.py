@@ -1,9 +1,16 @@
+import abc
+import mmap
+import numpy
 import os
+import struct
+import zlib
 
+from enum import Enum
 from graphs import edges
 from graphs import vertices
 from graphs import graphs
 from system import programs
+from utils import messages
 
 
 class TraceElement:
@@ -36,6 +43,269 @@ class TraceElement:
                 return edge, time
 
 
+class Format(Enum):
+    text = 'text'
+    binary = 'binary'
+
+    def __str__(self):
+        return self.value
+
+
+# A binary trace file starts with a header holding the signature, the flags and the magic of the program.  A sequence
+# of blocks follows.  A block header gives the size of the payload, the number of events, the number of runs that end
+# in the block and the time of the first event.  The payload holds the labels and then the time deltas as int32,
+# followed by the offsets within the block at which runs end; it is optionally compressed with zlib.  Runs are packed
+# into blocks of a fixed number of events so that short runs do not cost a block each.
+_signature = b'WCETTRC\x01'
+_file_header = struct.Struct('<8sBH')
+_block_header = struct.Struct('<IIIq')
+_compressed = 0x1
+_events_per_block = 1 << 16
+
+
+def is_binary(filename: str) -> bool:
+    with open(filename, 'rb') as rd:
+        return rd.read(len(_signature)) == _signature
+
+
+def read_magic(filename: str) -> str:
+    with open(filename, 'rb') as rd:
+        if rd.read(len(_signature)) == _signature:
+            rd.seek(0)
+            _, _, length = _file_header.unpack(rd.read(_file_header.size))
+            return rd.read(length).decode()
+        rd.seek(0)
+        return rd.readline().decode().strip()
+
+
+def read_blocks(filename: str):
+    """
+    Yields the (label, time) events of a binary trace file as N x 2 arrays together with the offsets within each array
+    at which runs end.
+    """
+    with open(filename, 'rb') as rd:
+        signature, flags, length = _file_header.unpack(rd.read(_file_header.size))
+        if signature != _signature:
+            messages.error_message("'{}' is not a binary trace file".format(filename))
+        rd.seek(length, os.SEEK_CUR)
+
+        while True:
+            header = rd.read(_block_header.size)
+            if not header:
+                break
+            size, number_of_events, number_of_runs, first = _block_header.unpack(header)
+            payload = rd.read(size)
+            if flags & _compressed:
+                payload = zlib.decompress(payload)
+
+            columns = numpy.frombuffer(payload, dtype='<i4')
+            events = numpy.empty((number_of_events, 2), dtype=numpy.int64)
+            events[:, 0] = columns[:number_of_events]
+            events[:, 1] = first + numpy.cumsum(columns[number_of_events:2 * number_of_events], dtype=numpy.int64)
+            yield events, columns[2 * number_of_events:2 * number_of_events + number_of_runs].tolist()
+
+
+def stream(filename: str, labels=None, chunk_size=1 << 24):
+    """
+    Yields the (label, time) events of a trace file as N x 2 arrays, skipping the header that holds the magic of the
+    program.  Binary files are decoded a block at a time; text files are memory mapped and parsed a chunk at a time.
+    Either way memory use does not depend on the length of the trace.  If labels are given then only events carrying
+    one of them are kept.
+    """
+    if labels is not None:
+        labels = numpy.fromiter(labels, dtype=numpy.int64)
+
+    if is_binary(filename):
+        for events, _ in read_blocks(filename):
+            if labels is not None:
+                events = events[numpy.isin(events[:, 0], labels)]
+            yield events
+        return
+
+    with open(filename, 'rb') as rd:
+        if os.fstat(rd.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(rd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            position = mapped.find(b'\n') + 1
+            if position == 0:
+                return
+
+            size = len(mapped)
+            while position < size:
+                end = min(position + chunk_size, size)
+                if end < size:
+                    # Never split a line across chunks.
+                    newline = mapped.rfind(b'\n', position, end)
+                    if newline < 0:
+                        newline = mapped.find(b'\n', end)
+                    end = size if newline < 0 else newline + 1
+
+                events = numpy.fromstring(mapped[position:end], dtype=numpy.int64, sep=' ').reshape(-1, 2)
+                if labels is not None:
+                    events = events[numpy.isin(events[:, 0], labels)]
+                position = end
+                yield events
+
+
+def runs(filename: str):
+    """
+    Yields every run of a trace file as an N x 2 array of (label, time) events.
+    """
+    if is_binary(filename):
+        pieces = []
+        for events, run_ends in read_blocks(filename):
+            start = 0
+            for end in run_ends:
+                pieces.append(events[start:end])
+                yield numpy.concatenate(pieces)
+                pieces = []
+                start = end
+            pieces.append(events[start:])
+        if any(len(piece) for piece in pieces):
+            yield numpy.concatenate(pieces)
+    else:
+        with open(filename, 'r') as rd:
+            rd.readline()
+            run = []
+            for line in rd:
+                lexemes = line.split()
+                if lexemes:
+                    run.append(lexemes)
+                elif run:
+                    yield numpy.array(run, dtype=numpy.int64)
+                    run = []
+            if run:
+                yield numpy.array(run, dtype=numpy.int64)
+
+
+def elements(filename: str):
+    """
+    Yields (program point, time) pairs.  Text files hold one vertex or edge per line; binary files hold vertices only,
+    along with the ghost events that separate runs.
+    """
+    if is_binary(filename):
+        ghost = vertices.InstrumentationVertex.ghost_value()
+        for events, _ in read_blocks(filename):
+            for label, time in events.tolist():
+                if label != ghost:
+                    yield vertices.Vertex.id_pool[label], time
+    else:
+        with open(filename, 'r') as rd:
+            for line in rd:
+                element = TraceElement.parse(line)
+                if element:
+                    yield element
+
+
+class TraceWriter(metaclass=abc.ABCMeta):
+    """
+    Writes runs of (label, time) events to a trace file whose header holds the magic of the program.
+    """
+
+    def __init__(self, filename: str, magic: str):
+        self._filename = filename
+        self._magic = magic
+
+    @abc.abstractmethod
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self._file.close()
+
+    @abc.abstractmethod
+    def write_run(self, run):
+        pass
+
+
+class TextTraceWriter(TraceWriter):
+    def __enter__(self):
+        self._file = open(self._filename, 'w')
+        self._file.write('{}\n\n'.format(self._magic))
+        return self
+
+    def write_run(self, run):
+        if isinstance(run, numpy.ndarray):
+            run = run.tolist()
+        for label, time in run:
+            self._file.write('{} {}\n'.format(label, time))
+        self._file.write('\n')
+
+
+class BinaryTraceWriter(TraceWriter):
+    def __init__(self, filename: str, magic: str, compress: bool = True):
+        TraceWriter.__init__(self, filename, magic)
+        self._compress = compress
+        self._pending = []
+        self._number_of_pending_events = 0
+        self._run_ends = []
+
+    def __enter__(self):
+        magic = self._magic.encode()
+        self._file = open(self._filename, 'wb')
+        self._file.write(_file_header.pack(_signature, _compressed if self._compress else 0, len(magic)))
+        self._file.write(magic)
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.flush(True)
+        TraceWriter.__exit__(self, exception_type, exception_value, traceback)
+
+    def write_run(self, run):
+        run = numpy.asarray(run, dtype=numpy.int64).reshape(-1, 2)
+        self._pending.append(run)
+        self._number_of_pending_events += len(run)
+        self._run_ends.append(self._number_of_pending_events)
+        if self._number_of_pending_events >= _events_per_block:
+            self.flush(False)
+
+    def flush(self, final: bool):
+        events = numpy.concatenate(self._pending) if self._pending else numpy.empty((0, 2), dtype=numpy.int64)
+        start = 0
+        while len(events) - start >= _events_per_block or (final and (start < len(events) or self._run_ends)):
+            end = min(start + _events_per_block, len(events))
+            run_ends = []
+            while self._run_ends and self._run_ends[0] <= end:
+                run_ends.append(self._run_ends.pop(0) - start)
+            self.write_block(events[start:end], run_ends)
+            start = end
+
+        self._pending = [events[start:]]
+        self._number_of_pending_events = len(events) - start
+        self._run_ends = [end - start for end in self._run_ends]
+
+    def write_block(self, block, run_ends):
+        first = int(block[0, 1]) if len(block) else 0
+        deltas = numpy.diff(block[:, 1], prepend=first)
+        if len(block) and (numpy.abs(deltas).max() >= 2 ** 31 or numpy.abs(block[:, 0]).max() >= 2 ** 31):
+            messages.error_message("A label or time delta in '{}' does not fit in 32 bits".format(self._filename))
+
+        payload = b''.join([block[:, 0].astype('<i4').tobytes(),
+                            deltas.astype('<i4').tobytes(),
+                            numpy.array(run_ends, dtype='<i4').tobytes()])
+        if self._compress:
+            payload = zlib.compress(payload)
+        self._file.write(_block_header.pack(len(payload), len(block), len(run_ends), first))
+        self._file.write(payload)
+
+
+def create_writer(filename: str, magic: str, trace_format: Format, compress: bool = True) -> TraceWriter:
+    if trace_format == Format.text:
+        return TextTraceWriter(filename, magic)
+    elif trace_format == Format.binary:
+        return BinaryTraceWriter(filename, magic, compress)
+    else:
+        assert False
+
+
+def extension(trace_format: Format) -> str:
+    if trace_format == Format.text:
+        return 'txt'
+    else:
+        return 'bin'
+
+
 class Trace(list):
     pass
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tools import their packages relative to this directory, as they do when run as scripts.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
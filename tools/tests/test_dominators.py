@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import dominators
+
+tools = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def benchmark(directory, *args):
+    # Offline asserts that the graph is reducible, so it fails on the corpus with multi-entry loops.
+    return subprocess.run([sys.executable,
+                           os.path.join(tools, 'dominators.py'),
+                           '--corpus', 'corpus',
+                           '--vertices', '50',
+                           '--multi', '2',
+                           '--subprograms', '2',
+                           '--algorithms', 'offline', 'tarjan',
+                           '--repeat', '1',
+                           *args],
+                          cwd=directory,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+def results(algorithms):
+    return {'benchmarks': {'p.json:s1': {'algorithms': algorithms}}}
+
+
+def test_error_against_baseline_median_is_a_regression():
+    regressions = dominators.compare_with_baseline(results({'offline': {'error': 'AssertionError: '}}),
+                                                   results({'offline': {'median': 0.5}}),
+                                                   0.25)
+    assert regressions == ['p.json:s1 offline: AssertionError:  versus 0.500000s']
+
+
+def test_error_without_baseline_median_is_not_a_regression():
+    assert not dominators.compare_with_baseline(results({'offline': {'error': 'AssertionError: '}}),
+                                                results({'offline': {'error': 'AssertionError: '}}),
+                                                0.25)
+
+
+def test_error_fails_verification(tmp_path):
+    process = benchmark(str(tmp_path))
+    assert process.returncode == 0, process.stderr
+    process = benchmark(str(tmp_path), '--verify')
+    assert process.returncode == 1
+    assert '2 verification failures and 0 regressions' in process.stderr
@@ -0,0 +1,56 @@
+from graphs import edges, graphs, vertices
+
+
+def create_cfg(name, number_of_vertices, transitions):
+    cfg = graphs.ControlFlowGraph(None, name)
+    basic_blocks = [vertices.BasicBlock(vertices.Vertex.get_vertex_id()) for _ in range(number_of_vertices)]
+    for basic_block in basic_blocks:
+        cfg.add_vertex(basic_block)
+    for predecessor, successor in transitions:
+        cfg.add_edge(edges.ControlFlowEdge(basic_blocks[predecessor], basic_blocks[successor]))
+    cfg.entry = basic_blocks[0]
+    cfg.exit = basic_blocks[-1]
+    return cfg, basic_blocks
+
+
+def create_lnt(cfg):
+    ppg = graphs.ProgramPointGraph.create_from_control_flow_graph(cfg)
+    return ppg, graphs.LoopNests(ppg)
+
+
+def test_loop_nests_of_acyclic_cfg():
+    cfg, basic_blocks = create_cfg('acyclic', 4, [(0, 1), (0, 2), (1, 3), (2, 3)])
+    ppg, lnt = create_lnt(cfg)
+    # The dummy edge from exit to entry makes the whole graph the single, outermost loop.
+    (loop,) = list(lnt)
+    assert loop.header == ppg.entry
+    assert set(loop) == set(ppg)
+    assert lnt.entry == lnt.exit == loop
+    assert lnt.is_outermost_loop(loop)
+
+
+def test_loop_nests_of_cyclic_cfg():
+    # 0 -> 1 -> 2 -> 3 -> 4 -> 5, with 3 -> 2 nested inside 4 -> 1.
+    cfg, basic_blocks = create_cfg('cyclic', 6, [(0, 1), (1, 2), (2, 3), (3, 2), (3, 4), (4, 1), (4, 5)])
+    ppg, lnt = create_lnt(cfg)
+    loops = list(lnt)
+    assert len(loops) == 3
+
+    headers = {loop.header.program_point: loop for loop in loops}
+    assert set(headers) == {basic_blocks[0], basic_blocks[1], basic_blocks[2]}
+    outer, middle, inner = headers[basic_blocks[0]], headers[basic_blocks[1]], headers[basic_blocks[2]]
+    assert lnt.is_outermost_loop(outer)
+    assert lnt.entry == lnt.exit == outer
+
+    def loop_of(basic_block):
+        (loop,) = [loop for loop in loops if ppg[basic_block] in loop]
+        return loop
+
+    assert loop_of(basic_blocks[0]) == loop_of(basic_blocks[5]) == outer
+    assert loop_of(basic_blocks[1]) == loop_of(basic_blocks[4]) == middle
+    assert loop_of(basic_blocks[2]) == loop_of(basic_blocks[3]) == inner
+
+    def transition(predecessor, successor):
+        return ppg[edges.Edge(basic_blocks[predecessor], basic_blocks[successor])]
+
+    assert set(lnt.tails()) == {transition(3, 2), transition(4, 1), ppg.exit}
@@ -0,0 +1,113 @@
+import os
+import shutil
+
+import pytest
+
+from system import calculations, solvers
+
+lp_solve = pytest.mark.skipif(shutil.which('lp_solve') is None, reason='lp_solve is not in the path')
+
+
+def create_ilp():
+    """
+    Maximises x + y subject to x - y <= 10 and y <= 3, where x and y are counted by integer columns.
+    """
+    ilp = calculations.CompactIntegerLinearProgram()
+    x = ilp.add_variable('x', 'x')
+    y = ilp.add_variable('y', 'y')
+    ilp.add_to_objective(x, 1)
+    ilp.add_to_objective(y, 1)
+    ilp.add_constraint([x], [y], calculations.Constraint.LESS_OR_EQUAL, constant=10)
+    ilp.add_constraint([y], [], calculations.Constraint.LESS_OR_EQUAL, constant=3)
+    return ilp
+
+
+def solve_ranged_model(solver, filename):
+    ilp = create_ilp()
+    model = ilp.load(solver)
+    # 2 <= y <= 5 binds from above, and 1 <= x - y <= 4 replaces x - y <= 10.
+    model.set_row_bounds(1, 2, 5)
+    model.set_row_bounds(0, 1, 4)
+    ilp.resolve(filename)
+    return ilp.wcet, ilp.variable_execution_counts['x'], ilp.variable_execution_counts['y']
+
+
+def test_ranged_rows_are_written_with_both_bounds(tmp_path):
+    ilp = create_ilp()
+    model = ilp.load(solvers.SciPy())
+    model.set_row_bounds(1, 2, 5)
+    filename = str(tmp_path / 'ranged.lp')
+    model.write(filename)
+    with open(filename) as rd:
+        assert '2 <= 1 y <= 5;\n' in rd.read()
+
+
+def test_ranged_rows_with_scipy(tmp_path):
+    assert solve_ranged_model(solvers.SciPy(), str(tmp_path / 'ranged.lp')) == (14, 9, 5)
+
+
+@lp_solve
+def test_ranged_rows_give_the_same_solution_with_both_backends(tmp_path):
+    filename = str(tmp_path / 'ranged.lp')
+    assert solve_ranged_model(solvers.LpSolve(), filename) == solve_ranged_model(solvers.SciPy(), filename)
+
+
+def test_mps_is_read_back_by_highs(tmp_path):
+    highspy = pytest.importorskip('highspy')
+    ilp = create_ilp()
+    model = ilp.load(solvers.SciPy())
+    model.set_row_bounds(1, 2, 5)
+    model.set_row_bounds(0, 1, 4)
+    filename = str(tmp_path / 'ranged.mps')
+    model.matrix().write_mps(filename)
+
+    highs = highspy.Highs()
+    highs.setOptionValue('output_flag', False)
+    assert highs.readModel(filename) == highspy.HighsStatus.kOk
+    highs.run()
+    assert highs.getModelStatus() == highspy.HighsModelStatus.kOptimal
+    assert highs.getInfo().objective_function_value == 14
+    assert list(highs.getSolution().col_value) == [9, 5]
+    assert list(highs.getLp().integrality_) == [highspy.HighsVarType.kInteger] * 2
+
+
+def create_cancelled_ilp(constant):
+    """
+    The program of create_ilp with the row x - x <= constant, whose coefficients cancel out.
+    """
+    ilp = create_ilp()
+    x = ilp.column('x')
+    ilp.add_constraint([x], [x], calculations.Constraint.LESS_OR_EQUAL, constant=constant)
+    return ilp
+
+
+def test_satisfied_cancelled_row_is_skipped(tmp_path):
+    filename = str(tmp_path / 'cancelled.lp')
+    create_cancelled_ilp(3).matrix().write_lp(filename)
+    with open(filename) as rd:
+        assert rd.read().count(';\n') == 4
+
+
+def test_violated_cancelled_row_is_written(tmp_path):
+    filename = str(tmp_path / 'cancelled.lp')
+    create_cancelled_ilp(-3).matrix().write_lp(filename)
+    with open(filename) as rd:
+        assert 'R2: 0 x <= -3;\n' in rd.read()
+
+
+def test_violated_cancelled_row_is_infeasible_with_scipy(tmp_path):
+    with pytest.raises(SystemExit):
+        create_cancelled_ilp(-3).solve(str(tmp_path / 'cancelled.lp'), solvers.SciPy())
+
+
+@lp_solve
+def test_violated_cancelled_row_is_infeasible_with_lp_solve(tmp_path):
+    with pytest.raises(SystemExit):
+        create_cancelled_ilp(-3).solve(str(tmp_path / 'cancelled.lp'), solvers.LpSolve())
+
+
+def test_unknown_column_raises_key_error():
+    ilp = create_ilp()
+    with pytest.raises(KeyError):
+        ilp.column('z')
+    assert ilp.number_of_variables() == 2
@@ -0,0 +1,75 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+# Vertex IDs are unique per process, so every tool runs in its own process, as it does from the command line.
+tools = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(script, *args, cwd):
+    process = subprocess.run([sys.executable, os.path.join(tools, script)] + list(args),
+                             cwd=cwd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    assert process.returncode == 0, process.stderr
+    return process.stdout
+
+
+@pytest.fixture(scope='module')
+def program(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('super_blocks'))
+    run('program_generator.py',
+        '--program', 'program.json',
+        '--subprograms', '4',
+        '--loops', '3',
+        '--nesting-depth', '2',
+        '--vertices', '20',
+        '--seed', '1',
+        cwd=directory)
+    run('database_generator.py',
+        '--program', 'program.json',
+        '--database', 'program.db',
+        '--columns', 'program.npz',
+        cwd=directory)
+    return directory
+
+
+def calculate(directory, database, *args):
+    """
+    The report of a calculation without the times and speed ups, which differ from run to run.
+    """
+    stdout = run('super_block_calculations.py',
+                 '--program', 'program.json',
+                 '--database', database,
+                 '--solver', 'scipy',
+                 '--repeat', '2',
+                 *args,
+                 cwd=directory)
+    report = []
+    for line in stdout.splitlines():
+        line = re.sub(r'(solve|construction|total)=[0-9.]+ ', '', line)
+        if re.match(r'>>>>>|PASSED|FAILED|wcet=|variables=', line):
+            report.append(line)
+    return report
+
+
+def test_super_block_and_program_point_ilps_agree(program):
+    report = calculate(program, 'program.db')
+    assert report.count('PASSED') == 4
+    assert 'FAILED' not in report
+    assert len([line for line in report if line.startswith('wcet=')]) == 4
+
+
+@pytest.mark.parametrize('optimisations', [[], ['--fold-optimisation', '--dominator-optimisation']])
+def test_jobs_give_the_same_report_as_a_serial_run(program, optimisations):
+    serial = calculate(program, 'program.db', *optimisations)
+    assert calculate(program, 'program.db', '--jobs', '2', *optimisations) == serial
+    assert calculate(program, 'program.db', '--jobs', '3', *optimisations) == serial
+
+
+def test_columnar_database_gives_the_same_report(program):
+    assert calculate(program, 'program.npz') == calculate(program, 'program.db')
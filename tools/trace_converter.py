@@ -0,0 +1,46 @@
+from argparse import ArgumentParser, Namespace
+from system import traces
+from utils.messages import error_message, verbose_message
+
+
+def main(args: Namespace):
+    if traces.is_binary(args.input) == (args.format == traces.Format.binary):
+        error_message("'{}' is already in {} format".format(args.input, args.format))
+
+    magic = traces.read_magic(args.input)
+    runs = 0
+    with traces.create_writer(args.output, magic, args.format, not args.uncompressed) as writer:
+        for run in traces.runs(args.input):
+            writer.write_run(run)
+            runs += 1
+    verbose_message("Wrote {} runs to '{}'".format(runs, args.output))
+
+
+def parse_the_command_line():
+    parser = ArgumentParser(description='Convert traces between the text and binary formats')
+
+    parser.add_argument('--input',
+                        help='read the traces from this file',
+                        required=True)
+
+    parser.add_argument('--output',
+                        help='write the traces to this file',
+                        required=True)
+
+    parser.add_argument('--format',
+                        type=traces.Format,
+                        choices=list(traces.Format),
+                        help='write traces in this format',
+                        default=traces.Format.binary.name)
+
+    parser.add_argument('--uncompressed',
+                        action='store_true',
+                        help='do not compress the blocks of binary traces',
+                        default=False)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_the_command_line()
+    main(args)
@@ -2,7 +2,7 @@ import argparse
 import sys
 
 from graphs import (edges, graphs, vertices)
-from system import (traces, programs)
+from system import (cache, traces, programs)
 from utils import messages
 
 
@@ -39,20 +39,23 @@ def main(**kwargs):
         name = traces.TraceFile.extract_subprogram(the_program, trace_file)
         subprogram_trace[name] = trace_file
 
-    for subprogram in the_program:
-        if subprogram.name in subprogram_trace:
-            messages.debug_message('Filtering traces for {}'.format(subprogram.name))
-            subprogram.cfg.dotify()
-            ppg = graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg)
-            ppg.dotify()
-
-            lnt = graphs.LoopNests(ppg)
-            lnt.dotify()
-
-            ipg = graphs.InstrumentationPointGraph.create(ppg, lnt)
-            ipg.dotify()
-            all_traces = filter_trace(ppg, ipg, subprogram_trace[subprogram.name])
-            all_traces.write(ipg.trace_filename())
+    with cache.Cache(the_program) as store:
+        for subprogram in the_program:
+            if subprogram.name in subprogram_trace:
+                messages.debug_message('Filtering traces for {}'.format(subprogram.name))
+                subprogram.cfg.dotify()
+                ppg = store.get(subprogram.name,
+                                'ppg',
+                                lambda: graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg))
+                ppg.dotify()
+
+                lnt = store.get(subprogram.name, 'lnt', lambda: graphs.LoopNests(ppg))
+                lnt.dotify()
+
+                ipg = store.get(subprogram.name, 'ipg', lambda: graphs.InstrumentationPointGraph.create(ppg, lnt))
+                ipg.dotify()
+                all_traces = filter_trace(ppg, ipg, subprogram_trace[subprogram.name])
+                all_traces.write(ipg.trace_filename())
 
 
 def parse_the_command_line():
@@ -2,7 +2,7 @@ import argparse
 import sys
 
 from graphs import (edges, graphs, vertices)
-from system import (traces, programs)
+from system import (cache, traces, programs)
 
 
 class BoundSequence(list):
@@ -57,49 +57,46 @@ def parse(ppg: graphs.ProgramPointGraph, lnt, trace):
 
     bounds = {loop: BoundSequence() for loop in lnt if not lnt.is_outermost_loop(loop)}
 
-    with open(trace, 'r') as rd:
-        for line in rd:
-            elements = traces.TraceElement.parse(line)
-            if elements:
-                vertex = ppg[elements[0]]
-
-                if vertex == ppg.entry:
-                    predecessor_time = elements[1]
-                    predecessor = vertex
-                    loop_stack = [lnt.entry]
-                else:
-                    successor_edge = parse_table[predecessor][vertex]
-                    time = elements[1] - predecessor_time
-                    execution_times[successor_edge].append(time)
-
-                    for element in successor_edge:
-                        update_loop_signature(lnt, bounds, loop_stack, element)
-
-                    update_loop_signature(lnt, bounds, loop_stack, vertex)
-
-                    predecessor_time = elements[1]
-                    predecessor = vertex
-
-        for vertex in ppg:
-            for successor_edge in ppg.successors(vertex):
-                print('WCET {} => {}\t{}'.format(vertex,
-                                                 successor_edge.successor(),
-                                                 max(execution_times[successor_edge], default=0)))
-
-        for loop in lnt:
-            if not lnt.is_outermost_loop(loop):
-                sequence = bounds[loop]
-                (loop_transition,) = [successor_edge for successor_edge in lnt.successors(loop)
-                                      if successor_edge.direction == edges.LoopTransition.Direction.EXIT]
-                print('Local  {}\t\t{}'.format(loop.header, sequence.maximum(loop_transition)))
-                if loop_transition.successor() == lnt.exit:
-                    stack = [loop]
-                    while stack:
-                        inner_loop = stack.pop()
-                        inner_sequence = bounds[inner_loop]
-                        print('Global {}\t\t{}'.format(inner_loop.header, inner_sequence.maximum(loop_transition)))
-                        stack.extend([successor_edge.successor() for successor_edge in lnt.successors(inner_loop)
-                                      if successor_edge.direction == edges.LoopTransition.Direction.ENTRY])
+    for elements in traces.elements(trace):
+        vertex = ppg[elements[0]]
+
+        if vertex == ppg.entry:
+            predecessor_time = elements[1]
+            predecessor = vertex
+            loop_stack = [lnt.entry]
+        else:
+            successor_edge = parse_table[predecessor][vertex]
+            time = elements[1] - predecessor_time
+            execution_times[successor_edge].append(time)
+
+            for element in successor_edge:
+                update_loop_signature(lnt, bounds, loop_stack, element)
+
+            update_loop_signature(lnt, bounds, loop_stack, vertex)
+
+            predecessor_time = elements[1]
+            predecessor = vertex
+
+    for vertex in ppg:
+        for successor_edge in ppg.successors(vertex):
+            print('WCET {} => {}\t{}'.format(vertex,
+                                             successor_edge.successor(),
+                                             max(execution_times[successor_edge], default=0)))
+
+    for loop in lnt:
+        if not lnt.is_outermost_loop(loop):
+            sequence = bounds[loop]
+            (loop_transition,) = [successor_edge for successor_edge in lnt.successors(loop)
+                                  if successor_edge.direction == edges.LoopTransition.Direction.EXIT]
+            print('Local  {}\t\t{}'.format(loop.header, sequence.maximum(loop_transition)))
+            if loop_transition.successor() == lnt.exit:
+                stack = [loop]
+                while stack:
+                    inner_loop = stack.pop()
+                    inner_sequence = bounds[inner_loop]
+                    print('Global {}\t\t{}'.format(inner_loop.header, inner_sequence.maximum(loop_transition)))
+                    stack.extend([successor_edge.successor() for successor_edge in lnt.successors(inner_loop)
+                                  if successor_edge.direction == edges.LoopTransition.Direction.ENTRY])
 
 
 def main(**kwargs):
@@ -109,18 +106,21 @@ def main(**kwargs):
     subprogram = the_program[name]
     graph_type = traces.TraceFile.extract_type(the_program, kwargs['trace'])
 
-    ppg = graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg)
-    ppg.dotify()
+    with cache.Cache(the_program) as store:
+        ppg = store.get(subprogram.name,
+                        'ppg',
+                        lambda: graphs.ProgramPointGraph.create_from_control_flow_graph(subprogram.cfg))
+        ppg.dotify()
 
-    lnt = graphs.LoopNests(ppg)
-    lnt.dotify()
+        lnt = store.get(subprogram.name, 'lnt', lambda: graphs.LoopNests(ppg))
+        lnt.dotify()
 
-    if graph_type is graphs.ProgramPointGraph:
-        parse(ppg, lnt, kwargs['trace'])
-    else:
-        ipg = graphs.InstrumentationPointGraph.create(ppg, lnt)
-        ipg.dotify()
-        parse(ipg, lnt, kwargs['trace'])
+        if graph_type is graphs.ProgramPointGraph:
+            parse(ppg, lnt, kwargs['trace'])
+        else:
+            ipg = store.get(subprogram.name, 'ipg', lambda: graphs.InstrumentationPointGraph.create(ppg, lnt))
+            ipg.dotify()
+            parse(ipg, lnt, kwargs['trace'])
 
 
 def parse_the_command_line():
@@ -56,12 +56,15 @@ child_processes = []
 
 
 def generate(dot_filename, data):
+    # Processes that draw graphs with the same name must not remove each other's input.
+    temporary = '{}.{}'.format(dot_filename, os.getpid())
+
     def launch_dot(ext):
         filename = os.path.splitext(dot_filename)[0] + '.' + ext
         messages.debug_message("Generating file '{}'".format(filename))
         try:
             with open(filename, 'w') as out_file:
-                cmd = ["dot", "-T", ext, dot_filename]
+                cmd = ["dot", "-T", ext, temporary]
                 p = subprocess.Popen(cmd, stdout=out_file)
                 child_processes.append(p)
                 _, _ = p.communicate()
@@ -73,7 +76,7 @@ def generate(dot_filename, data):
             messages.debug_message(e)
 
     if __debug__:
-        with open(dot_filename, 'w') as dot_file:
+        with open(temporary, 'w') as dot_file:
             dot_file.write('digraph')
             dot_file.write('{\n')
             dot_file.write('nslimit=2;\n')
@@ -87,7 +90,7 @@ def generate(dot_filename, data):
             dot_file.write('}\n')
 
         launch_dot('png')
-        os.remove(dot_filename)
+        os.remove(temporary)
 
 
 def kill_child_processes():
@@ -7,13 +7,17 @@ def debug_message(*args):
     if __debug__:
         caller_frame = inspect.stack()[1]
         info = inspect.getframeinfo(caller_frame[0])
-        print('[{:%H:%M:%S}: {}@{}]'.format(datetime.datetime.now(), info.function, info.lineno),
-              *args,
-              flush=True)
+        write_line('[{:%H:%M:%S}: {}@{}]'.format(datetime.datetime.now(), info.function, info.lineno), *args)
 
 
 def verbose_message(*args, new_lines=1):
-    print(*args, end='\n' * new_lines, flush=True)
+    write_line(*args, new_lines=new_lines)
+
+
+def write_line(*args, new_lines=1):
+    # One write per message, so that the messages of processes sharing standard output do not interleave.
+    sys.stdout.write(' '.join(str(arg) for arg in args) + '\n' * new_lines)
+    sys.stdout.flush()
 
 
 def error_message(*args):
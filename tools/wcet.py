@@ -1,14 +1,20 @@
+import multiprocessing
+import numpy
+
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from system import graph_based_calculations
 from enum import Enum
+from hashlib import sha1
 from graphs import edges, graphs, vertices
 from random import choice, randint, shuffle
-from system import calculations, programs
-from typing import Dict, List, Set, Tuple
+from system import cache, calculations, programs, solvers, traces
+from typing import Dict, Iterable, List, Set, Tuple
 from utils.messages import error_message, verbose_message
 
 
-def statically_analyse_cfg(cfg: graphs.ControlFlowGraph, execution_times: Dict[vertices.Vertex, int]):
+def statically_analyse_cfg(cfg: graphs.ControlFlowGraph,
+                           execution_times: Dict[vertices.Vertex, int]) -> Tuple[int, Dict[str, int]]:
     def create_objective_function():
         for vertex in cfg:
             variable = calculations.VertexVariable(vertex)
@@ -54,12 +60,17 @@ def statically_analyse_cfg(cfg: graphs.ControlFlowGraph, execution_times: Dict[v
         constraint = calculations.Constraint(lhs, rhs, calculations.Constraint.EQUALITY)
         ilp.add_constraint(constraint)
 
+    # The entry executes once; only an ILP can say anything about loops that have no bounds.
+    wcet = graph_based_calculations.calculate(cfg, execution_times, {cfg.entry: 1})
+    if wcet is not None:
+        return wcet, {}
+
     ilp = calculations.IntegerLinearProgram()
     create_objective_function()
     create_structural_constraints()
     create_loop_bound_constraints()
     ilp.solve('{}.cfg.ilp'.format(cfg.name))
-    return ilp.wcet
+    return ilp.wcet, ilp.variable_execution_counts
 
 
 class MeasuredData:
@@ -86,79 +97,127 @@ class MeasuredData:
             self.temporary_counts[loop] = 0
 
 
-def statically_analyse_ipg(ipg: graphs.InstrumentationPointGraph,
-                           lnt: graphs.LoopNest,
-                           measured_data: MeasuredData,
-                           vertex_times: Dict[vertices.Vertex, int]):
+def create_ilp_for_ipg(ipg: graphs.InstrumentationPointGraph,
+                      lnt: graphs.LoopNest,
+                      measured_data: MeasuredData,
+                      vertex_times: Dict[vertices.Vertex, int]) -> calculations.CompactIntegerLinearProgram:
     def create_objective_function():
         for vertex in ipg:
-            variable = calculations.VertexVariable(vertex)
-            ilp.add_variable(variable)
-            term = calculations.Term(vertex_times[vertex], variable)
-            ilp.add_to_objective(term)
+            column = ilp.add_variable(vertex, calculations.VertexVariable(vertex))
+            ilp.add_to_objective(column, vertex_times[vertex])
 
             if vertex != ipg.exit:
                 for edge in ipg.successors(vertex):
-                    variable = calculations.EdgeVariable(edge)
-                    ilp.add_variable(variable)
-                    term = calculations.Term(measured_data.times[edge], variable)
-                    ilp.add_to_objective(term)
+                    column = ilp.add_variable(edge, calculations.EdgeVariable(edge))
+                    ilp.add_to_objective(column, measured_data.times[edge])
 
     def create_structural_constraints():
         for vertex in ipg:
             if len(ipg.successors(vertex)) > 0:
-                flow_in_lhs = calculations.LinearExpr()
-                for edge in ipg.successors(vertex):
-                    variable = calculations.EdgeVariable(edge)
-                    flow_in_lhs.append(variable)
+                flow_out = [ilp.column(edge) for edge in ipg.successors(vertex)]
+                ilp.add_constraint(flow_out, [ilp.column(vertex)], calculations.Constraint.EQUALITY)
 
-                flow_in_rhs = calculations.LinearExpr()
-                flow_in_rhs.append(calculations.VertexVariable(vertex))
-
-                flow_in_constraint = calculations.Constraint(flow_in_lhs, flow_in_rhs, calculations.Constraint.EQUALITY)
-                ilp.add_constraint(flow_in_constraint)
-
-            if len(ipg.predecessors(vertex)) > 0 and len(ipg.successors(vertex)) > 0:
-                flow_out_lhs = calculations.LinearExpr()
-                for edge in ipg.predecessors(vertex):
-                    variable = calculations.EdgeVariable(edge)
-                    flow_out_lhs.append(variable)
-
-                flow_out_rhs = calculations.LinearExpr()
-                for edge in ipg.successors(vertex):
-                    variable = calculations.EdgeVariable(edge)
-                    flow_out_rhs.append(variable)
-
-                flow_out_constraint = calculations.Constraint(flow_out_lhs, flow_out_rhs, calculations.Constraint.EQUALITY)
-                ilp.add_constraint(flow_out_constraint)
+                if len(ipg.predecessors(vertex)) > 0:
+                    flow_in = [ilp.column(edge) for edge in ipg.predecessors(vertex)]
+                    ilp.add_constraint(flow_in, flow_out, calculations.Constraint.EQUALITY)
 
     def create_execution_count_constraints():
         for loop in lnt:
             if loop == lnt.root:
-                lhs = calculations.LinearExpr()
-                lhs.append(calculations.VertexVariable(ipg.entry))
-                rhs = calculations.LinearExpr()
-                rhs.append(calculations.Term(1))
-                constraint = calculations.Constraint(lhs, rhs, calculations.Constraint.EQUALITY)
-                ilp.add_constraint(constraint)
+                ilp.add_constraint([ilp.column(ipg.entry)], [], calculations.Constraint.EQUALITY, constant=1)
             else:
                 for vertex in loop:
-                    lhs = calculations.LinearExpr()
-                    lhs.append(calculations.VertexVariable(vertex))
-                    rhs = calculations.LinearExpr()
-                    rhs.append(calculations.Term(measured_data.fixed_counts[loop]))
-                    constraint = calculations.Constraint(lhs, rhs, calculations.Constraint.LESS_OR_EQUAL)
-                    ilp.add_constraint(constraint)
+                    ilp.add_constraint([ilp.column(vertex)],
+                                       [],
+                                       calculations.Constraint.LESS_OR_EQUAL,
+                                       constant=measured_data.fixed_counts[loop])
 
-    ilp = calculations.IntegerLinearProgram()
+    ilp = calculations.CompactIntegerLinearProgram()
     create_objective_function()
     create_structural_constraints()
     create_execution_count_constraints()
+    return ilp
+
+
+def solve_ilp(matrix: solvers.ConstraintMatrix,
+              filename: str,
+              backend: solvers.Backend) -> Tuple[int, Dict[str, int]]:
+    ilp = calculations.CompactIntegerLinearProgram(matrix)
+    ilp.solve(filename, solvers.create(backend))
+    return ilp.wcet, ilp.variable_execution_counts
+
+
+def calculate_ipg_wcet_directly(ipg: graphs.InstrumentationPointGraph,
+                                lnt: graphs.LoopNest,
+                                measured_data: MeasuredData,
+                                vertex_times: Dict[vertices.Vertex, int]) -> int or None:
+    # Loop counts in the IPG are observed per invocation of the subprogram rather than per entry into the loop, which
+    # the graph-based calculation cannot express, so only loop-free IPGs avoid the ILP.
+    if lnt.number_of_vertices() == 1:
+        return graph_based_calculations.calculate(ipg, vertex_times, {}, measured_data.times)
+
+
+def statically_analyse_ipg(ipg: graphs.InstrumentationPointGraph,
+                           lnt: graphs.LoopNest,
+                           measured_data: MeasuredData,
+                           vertex_times: Dict[vertices.Vertex, int]) -> Tuple[int, Dict[str, int]]:
+    wcet = calculate_ipg_wcet_directly(ipg, lnt, measured_data, vertex_times)
+    if wcet is not None:
+        return wcet, {}
+
+    ilp = create_ilp_for_ipg(ipg, lnt, measured_data, vertex_times)
     ilp.solve('{}.ipg.ilp'.format(ipg.name))
-    return ilp.wcet
+    return ilp.wcet, ilp.variable_execution_counts
+
+
+def summary_kind(*parts) -> str:
+    """
+    Names the cache entry holding the WCET summary of a subprogram, that is, its WCET and the ILP solution behind it.
+    The name is a digest of everything the WCET depends on, so a summary is only reused while the structure, the
+    instrumentation and the timing data are all unchanged.
+    """
+    return 'wcet.{}'.format(sha1(repr(parts).encode()).hexdigest())
+
+
+def cfg_summary_kind(cfg: graphs.ControlFlowGraph, execution_times: Dict[vertices.Vertex, int]) -> str:
+    structure = sorted((vertex.id_,
+                        execution_times[vertex],
+                        sorted(edge.successor().id_ for edge in cfg.successors(vertex))) for vertex in cfg)
+    return summary_kind('cfg', cfg.entry.id_, cfg.exit.id_, structure)
+
+
+def ipg_summary_kind(ipg: graphs.InstrumentationPointGraph,
+                     lnt: graphs.LoopNest,
+                     measured_data: MeasuredData,
+                     vertex_times: Dict[vertices.Vertex, int]) -> str:
+    # IPG vertices get fresh IDs whenever the program is instrumented, so instrumentation points are named by the
+    # basic block they instrument, and calls by their callee and the points around them.
+    def name(vertex: vertices.Vertex):
+        if isinstance(vertex, vertices.CallVertex):
+            return 'call', vertex.callee
+        return 'point', vertex.label
+
+    keys = {}
+    for vertex in ipg:
+        if isinstance(vertex, vertices.CallVertex):
+            keys[vertex] = (name(vertex),
+                            tuple(sorted(name(edge.predecessor()) for edge in ipg.predecessors(vertex))),
+                            tuple(sorted(name(edge.successor()) for edge in ipg.successors(vertex))))
+        else:
+            keys[vertex] = (name(vertex), (), ())
+
+    structure = sorted((keys[vertex],
+                        vertex_times[vertex],
+                        sorted((keys[edge.successor()], measured_data.times.get(edge, 0))
+                               for edge in ipg.successors(vertex))) for vertex in ipg)
+    loops = sorted((sorted(keys[vertex] for vertex in loop), measured_data.fixed_counts[loop]) for loop in lnt)
+    return summary_kind('ipg', keys[ipg.entry], keys[ipg.exit], structure, loops)
 
 
-def static_analysis(program: programs.Program, root_vertex: vertices.SubprogramVertex, dfs: graphs.DepthFirstSearch):
+def static_analysis(program: programs.Program,
+                    root_vertex: vertices.SubprogramVertex,
+                    dfs: graphs.DepthFirstSearch,
+                    store: cache.Cache = None):
     wcets = {}
     for call_vertex in dfs.post_order():
         subprogram = program[call_vertex.name]
@@ -169,7 +228,13 @@ def static_analysis(program: programs.Program, root_vertex: vertices.SubprogramV
             if callee_vertex:
                 execution_times[vertex] += wcets[callee_vertex]
 
-        wcet = statically_analyse_cfg(subprogram.cfg, execution_times)
+        if store:
+            kind = cfg_summary_kind(subprogram.cfg, execution_times)
+            wcet, _ = store.get(subprogram.name,
+                                kind,
+                                lambda: statically_analyse_cfg(subprogram.cfg, execution_times))
+        else:
+            wcet, _ = statically_analyse_cfg(subprogram.cfg, execution_times)
         wcets[call_vertex] = wcet
 
     print('Static WCET estimate: {}'.format(wcets[root_vertex]))
@@ -460,7 +525,7 @@ def create_ipg(program: programs.Program, instrumented_cfg: graphs.ControlFlowGr
             vertex_to_ipg[vertex] = vertex
 
     changed = True
-    dfs = graphs.DepthFirstSearch(instrumented_cfg, instrumented_cfg.entry)
+    dfs = instrumented_cfg.depth_first_search(instrumented_cfg.entry)
     assert len(dfs.post_order()) == instrumented_cfg.number_of_vertices()
     while changed:
         changed = False
@@ -502,11 +567,12 @@ def create_lnt(ipg: graphs.FlowGraph) -> graphs.LoopNest:
 
     ipg.dotify('ipg')
 
-    while not graphs.is_dag(ipg):
+    # The graph is acyclic once every strong component is trivial, so one search per round answers both questions.
+    sccs = list(graphs.StrongComponents(ipg).non_trivial())
+    while sccs:
         killed_edges = set()
-        sccs = graphs.StrongComponents(ipg)
 
-        for scc in sccs.non_trivial():
+        for scc in sccs:
             loop = loop_nest.create_loop()
             headers = set()
             for vertex in scc:
@@ -528,6 +594,7 @@ def create_lnt(ipg: graphs.FlowGraph) -> graphs.LoopNest:
         for edge in killed_edges:
             ipg.remove_edge(edge)
         edges_to_restore.update(killed_edges)
+        sccs = list(graphs.StrongComponents(ipg).non_trivial())
 
     for edge in edges_to_restore:
         ipg.add_edge(edge)
@@ -552,16 +619,8 @@ def create_lnt(ipg: graphs.FlowGraph) -> graphs.LoopNest:
 
 
 def filter_traces(labels: Set[int], traces_filename: str):
-    trace = []
-    with open(traces_filename, 'r') as traces_file:
-        for line_number, line in enumerate(traces_file):
-            line = line.strip()
-            if line_number > 0 and line:
-                first, second = line.split()
-                first, second = list(map(int, [first, second]))
-                if first in labels:
-                    trace.append((first, second))
-    return trace
+    for events in traces.stream(traces_filename, labels):
+        yield from events.tolist()
 
 
 class ParsingPosition:
@@ -574,83 +633,141 @@ class ParsingPosition:
         self.state = state
 
 
-def parse_traces(program: programs.Program,
+class Transition:
+    __slots__ = ['edge', 'data', 'loop', 'position', 'callee_position']
+
+    def __init__(self, edge, data, loop, position, callee_position):
+        self.edge = edge
+        self.data = data
+        self.loop = loop
+        self.position = position
+        self.callee_position = callee_position
+
+
+def create_transition_table(program: programs.Program, call_table: Dict[int, str], wcet_data: Dict[str, MeasuredData]):
+    def entry_position(subprogram: programs.Subprogram):
+        return ParsingPosition(subprogram.ipg,
+                               subprogram.ipg.entry,
+                               subprogram.lnt,
+                               subprogram.lnt.loop(subprogram.ipg.entry))
+
+    entry_labels = {name: label for label, name in call_table.items()}
+    transitions = {}
+    for subprogram_data in wcet_data.values():
+        subprogram = subprogram_data.subprogram
+        ipg = subprogram.ipg
+        lnt = subprogram.lnt
+        state = lnt.loop(ipg.entry)
+        for vertex in ipg:
+            loop_a = lnt.loop(vertex)
+            for edge in ipg.successors(vertex):
+                candidate = edge.successor()
+                if isinstance(candidate, vertices.InstrumentationVertex):
+                    label = candidate.label
+                    callee_position = None
+                elif candidate.callee in entry_labels:
+                    label = entry_labels[candidate.callee]
+                    callee_position = entry_position(program[candidate.callee])
+                else:
+                    continue
+
+                loop_b = lnt.loop(candidate)
+                if loop_a != loop_b and lnt.level(loop_b) >= lnt.level(loop_a):
+                    loop = loop_b
+                else:
+                    loop = None
+
+                # The first matching successor wins, as it did when successors were scanned per event.
+                if (vertex, label) not in transitions:
+                    transitions[vertex, label] = Transition(edge,
+                                                            subprogram_data,
+                                                            loop,
+                                                            ParsingPosition(ipg, candidate, lnt, state),
+                                                            callee_position)
+    return transitions
+
+
+class TraceParser:
+    """
+    Follows the events of a trace through the IPGs the program has when the parser is created, recording the longest
+    time of each transition and the loop counts in the measured data.  Events may be fed in several pieces, so a single
+    pass over a trace file can feed parsers for several instrumentations at once.
+    """
+
+    def __init__(self,
+                 program: programs.Program,
                  root_vertex: vertices.SubprogramVertex,
                  call_table: Dict[int, str],
-                 trace: List,
                  wcet_data: Dict[str, MeasuredData]):
-    measured_times = set()
-    sentinel = 0
-    root_subprogram = program[root_vertex.name]
-    origin = ParsingPosition(root_subprogram.ipg,
-                             root_subprogram.ipg.entry,
-                             root_subprogram.lnt,
-                             root_subprogram.lnt.loop(root_subprogram.ipg.entry))
-    call_stack = []
-    position = origin
-    for label, tick in trace:
-        if label == sentinel and tick == sentinel:
-            pass
-        else:
-            if label == root_subprogram.ipg.entry.label:
-                assert position.vertex == root_subprogram.ipg.entry
-                call_stack.append(position)
+        self._wcet_data = wcet_data
+        self._transitions = create_transition_table(program, call_table, wcet_data)
+        root_subprogram = program[root_vertex.name]
+        self._root_entry = root_subprogram.ipg.entry
+        self._position = ParsingPosition(root_subprogram.ipg,
+                                         root_subprogram.ipg.entry,
+                                         root_subprogram.lnt,
+                                         root_subprogram.lnt.loop(root_subprogram.ipg.entry))
+        self._call_stack = []
+        self._before = None
+        self.measured_times = set()
+
+    def feed(self, trace: Iterable):
+        sentinel = 0
+        wcet_data = self._wcet_data
+        transitions = self._transitions
+        measured_times = self.measured_times
+        root_label = self._root_entry.label
+        call_stack = self._call_stack
+        position = self._position
+        before = self._before
+        for label, tick in trace:
+            if label == sentinel and tick == sentinel:
+                pass
             else:
-                intra_position_a = position
-                chosen_edge = None
-                for edge in position.ipg.successors(position.vertex):
-                    candidate = edge.successor()
-                    if isinstance(candidate, vertices.InstrumentationVertex):
-                        if candidate.label == label:
-                            position = ParsingPosition(position.ipg,
-                                                       candidate,
-                                                       position.lnt,
-                                                       position.state)
-                            intra_position_b = position
-                            chosen_edge = edge
-                    elif label in call_table:
-                        callee = call_table[label]
-                        if callee == candidate.callee:
-                            return_position = ParsingPosition(position.ipg,
-                                                              candidate,
-                                                              position.lnt,
-                                                              position.state)
-                            call_stack.append(return_position)
-                            intra_position_b = return_position
-
-                            callee_subprogram = program[callee]
-                            position = ParsingPosition(callee_subprogram.ipg,
-                                                       callee_subprogram.ipg.entry,
-                                                       callee_subprogram.lnt,
-                                                       callee_subprogram.lnt.loop(callee_subprogram.ipg.entry))
-                            chosen_edge = edge
-
-                    if chosen_edge:
-                        subprogram_data = wcet_data[intra_position_a.ipg.name]
-                        lnt = intra_position_a.lnt
-                        loop_a = lnt.loop(intra_position_a.vertex)
-                        loop_b = lnt.loop(intra_position_b.vertex)
-                        if loop_a != loop_b and lnt.level(loop_b) >= lnt.level(loop_a):
-                            subprogram_data.temporary_counts[loop_b] += 1
-
-                        elapsed = tick - before
-                        subprogram_data.times[chosen_edge] = max(subprogram_data.times[chosen_edge], elapsed)
-                        break
-
-                if not chosen_edge:
-                    error_message('Parsing error at position {} with label {}'.format(position.vertex.id_, label))
-
-        if position.vertex == position.ipg.exit:
-            subprogram_data = wcet_data[position.ipg.name]
-            subprogram_data.reset_temporary_counts()
-            position = call_stack.pop()
-
-            if not call_stack:
-                measured_times.add(tick)
-
-        before = tick
-
-    return measured_times
+                if label == root_label:
+                    assert position.vertex == self._root_entry
+                    call_stack.append(position)
+                else:
+                    transition = transitions.get((position.vertex, label))
+                    if not transition:
+                        error_message('Parsing error at position {} with label {}'.format(position.vertex.id_, label))
+
+                    subprogram_data = transition.data
+                    if transition.loop is not None:
+                        subprogram_data.temporary_counts[transition.loop] += 1
+
+                    elapsed = tick - before
+                    if elapsed > subprogram_data.times[transition.edge]:
+                        subprogram_data.times[transition.edge] = elapsed
+
+                    if transition.callee_position:
+                        call_stack.append(transition.position)
+                        position = transition.callee_position
+                    else:
+                        position = transition.position
+
+            if position.vertex == position.ipg.exit:
+                subprogram_data = wcet_data[position.ipg.name]
+                subprogram_data.reset_temporary_counts()
+                position = call_stack.pop()
+
+                if not call_stack:
+                    measured_times.add(tick)
+
+            before = tick
+
+        self._position = position
+        self._before = before
+
+
+def parse_traces(program: programs.Program,
+                 root_vertex: vertices.SubprogramVertex,
+                 call_table: Dict[int, str],
+                 trace: Iterable,
+                 wcet_data: Dict[str, MeasuredData]):
+    parser = TraceParser(program, root_vertex, call_table, wcet_data)
+    parser.feed(trace)
+    return parser.measured_times
 
 
 def instrumentation_budget_pipeline(program: programs.Program,
@@ -753,23 +870,41 @@ def instrumentation_policy_pipeline(program: programs.Program, policy: Instrumen
         instrumented_cfgs[subprogram.name] = instrumented_cfg
 
 
+def vertex_times_for_ipg(subprogram: programs.Subprogram, wcets: Dict[str, int]):
+    vertex_times = {}
+    for vertex in subprogram.ipg:
+        if isinstance(vertex, vertices.CallVertex):
+            vertex_times[vertex] = wcets[vertex.callee]
+        else:
+            vertex_times[vertex] = 0
+    return vertex_times
+
+
 def do_hybrid_analysis_wcet_calculation(program: programs.Program,
                                         root_vertex: vertices.SubprogramVertex,
                                         dfs: graphs.DepthFirstSearch,
-                                        wcet_data: Dict) -> int:
+                                        wcet_data: Dict,
+                                        jobs: int = 1,
+                                        store: cache.Cache = None) -> int:
+    if jobs > 1:
+        return do_parallel_hybrid_analysis_wcet_calculation(program, root_vertex, dfs, wcet_data, jobs, store)
+
     wcets = {}
     for call_vertex in dfs.post_order():
         subprogram = program[call_vertex.name]
         if subprogram.ipg:
-            vertex_times = {}
-            for vertex in subprogram.ipg:
-                if isinstance(vertex, vertices.CallVertex):
-                    vertex_times[vertex] = wcets[vertex.callee]
-                else:
-                    vertex_times[vertex] = 0
-
+            vertex_times = vertex_times_for_ipg(subprogram, wcets)
             subprogram_data = wcet_data[call_vertex.name]
-            wcet = statically_analyse_ipg(subprogram.ipg, subprogram.lnt, subprogram_data, vertex_times)
+            if store:
+                kind = ipg_summary_kind(subprogram.ipg, subprogram.lnt, subprogram_data, vertex_times)
+                wcet, _ = store.get(subprogram.name,
+                                    kind,
+                                    lambda: statically_analyse_ipg(subprogram.ipg,
+                                                                   subprogram.lnt,
+                                                                   subprogram_data,
+                                                                   vertex_times))
+            else:
+                wcet, _ = statically_analyse_ipg(subprogram.ipg, subprogram.lnt, subprogram_data, vertex_times)
             wcets[call_vertex.name] = wcet
         else:
             wcets[call_vertex.name] = 0
@@ -777,6 +912,85 @@ def do_hybrid_analysis_wcet_calculation(program: programs.Program,
     return wcets[root_vertex.name]
 
 
+def do_parallel_hybrid_analysis_wcet_calculation(program: programs.Program,
+                                                 root_vertex: vertices.SubprogramVertex,
+                                                 dfs: graphs.DepthFirstSearch,
+                                                 wcet_data: Dict,
+                                                 jobs: int,
+                                                 store: cache.Cache = None) -> int:
+    """
+    Solves the ILPs of subprograms in a process pool.  A subprogram becomes ready once the WCETs of all its callees are
+    known; its ILP is then built here, which is cheap, and handed to a worker as a detached matrix to be solved.  A
+    loop-free subprogram needs no ILP, and a subprogram with a cached summary needs no solve, so their WCETs are known
+    on the spot.
+    """
+    reachable = set(dfs.post_order())
+    waiting = {}
+    for call_vertex in reachable:
+        callees = {edge.successor() for edge in program.call_graph.successors(call_vertex)}
+        waiting[call_vertex] = len(callees & reachable)
+
+    wcets = {}
+    kinds = {}
+    backend = solvers.get_default()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+
+        def finish(call_vertex: vertices.SubprogramVertex, summary: Tuple[int, Dict[str, int]]):
+            if store:
+                store.put(call_vertex.name, kinds[call_vertex], summary)
+            wcets[call_vertex.name], _ = summary
+            release(call_vertex)
+
+        def release(call_vertex: vertices.SubprogramVertex):
+            callers = {edge.predecessor() for edge in program.call_graph.predecessors(call_vertex)}
+            for caller in callers & reachable:
+                waiting[caller] -= 1
+                if waiting[caller] == 0:
+                    schedule(caller)
+
+        def schedule(call_vertex: vertices.SubprogramVertex):
+            subprogram = program[call_vertex.name]
+            if subprogram.ipg:
+                vertex_times = vertex_times_for_ipg(subprogram, wcets)
+                subprogram_data = wcet_data[call_vertex.name]
+                if store:
+                    kinds[call_vertex] = ipg_summary_kind(subprogram.ipg,
+                                                          subprogram.lnt,
+                                                          subprogram_data,
+                                                          vertex_times)
+                    if (subprogram.name, kinds[call_vertex]) in store:
+                        wcets[call_vertex.name], _ = store.get(subprogram.name, kinds[call_vertex], None)
+                        release(call_vertex)
+                        return
+
+                wcet = calculate_ipg_wcet_directly(subprogram.ipg, subprogram.lnt, subprogram_data, vertex_times)
+                if wcet is not None:
+                    finish(call_vertex, (wcet, {}))
+                    return
+
+                ilp = create_ilp_for_ipg(subprogram.ipg, subprogram.lnt, subprogram_data, vertex_times)
+                future = executor.submit(solve_ilp,
+                                         ilp.matrix().detach(),
+                                         '{}.ipg.ilp'.format(subprogram.ipg.name),
+                                         backend)
+                futures[future] = call_vertex
+            else:
+                wcets[call_vertex.name] = 0
+                release(call_vertex)
+
+        for call_vertex in dfs.post_order():
+            if waiting[call_vertex] == 0:
+                schedule(call_vertex)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(futures.pop(future), future.result())
+
+    return wcets[root_vertex.name]
+
+
 def calculate_coverage_and_instrumentation_stats(program: programs.Program, wcet_data: Dict):
     instrumentation_points = 0
     total_transitions = 0
@@ -797,13 +1011,12 @@ def calculate_coverage_and_instrumentation_stats(program: programs.Program, wcet
     return coverage, instrumentation_points
 
 
-def hybrid_analysis(program: programs.Program,
-                    root_vertex: vertices.SubprogramVertex,
-                    dfs: graphs.DepthFirstSearch,
-                    traces_filename: str,
-                    policy: InstrumentationPolicy,
-                    total_budget: int,
-                    randomise: bool):
+def create_ipgs(program: programs.Program,
+                root_vertex: vertices.SubprogramVertex,
+                dfs: graphs.DepthFirstSearch,
+                policy: InstrumentationPolicy,
+                total_budget: int,
+                randomise: bool):
     verbose_message('Creating instrumented CFGs')
     instrumented_cfgs = {}
     if policy == InstrumentationPolicy.none:
@@ -812,9 +1025,6 @@ def hybrid_analysis(program: programs.Program,
     else:
         instrumentation_policy_pipeline(program, policy, instrumented_cfgs)
 
-    labels = {vertices.InstrumentationVertex.ghost_value()}
-    call_table = {}
-    wcet_data = {}
     verbose_message('Creating IPGs')
     for call_vertex in dfs.post_order():
         subprogram = program[call_vertex.name]
@@ -828,6 +1038,16 @@ def hybrid_analysis(program: programs.Program,
             subprogram.ipg = create_ipg(program, instrumented_cfg)
             determinise(subprogram.ipg)
             subprogram.lnt = create_lnt(subprogram.ipg)
+
+
+def create_measured_data(program: programs.Program,
+                         dfs: graphs.DepthFirstSearch) -> Tuple[Set[int], Dict[int, str], Dict[str, MeasuredData]]:
+    labels = {vertices.InstrumentationVertex.ghost_value()}
+    call_table = {}
+    wcet_data = {}
+    for call_vertex in dfs.post_order():
+        subprogram = program[call_vertex.name]
+        if subprogram.ipg:
             wcet_data[subprogram.name] = MeasuredData(subprogram)
             for vertex in subprogram.ipg:
                 if isinstance(vertex, vertices.InstrumentationVertex):
@@ -835,12 +1055,38 @@ def hybrid_analysis(program: programs.Program,
 
             assert isinstance(subprogram.ipg.entry, vertices.InstrumentationVertex)
             call_table[subprogram.ipg.entry.label] = subprogram.name
+    return labels, call_table, wcet_data
 
+
+def hybrid_analysis(program: programs.Program,
+                    root_vertex: vertices.SubprogramVertex,
+                    dfs: graphs.DepthFirstSearch,
+                    traces_filename: str,
+                    policy: InstrumentationPolicy,
+                    total_budget: int,
+                    randomise: bool,
+                    jobs: int = 1,
+                    store: cache.Cache = None):
+    # A randomised instrumentation differs from run to run, so there is nothing to reuse.
+    kind = 'ipg.{}.{}'.format(policy, total_budget)
+    if store and not randomise and all((call_vertex.name, kind) in store for call_vertex in dfs.post_order()):
+        verbose_message('Reusing cached IPGs')
+        for call_vertex in dfs.post_order():
+            subprogram = program[call_vertex.name]
+            subprogram.ipg, subprogram.lnt = store.get(call_vertex.name, kind, None)
+    else:
+        create_ipgs(program, root_vertex, dfs, policy, total_budget, randomise)
+        if store and not randomise:
+            for call_vertex in dfs.post_order():
+                subprogram = program[call_vertex.name]
+                store.put(call_vertex.name, kind, (subprogram.ipg, subprogram.lnt))
+
+    labels, call_table, wcet_data = create_measured_data(program, dfs)
     trace = filter_traces(labels, traces_filename)
     measured_times = parse_traces(program, root_vertex, call_table, trace, wcet_data)
     print('Dynamic WCET estimate: {}'.format(max(measured_times)))
 
-    wcet = do_hybrid_analysis_wcet_calculation(program, root_vertex, dfs, wcet_data)
+    wcet = do_hybrid_analysis_wcet_calculation(program, root_vertex, dfs, wcet_data, jobs, store)
     print('Hybrid WCET estimate: {}'.format(wcet))
 
     coverage, instrumentation_points = calculate_coverage_and_instrumentation_stats(program, wcet_data)
@@ -848,14 +1094,127 @@ def hybrid_analysis(program: programs.Program,
     print('{} instrumentation points'.format(instrumentation_points))
 
 
+class Configuration:
+    __slots__ = ['policy', 'budget']
+
+    def __init__(self, policy: InstrumentationPolicy, budget: int):
+        self.policy = policy
+        self.budget = budget
+
+    def __str__(self):
+        if self.policy == InstrumentationPolicy.none:
+            return 'budget={}'.format(self.budget)
+        return 'policy={}'.format(self.policy)
+
+
+def create_configuration_ipgs(program: programs.Program,
+                              root_vertex: vertices.SubprogramVertex,
+                              dfs: graphs.DepthFirstSearch,
+                              configuration: Configuration,
+                              randomise: bool) -> Dict[str, Tuple[graphs.InstrumentationPointGraph, graphs.LoopNest]]:
+    # Subprograms without instrumentation points keep whatever IPG they had, so clear those of the last configuration.
+    for subprogram in program:
+        subprogram.ipg = None
+        subprogram.lnt = None
+    create_ipgs(program, root_vertex, dfs, configuration.policy, configuration.budget, randomise)
+    return {subprogram.name: (subprogram.ipg, subprogram.lnt) for subprogram in program}
+
+
+def install_configuration_ipgs(program: programs.Program,
+                               ipgs: Dict[str, Tuple[graphs.InstrumentationPointGraph, graphs.LoopNest]]):
+    for name, (ipg, lnt) in ipgs.items():
+        program[name].ipg = ipg
+        program[name].lnt = lnt
+
+
+# The state of a worker process, set up once by initialise_worker.
+_worker = None
+
+
+def initialise_worker(program_filename: str, randomise: bool):
+    global _worker
+    the_program = programs.IO.read(program_filename)
+    root = the_program.call_graph.get_root()
+    dfs = the_program.call_graph.depth_first_search(root)
+    _worker = (the_program, root, dfs, cache.Cache(the_program), randomise)
+
+
+def create_configuration_ipgs_in_worker(configuration: Configuration) -> bytes:
+    the_program, root, dfs, store, randomise = _worker
+    ipgs = create_configuration_ipgs(the_program, root, dfs, configuration, randomise)
+    # The IPGs refer to the CFGs and subprograms of the program, which the parent holds already.
+    return store.dumps(ipgs)
+
+
+def sweep_analysis(program: programs.Program,
+                   root_vertex: vertices.SubprogramVertex,
+                   dfs: graphs.DepthFirstSearch,
+                   traces_filename: str,
+                   configurations: List[Configuration],
+                   randomise: bool,
+                   jobs: int = 1,
+                   store: cache.Cache = None):
+    """
+    Runs the hybrid analysis for several instrumentations of the program and tabulates the results.  The IPGs of the
+    configurations are built in a process pool when there is more than one job.  The trace file dominates the cost, so
+    it is read once: every chunk of events is filtered by the labels of each configuration in turn and fed to that
+    configuration's parser.
+    """
+    verbose_message('Creating IPGs for {} configurations'.format(len(configurations)))
+    if jobs > 1:
+        if store is None:
+            store = cache.Cache(program)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 mp_context=context,
+                                 initializer=initialise_worker,
+                                 initargs=(program.filename, randomise)) as executor:
+            all_ipgs = [store.loads(data) for data in executor.map(create_configuration_ipgs_in_worker,
+                                                                   configurations)]
+    else:
+        all_ipgs = [create_configuration_ipgs(program, root_vertex, dfs, configuration, randomise)
+                    for configuration in configurations]
+
+    parsers = []
+    selections = []
+    all_wcet_data = []
+    for ipgs in all_ipgs:
+        install_configuration_ipgs(program, ipgs)
+        labels, call_table, wcet_data = create_measured_data(program, dfs)
+        parsers.append(TraceParser(program, root_vertex, call_table, wcet_data))
+        selections.append(numpy.fromiter(labels, dtype=numpy.int64))
+        all_wcet_data.append(wcet_data)
+
+    verbose_message('Parsing traces')
+    for events in traces.stream(traces_filename, numpy.unique(numpy.concatenate(selections))):
+        for parser, selection in zip(parsers, selections):
+            parser.feed(events[numpy.isin(events[:, 0], selection)].tolist())
+
+    print('{:<24}{:>12}{:>12}{:>10}{:>8}'.format('Configuration', 'Dynamic', 'Hybrid', 'Coverage', 'Points'))
+    for configuration, ipgs, parser, wcet_data in zip(configurations, all_ipgs, parsers, all_wcet_data):
+        install_configuration_ipgs(program, ipgs)
+        wcet = do_hybrid_analysis_wcet_calculation(program, root_vertex, dfs, wcet_data, store=store)
+        coverage, instrumentation_points = calculate_coverage_and_instrumentation_stats(program, wcet_data)
+        print('{:<24}{:>12}{:>12}{:>9}%{:>8}'.format(str(configuration),
+                                                     max(parser.measured_times),
+                                                     wcet,
+                                                     coverage,
+                                                     instrumentation_points))
+
+
 def main(args: Namespace):
+    solvers.set_default(args.solver)
     program = programs.IO.read(args.program)
+    with cache.Cache(program) as store:
+        analyse(args, program, store)
+
+
+def analyse(args: Namespace, program: programs.Program, store: cache.Cache):
     program.call_graph.dotify()
     root = program.call_graph.get_root()
 
     calls = 0
     for subprogram in program:
-        graph_based_calculations.identify_loops(subprogram.cfg)
         for vertex in subprogram.cfg:
             if program.call_graph.is_call_site(subprogram.call_vertex, vertex):
                 calls += 1
@@ -863,30 +1222,40 @@ def main(args: Namespace):
     print('#Subprograms: {}'.format(len(program)))
     print('#Calls: {}'.format(calls))
 
-    if args.budget:
-        if args.budget < 2:
-            error_message('The minimum number of allowed instrumentation points is 2.')
+    for budget in [args.budget] + args.budgets:
+        if budget:
+            if budget < 2:
+                error_message('The minimum number of allowed instrumentation points is 2.')
 
-        max_budget = sum([subprogram.cfg.number_of_vertices() for subprogram in program])
-        if args.budget > max_budget:
-            error_message('The maximum number of allowed instrumentation points is {}.'.format(max_budget))
+            max_budget = sum([subprogram.cfg.number_of_vertices() for subprogram in program])
+            if budget > max_budget:
+                error_message('The maximum number of allowed instrumentation points is {}.'.format(max_budget))
 
-    with open(args.traces, 'r') as traces_file:
-        line = traces_file.readline()
-        line = line.strip()
-        if line != program.magic:
-            error_message('Traces are not generated by the given program.')
+    if traces.read_magic(args.traces) != program.magic:
+        error_message('Traces are not generated by the given program.')
 
     verbose_message('Root is {}'.format(root.name))
-    dfs = graphs.DepthFirstSearch(program.call_graph, root)
-    static_analysis(program, root, dfs)
-    hybrid_analysis(program, root, dfs, args.traces, args.policy, args.budget, args.randomise)
+    dfs = program.call_graph.depth_first_search(root)
+    static_analysis(program, root, dfs, store)
+    if args.policies or args.budgets:
+        configurations = [Configuration(policy, 0) for policy in args.policies]
+        configurations += [Configuration(InstrumentationPolicy.none, budget) for budget in args.budgets]
+        sweep_analysis(program, root, dfs, args.traces, configurations, args.randomise, args.jobs, store)
+    else:
+        hybrid_analysis(program, root, dfs, args.traces, args.policy, args.budget, args.randomise, args.jobs, store)
 
 
 def check_arguments(args: Namespace):
-    if not args.budget and args.policy == InstrumentationPolicy.none:
+    if args.policies or args.budgets:
+        if InstrumentationPolicy.none in args.policies:
+            error_message('Compare instrumentation budgets with --budgets rather than the {} policy.'.format(
+                InstrumentationPolicy.none))
+    elif not args.budget and args.policy == InstrumentationPolicy.none:
         error_message('Either choose an instrumentation budget or policy.')
 
+    if args.jobs < 1:
+        error_message('The number of jobs must be at least 1.')
+
 
 def parse_the_command_line():
     parser = ArgumentParser(description='Perform both static and hybrid WCET analysis')
@@ -910,11 +1279,36 @@ def parse_the_command_line():
                         type=int,
                         default=0)
 
+    parser.add_argument('--policies',
+                        help='compare these instrumentation policies, reading the traces once for all of them',
+                        type=InstrumentationPolicy,
+                        choices=list(InstrumentationPolicy),
+                        nargs='+',
+                        default=[])
+
+    parser.add_argument('--budgets',
+                        help='compare these instrumentation budgets, reading the traces once for all of them',
+                        type=int,
+                        nargs='+',
+                        default=[])
+
     parser.add_argument('--randomise',
                         action='store_true',
                         help='where a choice exists, pick randomly',
                         default=False)
 
+    parser.add_argument('--solver',
+                        help='choose the backend that solves integer linear programs',
+                        type=solvers.Backend,
+                        choices=list(solvers.Backend),
+                        default=solvers.Backend.lp_solve.name)
+
+    parser.add_argument('--jobs',
+                        help='solve the integer linear programs of independent subprograms, or build the IPGs of '
+                             'the configurations compared, in this many processes',
+                        type=int,
+                        default=1)
+
     return parser.parse_args()
 
 